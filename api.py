@@ -0,0 +1,187 @@
+"""API JSON versionada (``/api/v1``) para integraciones, junto a las rutas HTML.
+
+- Serializa con orjson (en requirements.txt; si falta, con ``json`` de la biblioteca estándar).
+- ``fields=id,age,ap_hi`` limita las columnas devueltas; en el streaming se
+  seleccionan en SQL, así que tampoco se leen de la base.
+- ``/api/v1/records/stream`` recorre la tabla (o una cohorte) con cursor de servidor
+  y emite NDJSON por bloques, con memoria constante.
+- ``CompressionMiddleware`` comprime las respuestas de la API con brotli (en
+  requirements.txt; se usa si el cliente lo acepta) o gzip, también las respuestas
+  en streaming.
+"""
+import json
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from sqlmodel import select
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+
+from connection_db import get_read_session
+from database_model import CardioHealth, CardioHealthResponse, CohortFilter
+from db_operations import BATCH_CHUNK_SIZE, CardioHealthOperations
+from instrumentation import span
+from recommendations import recommendation_system
+
+try:
+    import orjson
+except ImportError:  # fallback si no se instaló requirements.txt: se usa json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # fallback si no se instaló requirements.txt: solo gzip
+    brotli = None
+
+API_PREFIX = "/api/v1"
+
+# Campos de un registro en la API: el id más los de CardioHealthResponse
+RECORD_FIELDS = ["id"] + list(CardioHealthResponse.model_fields)
+# Partes de la respuesta de riesgo que se pueden pedir con ``fields``
+RISK_FIELDS = ["risk_data", "key_factors", "health_metrics", "recommendations"]
+
+# Compresión: nivel medio, el 9 de gzip cuesta mucha CPU por poco tamaño
+API_COMPRESSION_MIN_SIZE = 500
+API_GZIP_LEVEL = 6
+API_BROTLI_QUALITY = 4
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """JSONResponse sin validación de modelos, serializada con orjson si está disponible"""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(fields: Optional[str], allowed: List[str]) -> List[str]:
+    """Lista de ``fields=a,b,c`` validada y en el orden pedido (todos si no se indica)"""
+    if not fields:
+        return list(allowed)
+    selected = [name.strip() for name in fields.split(",") if name.strip()]
+    invalid = [name for name in selected if name not in allowed]
+    if invalid or not selected:
+        raise HTTPException(status_code=422, detail=f"Campos no válidos: {invalid}. Disponibles: {allowed}")
+    return list(dict.fromkeys(selected))
+
+
+def project(record: CardioHealth, fields: List[str]) -> Dict:
+    return {name: getattr(record, name) for name in fields}
+
+
+router = APIRouter(prefix=API_PREFIX, default_response_class=FastJSONResponse)
+
+
+@router.get("/records")
+async def list_records(
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    order: str = "asc",
+    per_page: int = Query(100, ge=1, le=500),
+    fields: Optional[str] = None,
+    cohort: CohortFilter = Depends()
+):
+    """Página de registros con paginación por cursor (la misma que /records)"""
+    selected = parse_fields(fields, RECORD_FIELDS)
+    async with get_read_session() as session:
+        result = await CardioHealthOperations.get_all_records(
+            session, cursor=cursor, per_page=per_page, sort=sort, order=order,
+            conditions=CardioHealthOperations.cohort_conditions(cohort))
+    with span("api.serialize"):
+        return FastJSONResponse({
+            "data": [project(record, selected) for record in result["data"]],
+            "per_page": result["per_page"],
+            "next_cursor": result["next_cursor"],
+            "prev_cursor": result["prev_cursor"],
+            "sort": result["sort"],
+            "order": result["order"]
+        })
+
+
+async def _ndjson_records(query, fields: List[str], chunk_size: int = BATCH_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    async with get_read_session() as session:
+        result = await session.stream(query.execution_options(yield_per=chunk_size))
+        async for partition in result.partitions(chunk_size):
+            with span("api.serialize"):
+                yield b"".join(dumps(dict(zip(fields, row))) + b"\n" for row in partition)
+
+
+@router.get("/records/stream")
+async def stream_records(fields: Optional[str] = None, cohort: CohortFilter = Depends()):
+    """Todos los registros (o una cohorte) en NDJSON, por bloques y ordenados por id"""
+    selected = parse_fields(fields, RECORD_FIELDS)
+    query = select(*[getattr(CardioHealth, name) for name in selected]).order_by(CardioHealth.id)
+    conditions = CardioHealthOperations.cohort_conditions(cohort)
+    if conditions:
+        query = query.where(*conditions)
+    return StreamingResponse(_ndjson_records(query, selected), media_type="application/x-ndjson")
+
+
+@router.get("/records/{record_id}")
+async def read_record(record_id: int, fields: Optional[str] = None):
+    selected = parse_fields(fields, RECORD_FIELDS)
+    async with get_read_session() as session:
+        record = await CardioHealthOperations.get_record_by_id(session, record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Registro no encontrado")
+    return FastJSONResponse(project(record, selected))
+
+
+@router.get("/records/{record_id}/risk")
+async def record_risk(record_id: int, fields: Optional[str] = None):
+    """Riesgo, factores clave, métricas y recomendaciones del modelo servido"""
+    selected = parse_fields(fields, RISK_FIELDS)
+    async with get_read_session() as session:
+        record = await CardioHealthOperations.get_record_by_id(session, record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Registro no encontrado")
+    await CardioHealthOperations.ensure_model()
+    result = await recommendation_system.recommend(record)
+    return FastJSONResponse({
+        "id": record_id,
+        "model_version": recommendation_system.current_version(),
+        **{name: result[name] for name in selected}
+    })
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = API_BROTLI_QUALITY):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        # flush en cada bloque para que el cliente pueda ir leyendo el stream
+        return data + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+class CompressionMiddleware:
+    """Comprime las respuestas bajo ``prefix`` (brotli o gzip según Accept-Encoding)"""
+
+    def __init__(self, app, prefix: str = API_PREFIX, minimum_size: int = API_COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.prefix = prefix
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        accepted = Headers(scope=scope).get("accept-encoding", "")
+        if brotli is not None and "br" in accepted:
+            responder = BrotliResponder(self.app, self.minimum_size)
+        elif "gzip" in accepted:
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=API_GZIP_LEVEL)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
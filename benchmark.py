@@ -0,0 +1,282 @@
+"""Pruebas de carga y latencia de los endpoints principales.
+
+Siembra una base local (SQLite por defecto, o cualquier URL compatible) con datos
+sintéticos de CardioHealth a varios tamaños y lanza clientes concurrentes contra la
+aplicación en el mismo proceso mediante un transporte ASGI. Para cada tamaño mide el
+tiempo de siembra, el entrenamiento del modelo (tiempo y memoria) y, por endpoint, el
+throughput y las latencias p50/p95/p99. El resultado se guarda en JSON junto con el
+commit para comparar ejecuciones.
+
+Uso por línea de comandos:
+
+    python benchmark.py --sizes 10000,100000,1000000 --requests 500 --concurrency 16
+
+ATENCIÓN: las tablas de la base indicada con --database-url se vacían.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_SIZES = [10_000, 100_000, 1_000_000]
+BENCHMARK_REQUESTS = 500
+BENCHMARK_CONCURRENCY = 16
+# Filas por bloque al sembrar la base
+SEED_CHUNK_SIZE = 10_000
+# Peticiones de calentamiento por endpoint, excluidas de las medidas
+WARMUP_REQUESTS = 10
+
+
+def synthetic_chunk(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    """Bloque de pacientes sintéticos en unidades de almacenamiento (días, cm)"""
+    age = rng.integers(30, 65, n) * 365 + rng.integers(0, 365, n)
+    ap_hi = rng.normal(128, 17, n).clip(90, 200).round()
+    ap_lo = np.minimum(rng.normal(82, 10, n).clip(60, 120).round(), ap_hi - 10)
+    cholesterol = rng.choice([1, 2, 3], n, p=[0.75, 0.14, 0.11])
+    weight = rng.normal(74, 14, n).clip(40, 180).round(1)
+    # Probabilidad de enfermedad creciente con edad, presión y colesterol
+    logit = 0.0002 * (age - 19000) + 0.04 * (ap_hi - 128) + 0.5 * (cholesterol - 1)
+    return pd.DataFrame({
+        "age": age,
+        "gender": rng.integers(0, 2, n),
+        "height": rng.normal(165, 8, n).clip(140, 200).round(),
+        "weight": weight,
+        "ap_hi": ap_hi.astype(np.int64),
+        "ap_lo": ap_lo.astype(np.int64),
+        "cholesterol": cholesterol,
+        "gluc": rng.choice([1, 2, 3], n, p=[0.85, 0.07, 0.08]),
+        "smoke": (rng.random(n) < 0.09).astype(np.int64),
+        "alco": (rng.random(n) < 0.05).astype(np.int64),
+        "active": (rng.random(n) < 0.8).astype(np.int64),
+        "cardio": (rng.random(n) < 1 / (1 + np.exp(-logit))).astype(np.int64)
+    })
+
+
+def latency_summary(latencies: List[float], seconds: float, errors: int) -> Dict:
+    values = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(latencies) / seconds, 1) if seconds > 0 else None,
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3)
+    }
+
+
+async def reset_database(n_rows: int, seed: int) -> float:
+    """Recrea las tablas y las llena con ``n_rows`` filas sintéticas; devuelve los segundos"""
+    from sqlmodel import SQLModel
+
+    import connection_db
+    from bulk_import import write_chunk
+    from db_operations import record_counter
+    from population_stats import rebuild_summary
+
+    connection_db.configure_engines()
+    async with connection_db.engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+    await connection_db.init_db()
+
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+    for start in range(0, n_rows, SEED_CHUNK_SIZE):
+        await write_chunk(synthetic_chunk(rng, min(SEED_CHUNK_SIZE, n_rows - start)))
+    record_counter.value = None
+    await rebuild_summary()
+    return time.perf_counter() - started
+
+
+async def benchmark_training() -> Dict:
+    """Lectura del snapshot y entrenamiento completo en este proceso, con su memoria"""
+    from db_operations import CardioHealthOperations
+    from recommendations import recommendation_system
+    from training import training_scheduler
+
+    started = time.perf_counter()
+    snapshot = await CardioHealthOperations.load_training_snapshot()
+    load_seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await recommendation_system.train_model(snapshot.features, snapshot.target)
+    train_seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    training_scheduler.snapshot = snapshot
+
+    artifact = recommendation_system.store._artifact_path(recommendation_system.model_version)
+    return {
+        "rows": len(snapshot),
+        "snapshot_load_seconds": round(load_seconds, 3),
+        "train_seconds": round(train_seconds, 3),
+        "train_peak_traced_mb": round(peak / 2 ** 20, 1),
+        "artifact_mb": round(artifact.stat().st_size / 2 ** 20, 1) if artifact.exists() else None,
+        "process_max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def endpoint_scenarios(n_rows: int, rng: random.Random) -> Dict[str, Callable]:
+    """Cada escenario recibe el cliente y devuelve la respuesta de una petición"""
+    def random_id() -> int:
+        return rng.randint(1, n_rows)
+
+    def form() -> Dict:
+        return {
+            "age": rng.randint(30, 64), "gender": rng.randint(0, 1),
+            "height": round(rng.uniform(1.5, 1.9), 2), "weight": round(rng.uniform(50, 110), 1),
+            "ap_hi": rng.randint(100, 170), "ap_lo": rng.randint(60, 95),
+            "cholesterol": rng.randint(1, 3), "gluc": rng.randint(1, 3)
+        }
+
+    return {
+        "GET /records": lambda c: c.get("/records"),
+        "GET /records/{id}": lambda c: c.get(f"/records/{random_id()}"),
+        "POST /records/": lambda c: c.post("/records/", data=form()),
+        "PUT /records/{id}": lambda c: c.put(f"/records/{random_id()}", json={"ap_hi": rng.randint(100, 170)}),
+        "GET /records/{id}/recommendations": lambda c: c.get(f"/records/{random_id()}/recommendations")
+    }
+
+
+async def run_scenario(client, request: Callable, total: int, concurrency: int) -> Dict:
+    """``concurrency`` clientes lanzan peticiones hasta completar ``total``"""
+    for _ in range(WARMUP_REQUESTS):
+        await request(client)
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await request(client)
+            latencies.append(time.perf_counter() - started)
+            # El alta responde con una redirección 303 a /success
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latency_summary(latencies, time.perf_counter() - started, errors)
+
+
+async def benchmark_size(n_rows: int, requests: int, concurrency: int, seed: int) -> Dict:
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("El benchmark requiere httpx (pip install httpx)")
+    from main import app
+
+    print(f"[{n_rows} filas] sembrando...", flush=True)
+    seed_seconds = await reset_database(n_rows, seed)
+    print(f"[{n_rows} filas] entrenando...", flush=True)
+    training = await benchmark_training()
+
+    endpoints = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for name, request in endpoint_scenarios(n_rows, random.Random(seed)).items():
+            print(f"[{n_rows} filas] {name}", flush=True)
+            endpoints[name] = await run_scenario(client, request, requests, concurrency)
+
+    return {
+        "rows": n_rows,
+        "seed_seconds": round(seed_seconds, 3),
+        "seed_rows_per_second": round(n_rows / seed_seconds, 1) if seed_seconds > 0 else None,
+        "training": training,
+        "endpoints": endpoints
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(database_url: Optional[str], workdir: str) -> Tuple[str, str]:
+    """Base de datos y directorio de modelos aislados; debe ejecutarse antes de importar la app"""
+    url = database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    model_dir = os.path.join(workdir, "models")
+    os.environ["DATABASE_PRIMARY_URL"] = url
+    os.environ["MODEL_DIR"] = model_dir
+    # Sin réplica: todas las lecturas contra la base sembrada
+    os.environ.pop("DATABASE_READ_URL", None)
+    return url, model_dir
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga de la API CardioHealth")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in BENCHMARK_SIZES),
+                        help="Tamaños de la tabla separados por comas")
+    parser.add_argument("--requests", type=int, default=BENCHMARK_REQUESTS, help="Peticiones por endpoint")
+    parser.add_argument("--concurrency", type=int, default=BENCHMARK_CONCURRENCY)
+    parser.add_argument("--database-url", default=None,
+                        help="URL async de la base (se vacía); por defecto SQLite temporal")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Fichero JSON (por defecto benchmark-<commit>.json)")
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    commit = git_commit()
+    output = os.path.abspath(args.output or f"benchmark-{(commit or 'local')[:8]}.json")
+    # main.py monta static/ y templates/ con rutas relativas
+    os.chdir(Path(__file__).parent)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        url, _ = configure_environment(args.database_url, workdir)
+
+        async def run():
+            from training import training_scheduler
+            try:
+                return [await benchmark_size(n, args.requests, args.concurrency, args.seed) for n in sizes]
+            finally:
+                training_scheduler.shutdown()
+
+        results = asyncio.run(run())
+
+    report = {
+        "commit": commit,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "database": url.split("://", 1)[0],
+        "requests_per_endpoint": args.requests,
+        "concurrency": args.concurrency,
+        "results": results
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for result in results:
+        print(f"\n{result['rows']} filas  (entrenamiento {result['training']['train_seconds']} s, "
+              f"pico {result['training']['train_peak_traced_mb']} MB)")
+        for name, stats in result["endpoints"].items():
+            print(f"  {name:<36} {stats['throughput_rps']:>8} req/s  p50 {stats['p50_ms']:>8} ms  "
+                  f"p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms  errores {stats['errors']}")
+    print(f"\nResultados en {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Exportación en streaming de la tabla cardiohealth (CSV, NDJSON o Parquet).
+
+Las filas se leen con cursor de servidor por bloques y cada bloque se escribe en
+cuanto se lee, así que la memoria no depende del tamaño de la tabla.
+
+Uso por línea de comandos:
+
+    python bulk_export.py registros.parquet --with-risk
+"""
+import argparse
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlmodel import select
+
+from connection_db import get_read_session
+from database_model import CardioHealth, CohortFilter
+from db_operations import CardioHealthOperations
+from recommendations import recommendation_system
+from training import training_scheduler
+
+EXPORT_COLUMNS = [
+    'id', 'age', 'gender', 'height', 'weight', 'ap_hi', 'ap_lo',
+    'cholesterol', 'gluc', 'smoke', 'alco', 'active', 'cardio'
+]
+FLOAT_COLUMNS = ['height', 'weight']
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+# Filas por bloque leído y escrito
+EXPORT_CHUNK_SIZE = 10000
+
+
+async def export_chunks(cohort: Optional[CohortFilter] = None, with_risk: bool = False,
+                        chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[pd.DataFrame]:
+    """Recorre la tabla (o una cohorte) por bloques, opcionalmente con la probabilidad de riesgo"""
+    query = select(*[getattr(CardioHealth, name) for name in EXPORT_COLUMNS]).order_by(CardioHealth.id)
+    if cohort is not None:
+        query = query.where(*CardioHealthOperations.cohort_conditions(cohort))
+
+    async with get_read_session() as session:
+        async for block in CardioHealthOperations.stream_column_chunks(session, query, chunk_size):
+            chunk = pd.DataFrame(block, columns=EXPORT_COLUMNS)
+            chunk = chunk.astype({name: np.int64 for name in EXPORT_COLUMNS if name not in FLOAT_COLUMNS})
+            if with_risk:
+                # Servicio de puntuación si está configurado (sin modelo local), si no el modelo del proceso
+                scores = await recommendation_system.score_batch_async(block[:, 1:-1])
+                chunk["risk_probability"] = scores["probability"].round(4)
+                chunk["risk_level"] = scores["risk_level"]
+            yield chunk
+
+
+class _StreamSink:
+    """Destino de escritura para pyarrow que acumula bytes para ir vaciándolos"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def check_format(fmt: str):
+    """Valida el formato antes de empezar a responder (ValueError si no se puede exportar)"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("La exportación Parquet requiere pyarrow (pip install pyarrow)")
+
+
+async def export_stream(fmt: str = "csv", cohort: Optional[CohortFilter] = None, with_risk: bool = False,
+                        chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Codifica cada bloque en el formato pedido y lo entrega en cuanto está listo"""
+    check_format(fmt)
+
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        sink = _StreamSink()
+        writer = None
+        async for chunk in export_chunks(cohort, with_risk, chunk_size):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema)
+            # Un row group por bloque
+            writer.write_table(table)
+            yield sink.drain()
+        if writer is not None:
+            writer.close()
+            yield sink.drain()
+        return
+
+    header = True
+    async for chunk in export_chunks(cohort, with_risk, chunk_size):
+        if fmt == "csv":
+            yield chunk.to_csv(index=False, header=header).encode()
+            header = False
+        else:
+            yield chunk.to_json(orient="records", lines=True, force_ascii=False).encode()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Exportación masiva de registros CardioHealth")
+    parser.add_argument("path", help="Fichero de salida (.csv, .ndjson o .parquet)")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default=None,
+                        help="Por defecto se deduce de la extensión")
+    parser.add_argument("--with-risk", action="store_true", help="Añadir probabilidad y nivel de riesgo")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    fmt = args.format or args.path.rsplit(".", 1)[-1]
+
+    async def run():
+        if args.with_risk:
+            recommendation_system.load_from_store()
+            await CardioHealthOperations.ensure_model()
+        with open(args.path, "wb") as f:
+            async for data in export_stream(fmt, with_risk=args.with_risk, chunk_size=args.chunk_size):
+                f.write(data)
+        training_scheduler.shutdown()
+
+    asyncio.run(run())
+    print(f"Exportado a {args.path}")
+
+
+if __name__ == "__main__":
+    main()
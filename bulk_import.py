@@ -0,0 +1,207 @@
+"""Importación masiva de registros CardioHealth desde CSV o Parquet.
+
+Uso por línea de comandos (p. ej. con el dataset público cardio_train.csv):
+
+    python bulk_import.py cardio_train.csv --sep ";" --gender-coding 12
+"""
+import argparse
+import asyncio
+import time
+from typing import IO, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert, select, text
+
+from connection_db import get_session, init_db
+from database_model import CardioHealth
+from page_cache import page_cache
+from population_stats import apply_deltas, summary_deltas
+
+IMPORT_COLUMNS = [
+    'age', 'gender', 'height', 'weight', 'ap_hi', 'ap_lo',
+    'cholesterol', 'gluc', 'smoke', 'alco', 'active', 'cardio'
+]
+INTEGER_COLUMNS = [name for name in IMPORT_COLUMNS if CardioHealth.model_fields[name].annotation is int]
+
+# Filas por bloque leído, validado e insertado en una transacción
+IMPORT_CHUNK_SIZE = 10000
+# Máximo de filas rechazadas que se detallan en el informe
+MAX_REJECTED_SAMPLES = 100
+
+# La tabla guarda la edad en días y la altura en cm, pero los límites de los campos
+# están en años y metros: se escalan al comparar
+STORAGE_SCALE = {"age": 365, "height": 100}
+
+
+def _field_bounds() -> Dict[str, Tuple[float, float]]:
+    """Límites ge/le declarados en CardioHealth, en unidades de almacenamiento"""
+    bounds = {}
+    for name in IMPORT_COLUMNS:
+        low, high = -np.inf, np.inf
+        for constraint in CardioHealth.model_fields[name].metadata:
+            if hasattr(constraint, "ge"):
+                low = constraint.ge
+            if hasattr(constraint, "le"):
+                high = constraint.le
+        scale = STORAGE_SCALE.get(name, 1)
+        bounds[name] = (low * scale, high * scale)
+    return bounds
+
+
+FIELD_BOUNDS = _field_bounds()
+
+
+def read_chunks(source: Union[str, IO], fmt: str = "csv", chunk_size: int = IMPORT_CHUNK_SIZE,
+                sep: str = ",") -> Iterator[pd.DataFrame]:
+    """Lee el fichero por bloques sin cargarlo entero en memoria"""
+    if fmt == "csv":
+        yield from pd.read_csv(source, sep=sep, chunksize=chunk_size)
+    elif fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("La importación Parquet requiere pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Formato no soportado: {fmt}")
+
+
+def validate_chunk(chunk: pd.DataFrame, first_row: int, age_unit: str = "days",
+                   height_unit: str = "cm", gender_coding: str = "01") -> Tuple[pd.DataFrame, int, List[Dict]]:
+    """Normaliza unidades y valida un bloque de forma vectorizada.
+
+    Devuelve las filas válidas (en unidades de almacenamiento: días, cm, género 0/1),
+    el número de filas rechazadas y una muestra de rechazos con las columnas culpables.
+    """
+    missing = [name for name in IMPORT_COLUMNS if name not in chunk.columns]
+    if missing:
+        raise ValueError(f"Faltan columnas en el fichero: {missing}")
+
+    data = chunk[IMPORT_COLUMNS].apply(pd.to_numeric, errors="coerce").astype(np.float64)
+    if age_unit == "years":
+        data["age"] *= 365
+    if height_unit == "m":
+        data["height"] *= 100
+    if gender_coding == "12":
+        # Dataset público: 1 = mujer, 2 = hombre
+        data["gender"] -= 1
+
+    values = data.to_numpy()
+    errors = np.isnan(values)
+    for i, name in enumerate(IMPORT_COLUMNS):
+        low, high = FIELD_BOUNDS[name]
+        errors[:, i] |= (values[:, i] < low) | (values[:, i] > high)
+        if name in INTEGER_COLUMNS:
+            errors[:, i] |= values[:, i] % 1 != 0
+
+    rejected_mask = errors.any(axis=1)
+    samples = [
+        {"row": first_row + int(i), "errors": [IMPORT_COLUMNS[j] for j in np.flatnonzero(errors[i])]}
+        for i in np.flatnonzero(rejected_mask)[:MAX_REJECTED_SAMPLES]
+    ]
+
+    valid = data[~rejected_mask].astype({name: np.int64 for name in INTEGER_COLUMNS})
+    return valid, int(rejected_mask.sum()), samples
+
+
+async def write_chunk(valid: pd.DataFrame) -> int:
+    """Inserta un bloque en una sola transacción (COPY en asyncpg, INSERT multi-fila en el resto)"""
+    if valid.empty:
+        return 0
+    rows = valid.to_dict("records")
+
+    async with get_session() as session:
+        connection = await session.connection()
+        if connection.dialect.name == "postgresql" and connection.dialect.driver == "asyncpg":
+            # La columna id no tiene DEFAULT en el servidor: se reservan los ids de la secuencia.
+            # Se piden a través de SQLAlchemy para que abra la transacción: el adaptador de
+            # asyncpg la inicia con la primera sentencia, y sin ella el COPY en la conexión
+            # del driver se confirmaría solo, separado de los contadores de población
+            ids = (await session.execute(
+                text("SELECT nextval('cardiohealth_id_seq') FROM generate_series(1, :n)"),
+                {"n": len(rows)})).scalars().all()
+            raw = (await connection.get_raw_connection()).driver_connection
+            records = [
+                (record_id, *[row[name] for name in IMPORT_COLUMNS])
+                for record_id, row in zip(ids, rows)
+            ]
+            await raw.copy_records_to_table(
+                CardioHealth.__tablename__, records=records, columns=["id"] + IMPORT_COLUMNS)
+            max_id = max(record[0] for record in records)
+        else:
+            # executemany: SQLAlchemy lo agrupa en INSERT ... VALUES de muchas filas
+            await session.execute(insert(CardioHealth.__table__), rows)
+            max_id = (await session.execute(select(func.max(CardioHealth.id)))).scalar_one()
+        await apply_deltas(session, summary_deltas(rows))
+        await session.commit()
+    # Como en add_record: el ETag de los listados cambia sin esperar a la sincronización
+    page_cache.record_added(max_id)
+    return len(rows)
+
+
+async def import_records(source: Union[str, IO], fmt: str = "csv", chunk_size: int = IMPORT_CHUNK_SIZE,
+                         sep: str = ",", age_unit: str = "days", height_unit: str = "cm",
+                         gender_coding: str = "01") -> Dict:
+    """Importa un fichero completo por bloques e informa de filas/seg y rechazos"""
+    from db_operations import record_counter
+
+    loop = asyncio.get_running_loop()
+    chunks = read_chunks(source, fmt, chunk_size, sep)
+    started = time.perf_counter()
+    read = inserted = rejected = 0
+    samples: List[Dict] = []
+
+    while True:
+        # Lectura y validación fuera del event loop
+        chunk = await loop.run_in_executor(None, next, chunks, None)
+        if chunk is None:
+            break
+        valid, n_rejected, chunk_samples = await loop.run_in_executor(
+            None, validate_chunk, chunk, read + 1, age_unit, height_unit, gender_coding)
+        inserted += await write_chunk(valid)
+        record_counter.increment(len(valid))
+        read += len(chunk)
+        rejected += n_rejected
+        samples.extend(chunk_samples[:MAX_REJECTED_SAMPLES - len(samples)])
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows_read": read,
+        "rows_inserted": inserted,
+        "rows_rejected": rejected,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(inserted / seconds, 1) if seconds > 0 else None,
+        "rejected_samples": samples
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Importación masiva de registros CardioHealth")
+    parser.add_argument("path", help="Fichero CSV o Parquet")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None,
+                        help="Por defecto se deduce de la extensión")
+    parser.add_argument("--sep", default=",", help="Separador CSV (el dataset público usa ';')")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument("--age-unit", choices=["days", "years"], default="days")
+    parser.add_argument("--height-unit", choices=["cm", "m"], default="cm")
+    parser.add_argument("--gender-coding", choices=["01", "12"], default="01",
+                        help="01: 0 mujer/1 hombre; 12: 1 mujer/2 hombre (dataset público)")
+    args = parser.parse_args(argv)
+    fmt = args.format or ("parquet" if args.path.endswith(".parquet") else "csv")
+
+    async def run():
+        await init_db()
+        return await import_records(args.path, fmt, args.chunk_size, args.sep,
+                                    args.age_unit, args.height_unit, args.gender_coding)
+
+    report = asyncio.run(run())
+    print(f"Leídas: {report['rows_read']}  Insertadas: {report['rows_inserted']}  "
+          f"Rechazadas: {report['rows_rejected']}  ({report['rows_per_second']} filas/s)")
+    for sample in report["rejected_samples"][:10]:
+        print(f"  fila {sample['row']}: {', '.join(sample['errors'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 import os
+import time
+from collections import deque
 from contextlib import asynccontextmanager
+from typing import Dict, Optional
 from dotenv import load_dotenv
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
@@ -11,7 +15,11 @@ from pathlib import Path
 env_path = Path(__file__).parent.parent /"ProyectoAlgoritmosFinal"/ ".env"
 load_dotenv(env_path)
 
-# Verificar variables críticas antes de continuar
+# URL completa de la base principal (p. ej. una base local para pruebas de carga);
+# si se indica, no hacen falta las variables de Clever Cloud
+PRIMARY_URL = os.getenv("DATABASE_PRIMARY_URL")
+
+# Variables críticas; se verifican al crear el motor, no al importar el módulo
 required_vars = [
     'POSTGRESQL_ADDON_USER',
     'POSTGRESQL_ADDON_PASSWORD',
@@ -20,10 +28,6 @@ required_vars = [
     'POSTGRESQL_ADDON_DB'
 ]
 
-missing_vars = [var for var in required_vars if not os.getenv(var)]
-if missing_vars:
-    raise ValueError(f"Faltan variables de entorno críticas: {missing_vars}")
-
 # Configuración de la conexión
 CLEVER_DB = (
     f"postgresql+asyncpg://{os.getenv('POSTGRESQL_ADDON_USER')}:"
@@ -36,27 +40,177 @@ CLEVER_DB = (
 # SQLite como fallback (opcional)
 DATABASE_URL = "sqlite+aiosqlite:///petsdb.db"
 
-# Motor de base de datos principal
-try:
-    engine: AsyncEngine = create_async_engine(CLEVER_DB, echo=True)
-    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
-except Exception as e:
-    print(f"Error al conectar a PostgreSQL: {e}")
-    # Fallback a SQLite si hay error
-    engine = create_async_engine(DATABASE_URL, echo=True)
+# Réplica de solo lectura (opcional) para listados, detalle y lecturas de entrenamiento
+READ_REPLICA_URL = os.getenv("DATABASE_READ_URL")
+
+# Configuración del pool de conexiones
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Clever Cloud cierra conexiones inactivas: reciclarlas antes y comprobarlas al sacarlas del pool
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Cambiar a SQLite si PostgreSQL no responde al arrancar
+DB_SQLITE_FALLBACK = os.getenv("DB_SQLITE_FALLBACK", "true").lower() == "true"
+
+
+class PoolMetrics:
+    """Tiempos de espera al obtener conexión (pool + conexión nueva si hace falta)"""
+
+    def __init__(self, window: int = 1000):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.checkouts += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        self._recent.append(seconds)
+
+    def stats(self) -> Dict:
+        recent = sorted(self._recent)
+        return {
+            "checkouts": self.checkouts,
+            "wait_mean_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else None,
+            "wait_p99_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.99))] * 1000, 3) if recent else None,
+            "wait_max_ms": round(self.max_wait * 1000, 3)
+        }
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    options = {"echo": DB_ECHO, "pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if not url.startswith("sqlite"):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return create_async_engine(url, **options)
+
+
+# Motores de la base principal y de la réplica; se crean en configure_engines() al primer
+# uso (crear el motor importa el dialecto y el driver, que no hacen falta para importar)
+engine: Optional[AsyncEngine] = None
+async_session: Optional[sessionmaker] = None
+read_engine: Optional[AsyncEngine] = None
+read_async_session: Optional[sessionmaker] = None
+
+pool_metrics = {"primary": PoolMetrics(), "replica": PoolMetrics()}
+
+
+def configure_engines():
+    """Crea los motores si aún no existen; idempotente"""
+    global engine, async_session, read_engine, read_async_session
+    if engine is not None:
+        return
+    missing_vars = [var for var in required_vars if not os.getenv(var)]
+    if missing_vars and not PRIMARY_URL:
+        raise ValueError(f"Faltan variables de entorno críticas: {missing_vars}")
+
+    try:
+        engine = _create_engine(PRIMARY_URL or CLEVER_DB)
+        async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    except Exception as e:
+        print(f"Error al conectar a PostgreSQL: {e}")
+        # Fallback a SQLite si hay error
+        _use_sqlite_fallback()
+
+    # Sin réplica las lecturas van al principal
+    if READ_REPLICA_URL:
+        read_engine = _create_engine(READ_REPLICA_URL)
+        read_async_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def _use_sqlite_fallback():
+    global engine, async_session
+    engine = _create_engine(DATABASE_URL)
     async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-async def init_db():
-    """Inicializa la estructura de la base de datos."""
+def _create_missing_indexes(sync_conn):
+    # create_all no añade índices nuevos a tablas que ya existen
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+async def _create_schema():
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+
+async def init_db():
+    """Inicializa la estructura de la base de datos."""
+    configure_engines()
+    try:
+        await _create_schema()
+    except (OSError, SQLAlchemyError) as e:
+        if not DB_SQLITE_FALLBACK or engine.dialect.name == "sqlite":
+            raise
+        # El fallo real de conexión aparece aquí, no al crear el motor
+        print(f"Error al conectar a PostgreSQL, usando SQLite: {e}")
+        await engine.dispose()
+        _use_sqlite_fallback()
+        await _create_schema()
+
+async def _open_session(factory, metrics: PoolMetrics) -> AsyncSession:
+    session = factory()
+    started = time.perf_counter()
+    try:
+        # Obtener la conexión al abrir la sesión para medir la espera del pool
+        await session.connection()
+    except BaseException:
+        await session.close()
+        raise
+    metrics.record(time.perf_counter() - started)
+    return session
 
 @asynccontextmanager
 async def get_session():
     """Provee una sesión asíncrona para operaciones en la DB."""
-    async with async_session() as session:
+    configure_engines()
+    async with await _open_session(async_session, pool_metrics["primary"]) as session:
         yield session
 
+@asynccontextmanager
+async def get_read_session():
+    """Sesión para operaciones de solo lectura: usa la réplica si está configurada."""
+    configure_engines()
+    if read_async_session is None:
+        async with get_session() as session:
+            yield session
+        return
+    async with await _open_session(read_async_session, pool_metrics["replica"]) as session:
+        yield session
+
+def has_read_replica() -> bool:
+    """Si hay réplica de lectura configurada (DATABASE_READ_URL)"""
+    configure_engines()
+    return read_async_session is not None
+
 async def get_async_session() -> AsyncSession:
-    async with async_session() as session:
-        yield session
\ No newline at end of file
+    async with get_session() as session:
+        yield session
+
+async def get_async_read_session() -> AsyncSession:
+    async with get_read_session() as session:
+        yield session
+
+def _pool_status(target: AsyncEngine, metrics: PoolMetrics) -> Dict:
+    pool = target.sync_engine.pool
+    status = {"dialect": target.dialect.name, "pool": type(pool).__name__, **metrics.stats()}
+    if hasattr(pool, "checkedout"):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "saturation": round(pool.checkedout() / capacity, 4) if capacity else None
+        })
+    return status
+
+def pool_status() -> Dict:
+    """Ocupación de los pools y tiempos de espera al obtener conexión"""
+    configure_engines()
+    status = {"primary": _pool_status(engine, pool_metrics["primary"])}
+    if read_engine is not None:
+        status["replica"] = _pool_status(read_engine, pool_metrics["replica"])
+    return status
\ No newline at end of file
@@ -1,9 +1,24 @@
-from typing import Optional
+from datetime import datetime
+from typing import Optional, List, Dict
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, Integer, Sequence
+from sqlalchemy import Column, Integer, Sequence, Index, text
 from fastapi import Form
 
 class CardioHealth(SQLModel, table=True):
+    # Índices para consultas de cohortes y para el orden keyset de /records (columna, id)
+    __table_args__ = (
+        Index("ix_cardiohealth_age", "age"),
+        Index("ix_cardiohealth_ap_hi_ap_lo", "ap_hi", "ap_lo"),
+        Index("ix_cardiohealth_ap_lo", "ap_lo"),
+        Index("ix_cardiohealth_cholesterol_gluc_age", "cholesterol", "gluc", "age"),
+        Index("ix_cardiohealth_gluc_age", "gluc", "age"),
+        Index("ix_cardiohealth_cardio_age", "cardio", "age"),
+        # Parcial: los fumadores son la cohorte de riesgo más consultada. La igualdad
+        # (cholesterol) va antes que el rango (age) para que el índice acote ambas
+        Index("ix_cardiohealth_smokers_cholesterol_age", "cholesterol", "age",
+              sqlite_where=text("smoke = 1"), postgresql_where=text("smoke = 1")),
+    )
+
     id: Optional[int] = Field(
         sa_column=Column(
             Integer,
@@ -27,6 +42,19 @@ class CardioHealth(SQLModel, table=True):
     active: int = Field(..., ge=0, le=1, description="0: Inactivo físicamente, 1: Activo físicamente")
     cardio: int = Field(..., ge=0, le=1, description="0: No tiene antecedentes de enfermedad cardiovascular en la familia, 1: Sí tiene")
 
+class CardioHealthChange(SQLModel, table=True):
+    """Registro de ediciones de CardioHealth para el refresco incremental del modelo"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    record_id: int = Field(index=True, description="ID del registro editado")
+    changed_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CardioHealthSummary(SQLModel, table=True):
+    """Contadores agregados por dimensión y categoría, mantenidos en cada alta y edición"""
+    dimension: str = Field(primary_key=True, description="blood_pressure, imc, cholesterol, gluc o smoke")
+    bucket: str = Field(primary_key=True, description="Categoría o valor dentro de la dimensión")
+    records: int = Field(default=0, description="Registros en la categoría")
+    cardio: int = Field(default=0, description="Registros con cardio = 1")
+
 class CardioHealthCreate(SQLModel):
     @classmethod
     def as_form(
@@ -85,4 +113,26 @@ class CardioHealthResponse(SQLModel):
     smoke: int
     alco: int
     active: int
-    cardio: int
\ No newline at end of file
+    cardio: int
+
+class CohortFilter(SQLModel):
+    age_min: Optional[int] = Field(None, ge=1, le=150, description="Edad mínima en años")
+    age_max: Optional[int] = Field(None, ge=1, le=150, description="Edad máxima en años")
+    ap_hi_min: Optional[int] = Field(None, ge=50, le=300, description="Presión sistólica mínima")
+    ap_hi_max: Optional[int] = Field(None, ge=50, le=300, description="Presión sistólica máxima")
+    ap_lo_min: Optional[int] = Field(None, ge=30, le=200, description="Presión diastólica mínima")
+    ap_lo_max: Optional[int] = Field(None, ge=30, le=200, description="Presión diastólica máxima")
+    gender: Optional[int] = Field(None, ge=0, le=1, description="0: Mujer, 1: Hombre")
+    cholesterol: Optional[int] = Field(None, ge=1, le=3, description="1: Normal, 2: Alto, 3: Muy alto")
+    gluc: Optional[int] = Field(None, ge=1, le=3, description="1: Normal, 2: Alto, 3: Muy alto")
+    smoke: Optional[int] = Field(None, ge=0, le=1, description="0: No fuma, 1: Sí fuma")
+    alco: Optional[int] = Field(None, ge=0, le=1, description="0: No consume alcohol, 1: Sí consume")
+    active: Optional[int] = Field(None, ge=0, le=1, description="0: Inactivo, 1: Activo")
+    cardio: Optional[int] = Field(None, ge=0, le=1, description="0: Sin antecedentes, 1: Con antecedentes")
+
+class BatchScoringRequest(SQLModel):
+    ids: Optional[List[int]] = Field(None, description="IDs a puntuar; si se omite se usan los filtros")
+    cohort: Optional[CohortFilter] = Field(None, description="Cohorte a puntuar (rangos y categorías)")
+    filters: Optional[Dict[str, float]] = Field(None, description="Igualdad por columna, p. ej. {\"smoke\": 1}")
+    limit: Optional[int] = Field(None, ge=1, description="Máximo de registros a puntuar")
+    include_rules: bool = Field(False, description="Incluir los ids de las reglas de recomendación que cumple cada registro")
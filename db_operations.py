@@ -1,42 +1,334 @@
-from typing import Optional, Dict, List
+import asyncio
+import base64
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, List, AsyncIterator, Tuple
+import numpy as np
 from sqlmodel import select
-from sqlalchemy import func
+from sqlalchemy import func, or_, and_, insert, literal, text
 from sqlmodel.ext.asyncio.session import AsyncSession
-from database_model import CardioHealth
+from connection_db import get_read_session, get_session, has_read_replica
+from database_model import CardioHealth, CardioHealthChange, CohortFilter
+from feature_store import FEATURE_STORE_RESAVE_ROWS, STORE_COLUMNS, feature_store
+from health_rules import batch_rule_ids
+from instrumentation import metrics, span, timed
+from page_cache import PAGE_CACHE_SYNC_SECONDS, page_cache
+from population_stats import apply_deltas, merge_deltas, summary_deltas
 from recommendations import RecommendationSystem, recommendation_system
+from training import TrainingSnapshot, training_scheduler
 
 from fastapi import HTTPException
 
+# Filas leídas y puntuadas por bloque en la puntuación masiva
+BATCH_CHUNK_SIZE = 5000
+
+# Columnas por las que /records permite ordenar (keyset) y filtrar por igualdad
+SORTABLE_COLUMNS = ("id", "age", "ap_hi", "ap_lo", "cholesterol", "gluc")
+FILTERABLE_COLUMNS = ("gender", "cholesterol", "gluc", "smoke", "alco", "active", "cardio")
+
+metrics.describe("replica_stale_reads_total", "counter",
+                 "Lecturas de páginas enviadas al principal porque la réplica iba por detrás")
+
+# Cada cuánto se recalcula el conteo total con un COUNT real
+COUNT_REFRESH_SECONDS = 60
+
+# Agrupación de altas concurrentes (group commit), desactivada por defecto
+WRITE_BATCHING = os.getenv("WRITE_BATCHING", "false").lower() == "true"
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "100"))
+WRITE_BATCH_WINDOW_SECONDS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "5")) / 1000
+
+
+class RecordCounter:
+    """Total de registros mantenido en memoria: se incrementa en cada alta y se
+    reconcilia con un COUNT real como mucho una vez cada ``ttl`` segundos"""
+
+    def __init__(self, ttl: float = COUNT_REFRESH_SECONDS):
+        self.ttl = ttl
+        self.value: Optional[int] = None
+        self.refreshed_at = 0.0
+
+    async def get(self, session: AsyncSession) -> int:
+        if self.value is None or time.monotonic() - self.refreshed_at > self.ttl:
+            total_query = select(func.count()).select_from(CardioHealth)
+            self.value = (await session.execute(total_query)).scalar_one()
+            self.refreshed_at = time.monotonic()
+        return self.value
+
+    def increment(self, amount: int = 1):
+        if self.value is not None:
+            self.value += amount
+
+
+record_counter = RecordCounter()
+
+
+class RecordWriteBatcher:
+    """Agrupa las altas que llegan dentro de una ventana corta en un único
+    ``INSERT ... RETURNING id`` de varias filas con un solo commit.
+
+    Cada llamada a ``submit`` espera a que se escriba su lote y recibe su propio
+    registro con el id asignado. El lote se envía al cumplirse la ventana o al
+    llegar a ``max_size`` filas, lo que ocurra antes.
+    """
+
+    def __init__(self, enabled: bool = WRITE_BATCHING, max_size: int = WRITE_BATCH_MAX_SIZE,
+                 window_seconds: float = WRITE_BATCH_WINDOW_SECONDS):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.window_seconds = window_seconds
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes: set = set()
+
+    async def submit(self, record_data: Dict) -> CardioHealth:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((record_data, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._write(batch))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    @staticmethod
+    async def _insert(rows: List[Dict]) -> List[int]:
+        async with get_session() as session:
+            # sort_by_parameter_order: los ids vuelven en el mismo orden que las filas
+            statement = insert(CardioHealth.__table__).returning(
+                CardioHealth.__table__.c.id, sort_by_parameter_order=True)
+            ids = (await session.execute(statement, rows)).scalars().all()
+            await apply_deltas(session, summary_deltas(rows))
+            await session.commit()
+        return ids
+
+    async def _write(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        rows = [record_data for record_data, _ in batch]
+        try:
+            ids = await self._insert(rows)
+            results = [CardioHealth(id=record_id, **row) for record_id, row in zip(ids, rows)]
+        except Exception:
+            # Una fila inválida no debe hacer fallar al resto del lote: se reintenta una a una
+            results = []
+            for row in rows:
+                try:
+                    results.append(CardioHealth(id=(await self._insert([row]))[0], **row))
+                except Exception as e:
+                    results.append(e)
+        self._after_commit([result for result in results if not isinstance(result, Exception)])
+
+        written = 0
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                if not future.done():
+                    future.set_exception(result)
+                continue
+            written += 1
+            if not future.done():
+                future.set_result(result)
+        record_counter.increment(written)
+        metrics.inc("write_batches_total")
+        metrics.inc("write_batch_rows_total", written)
+
+    @staticmethod
+    def _after_commit(records: List[CardioHealth]):
+        # Las filas ya están confirmadas: un fallo al actualizar las cachés no debe
+        # volver a insertarlas ni hacer fallar a quien las envió
+        if not records:
+            return
+        page_cache.record_added(max(record.id for record in records))
+        try:
+            if feature_store.loaded:
+                feature_store.upsert_rows([record.id for record in records],
+                                          [[getattr(record, name) for name in STORE_COLUMNS] for record in records])
+        except Exception as e:
+            print(f"Error actualizando el almacén de características tras un lote: {e}")
+
+    async def drain(self):
+        """Escribe lo pendiente y espera a los lotes en curso (p. ej. al apagar)"""
+        self._flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+
+write_batcher = RecordWriteBatcher()
+
 
 class CardioHealthOperations:
     @staticmethod
+    def _equals(column, value: int):
+        # Valor en línea (ya validado como entero): permite al planificador usar
+        # índices parciales como el de fumadores, que no aplican a parámetros ligados
+        return column == literal(int(value), literal_execute=True)
+
+    @staticmethod
+    def cohort_conditions(cohort: CohortFilter) -> list:
+        """Traduce un filtro de cohorte a predicados SQL sobre columnas indexadas"""
+        conditions = []
+        # La edad se guarda en días; age_max incluye todo el último año
+        if cohort.age_min is not None:
+            conditions.append(CardioHealth.age >= cohort.age_min * 365)
+        if cohort.age_max is not None:
+            conditions.append(CardioHealth.age < (cohort.age_max + 1) * 365)
+        for column in ("ap_hi", "ap_lo"):
+            low, high = getattr(cohort, f"{column}_min"), getattr(cohort, f"{column}_max")
+            if low is not None:
+                conditions.append(getattr(CardioHealth, column) >= low)
+            if high is not None:
+                conditions.append(getattr(CardioHealth, column) <= high)
+        for column in FILTERABLE_COLUMNS:
+            value = getattr(cohort, column)
+            if value is not None:
+                conditions.append(CardioHealthOperations._equals(getattr(CardioHealth, column), value))
+        return conditions
+
+    @staticmethod
+    async def explain_query(session: AsyncSession, query) -> Dict:
+        """Plan de ejecución de una consulta y si usa algún índice (SQLite y PostgreSQL)"""
+        dialect = session.bind.dialect
+        sql = str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+        if dialect.name == "sqlite":
+            rows = (await session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).all()
+            plan = [row[-1] for row in rows]
+            indexes = [line for line in plan if " INDEX " in line and "PRIMARY KEY" not in line]
+        elif dialect.name == "postgresql":
+            rows = (await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar_one()
+            plan = rows if isinstance(rows, list) else json.loads(rows)
+            indexes = []
+
+            def collect(node):
+                if "Index Name" in node:
+                    indexes.append(node["Index Name"])
+                for child in node.get("Plans", []):
+                    collect(child)
+
+            collect(plan[0]["Plan"])
+        else:
+            raise HTTPException(status_code=400, detail=f"EXPLAIN no soportado para {dialect.name}")
+
+        return {"sql": sql, "plan": plan, "indexes": indexes, "uses_index": bool(indexes)}
+
+    @staticmethod
+    def _encode_cursor(key: Tuple, direction: str, sort: str, order: str) -> str:
+        payload = json.dumps({"k": list(key), "d": direction, "s": sort, "o": order}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Dict:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if payload["d"] not in ("next", "prev") or len(payload["k"]) != 2:
+                raise ValueError
+            return payload
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+
+    @staticmethod
+    @timed("db.get_all_records")
     async def get_all_records(
             session: AsyncSession,
-            page: int = 1,
-            per_page: int = 100
+            cursor: Optional[str] = None,
+            per_page: int = 100,
+            sort: str = "id",
+            order: str = "asc",
+            filters: Optional[Dict[str, int]] = None,
+            conditions: Optional[list] = None,
+            explain: bool = False
     ) -> dict:
-        """Obtiene registros paginados para mostrar en tablas"""
-        offset = (page - 1) * per_page
-        query = select(CardioHealth).offset(offset).limit(per_page)
+        """Obtiene registros paginados por keyset (sin OFFSET) para mostrar en tablas.
+
+        El cursor es opaco y codifica (valor de la columna de orden, id) de la última
+        fila vista; así cada página cuesta lo mismo sin importar lo profunda que sea.
+        """
+        if sort not in SORTABLE_COLUMNS or order not in ("asc", "desc"):
+            raise HTTPException(status_code=400, detail=f"Orden no válido: {sort} {order}")
+        invalid = [key for key in (filters or {}) if key not in FILTERABLE_COLUMNS]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Filtros no válidos: {invalid}")
+
+        sort_column = getattr(CardioHealth, sort)
+        key, direction = None, "next"
+        if cursor:
+            payload = CardioHealthOperations._decode_cursor(cursor)
+            # Un cursor de otro orden no es aplicable: se empieza desde el principio
+            if payload.get("s") == sort and payload.get("o") == order:
+                key, direction = payload["k"], payload["d"]
+
+        # Hacia atrás se recorre en sentido contrario y luego se invierte el resultado
+        backwards = direction == "prev"
+        descending = (order == "desc") != backwards
+
+        query = select(CardioHealth).where(*(conditions or []))
+        for column, value in (filters or {}).items():
+            query = query.where(CardioHealthOperations._equals(getattr(CardioHealth, column), value))
+
+        if key is not None:
+            value, last_id = key
+            if sort == "id":
+                query = query.where(CardioHealth.id < last_id if descending else CardioHealth.id > last_id)
+            elif descending:
+                query = query.where(or_(sort_column < value, and_(sort_column == value, CardioHealth.id < last_id)))
+            else:
+                query = query.where(or_(sort_column > value, and_(sort_column == value, CardioHealth.id > last_id)))
+
+        order_columns = [CardioHealth.id] if sort == "id" else [sort_column, CardioHealth.id]
+        query = query.order_by(*[c.desc() if descending else c.asc() for c in order_columns])
+
+        # Una fila extra indica si hay más páginas en el sentido del recorrido
+        query = query.limit(per_page + 1)
+        if explain:
+            return await CardioHealthOperations.explain_query(session, query)
         result = await session.execute(query)
+        records = result.scalars().all()
+        has_more = len(records) > per_page
+        records = records[:per_page]
+        if backwards:
+            records.reverse()
 
-        # Contar total de registros (para paginación)
-        total_query = select(func.count()).select_from(CardioHealth)
-        total = (await session.execute(total_query)).scalar_one()
+        def row_key(record):
+            return (getattr(record, sort), record.id)
+
+        next_cursor = prev_cursor = None
+        if records:
+            if has_more or backwards:
+                next_cursor = CardioHealthOperations._encode_cursor(row_key(records[-1]), "next", sort, order)
+            if (has_more and backwards) or (key is not None and not backwards):
+                prev_cursor = CardioHealthOperations._encode_cursor(row_key(records[0]), "prev", sort, order)
+
+        # Con filtros el total exigiría un COUNT completo por petición: no se calcula
+        total = None if filters or conditions else await record_counter.get(session)
 
         return {
-            "data": result.scalars().all(),
+            "data": records,
             "total": total,
-            "page": page,
-            "per_page": per_page
+            "per_page": per_page,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+            "sort": sort,
+            "order": order,
+            "filters": filters or {}
         }
 
     @staticmethod
+    @timed("db.get_record_by_id")
     async def get_record_by_id(session: AsyncSession, record_id: int) -> Optional[CardioHealth]:
         """Obtiene un registro por su ID"""
         return await session.get(CardioHealth, record_id)
 
     @staticmethod
+    @timed("db.add_record")
     async def add_record(session: AsyncSession, record_data: Dict) -> CardioHealth:
         """Agrega un nuevo registro a la base de datos"""
         # Asegurarse de que no se incluya el ID
@@ -45,25 +337,410 @@ class CardioHealthOperations:
         
         new_record = CardioHealth(**record_data)
         session.add(new_record)
+        # Contadores de población en la misma transacción que el alta
+        await apply_deltas(session, summary_deltas([new_record.model_dump()]))
+        # El id se asigna en el flush y el objeto no se expira al confirmar: no hace falta refresh
         await session.commit()
-        await session.refresh(new_record)
+        record_counter.increment()
+        feature_store.upsert(new_record.model_dump())
+        page_cache.record_added(new_record.id)
         return new_record
 
     @staticmethod
+    async def create_record(record_data: Dict) -> CardioHealth:
+        """Alta de un registro: agrupada con otras altas concurrentes si WRITE_BATCHING está activo"""
+        record_data = {key: value for key, value in record_data.items() if key != 'id'}
+        if write_batcher.enabled:
+            with span("db.create_record.batched"):
+                return await write_batcher.submit(record_data)
+        async with get_session() as session:
+            return await CardioHealthOperations.add_record(session, record_data)
+
+    @staticmethod
+    @timed("db.edit_record")
     async def edit_record(session: AsyncSession, record_id: int, update_data: Dict) -> Optional[CardioHealth]:
         """Edita un registro existente"""
         record = await session.get(CardioHealth, record_id)
         if not record:
             return None
 
+        previous = record.model_dump()
         for key, value in update_data.items():
             setattr(record, key, value)
+        await apply_deltas(session, merge_deltas(
+            summary_deltas([previous], sign=-1), summary_deltas([record.model_dump()])))
 
+        # Registrar la edición (misma transacción) para el refresco incremental del modelo
+        change = CardioHealthChange(record_id=record_id)
+        session.add(change)
         await session.commit()
         await session.refresh(record)
+        recommendation_system.invalidate_record(record_id)
+        feature_store.upsert(record.model_dump())
+        # La nueva versión del registro cambia el ETag de sus páginas
+        page_cache.record_changed(record_id, change.id)
         return record
 
     @staticmethod
+    async def stream_column_chunks(session: AsyncSession, query,
+                                    chunk_size: int = BATCH_CHUNK_SIZE) -> AsyncIterator[np.ndarray]:
+        """Recorre una consulta de columnas numéricas con cursor de servidor, en bloques float64"""
+        result = await session.stream(query.execution_options(yield_per=chunk_size))
+        async for partition in result.partitions(chunk_size):
+            yield np.asarray(partition, dtype=np.float64)
+
+    @staticmethod
+    def _training_columns() -> list:
+        feature_names = recommendation_system.feature_names
+        return [CardioHealth.id] + [getattr(CardioHealth, f) for f in feature_names] + [CardioHealth.cardio]
+
+    @staticmethod
+    async def _last_change_id(session: AsyncSession) -> int:
+        return (await session.execute(select(func.max(CardioHealthChange.id)))).scalar_one() or 0
+
+    @staticmethod
+    @timed("db.load_training_snapshot")
+    async def load_training_snapshot(chunk_size: int = BATCH_CHUNK_SIZE) -> TrainingSnapshot:
+        """Carga id, características y ``cardio`` directamente en arrays NumPy preasignados.
+
+        Usa una sesión propia de solo lectura (el entrenamiento sobrevive a la petición
+        que lo dispara, y puede leer de la réplica) y nunca materializa objetos ORM:
+        solo se seleccionan las columnas numéricas. Con el almacén de características
+        cargado, basta con ponerlo al día y copiar sus columnas.
+        """
+        if feature_store.loaded:
+            await CardioHealthOperations.sync_feature_store(chunk_size)
+            ids, features, target = feature_store.training_arrays()
+            if len(ids) < 100:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Se necesitan mínimo 100 registros (actual: {len(ids)})"
+                )
+            return TrainingSnapshot(ids, features, target,
+                                    feature_store.high_water_mark, feature_store.last_change_id)
+
+        n_features = len(recommendation_system.feature_names)
+        # Orden estable para que la huella del conjunto de datos sea reproducible
+        query = select(*CardioHealthOperations._training_columns()).order_by(CardioHealth.id)
+
+        async with get_read_session() as session:
+            # La marca del registro de cambios se toma antes de leer: ediciones concurrentes
+            # se volverán a aplicar en el siguiente refresco (aplicarlas dos veces es inocuo)
+            last_change_id = await CardioHealthOperations._last_change_id(session)
+            total = (await session.execute(select(func.count()).select_from(CardioHealth))).scalar_one()
+            ids = np.empty(total, dtype=np.int64)
+            features = np.empty((total, n_features), dtype=np.float64)
+            target = np.empty(total, dtype=np.int64)
+
+            filled = 0
+            async for block in CardioHealthOperations.stream_column_chunks(session, query, chunk_size):
+                end = filled + len(block)
+                if end > len(target):
+                    # Llegaron filas nuevas entre el conteo y la lectura
+                    ids = np.resize(ids, end)
+                    features = np.resize(features, (end, n_features))
+                    target = np.resize(target, end)
+                ids[filled:end] = block[:, 0]
+                features[filled:end] = block[:, 1:-1]
+                target[filled:end] = block[:, -1]
+                filled = end
+
+        if filled < 100:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Se necesitan mínimo 100 registros (actual: {filled})"
+            )
+        high_water_mark = int(ids[filled - 1])
+        return TrainingSnapshot(ids[:filled], features[:filled], target[:filled], high_water_mark, last_change_id)
+
+    @staticmethod
+    def _changed_ids_query(snapshot: TrainingSnapshot):
+        return select(CardioHealthChange.record_id).where(CardioHealthChange.id > snapshot.last_change_id)
+
+    @staticmethod
+    @timed("db.count_pending_changes")
+    async def count_pending_changes(snapshot: TrainingSnapshot) -> int:
+        """Filas nuevas (id por encima de la marca) más registros editados desde el snapshot"""
+        async with get_read_session() as session:
+            new_rows = (await session.execute(
+                select(func.count()).select_from(CardioHealth).where(CardioHealth.id > snapshot.high_water_mark)
+            )).scalar_one()
+            changed = (await session.execute(
+                select(func.count(func.distinct(CardioHealthChange.record_id)))
+                .where(CardioHealthChange.id > snapshot.last_change_id)
+            )).scalar_one()
+        return new_rows + changed
+
+    @staticmethod
+    async def _read_delta(marks, chunk_size: int = BATCH_CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray, int, int]:
+        """Filas nuevas o editadas desde las marcas de ``marks`` (snapshot o almacén de características).
+
+        Devuelve ids, valores en el orden de STORE_COLUMNS y las marcas nuevas.
+        """
+        async with get_read_session() as session:
+            last_change_id = await CardioHealthOperations._last_change_id(session)
+            query = (
+                select(*CardioHealthOperations._training_columns())
+                .where(or_(
+                    CardioHealth.id > marks.high_water_mark,
+                    CardioHealth.id.in_(CardioHealthOperations._changed_ids_query(marks))
+                ))
+                .order_by(CardioHealth.id)
+            )
+            blocks = [block async for block in CardioHealthOperations.stream_column_chunks(session, query, chunk_size)]
+
+        n_columns = len(recommendation_system.feature_names) + 2
+        delta = np.concatenate(blocks) if blocks else np.empty((0, n_columns), dtype=np.float64)
+        ids = delta[:, 0].astype(np.int64)
+        high_water_mark = int(ids.max()) if len(ids) else marks.high_water_mark
+        return ids, delta[:, 1:], high_water_mark, last_change_id
+
+    @staticmethod
+    @timed("db.load_training_delta")
+    async def load_training_delta(snapshot: TrainingSnapshot,
+                                  chunk_size: int = BATCH_CHUNK_SIZE) -> TrainingSnapshot:
+        """Lee solo las filas nuevas o editadas desde el snapshot y las combina con él"""
+        ids, values, high_water_mark, last_change_id = await CardioHealthOperations._read_delta(snapshot, chunk_size)
+        return snapshot.apply_delta(ids, values[:, :-1], values[:, -1].astype(np.int64),
+                                    high_water_mark, last_change_id)
+
+    @staticmethod
+    @timed("db.sync_feature_store")
+    async def sync_feature_store(chunk_size: int = BATCH_CHUNK_SIZE) -> int:
+        """Aplica al almacén de características lo escrito por otros workers o fuera de la API"""
+        ids, values, high_water_mark, last_change_id = await CardioHealthOperations._read_delta(
+            feature_store, chunk_size)
+        feature_store.apply_delta(ids, values, high_water_mark, last_change_id)
+        return len(ids)
+
+    @staticmethod
+    @timed("db.load_feature_store")
+    async def load_feature_store(chunk_size: int = BATCH_CHUNK_SIZE):
+        """Abre el almacén compartido por los workers o lo construye con una lectura de la tabla"""
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, feature_store.open_shared):
+            pending = await CardioHealthOperations.sync_feature_store(chunk_size)
+            if pending < FEATURE_STORE_RESAVE_ROWS:
+                return
+        else:
+            query = select(*CardioHealthOperations._training_columns()).order_by(CardioHealth.id)
+            feature_store.begin_load()
+            async with get_read_session() as session:
+                # Marca tomada antes de leer: lo editado durante la carga llega en el siguiente delta
+                last_change_id = await CardioHealthOperations._last_change_id(session)
+                async for block in CardioHealthOperations.stream_column_chunks(session, query, chunk_size):
+                    feature_store.upsert_rows(block[:, 0], block[:, 1:])
+            feature_store.finish_load(last_change_id)
+
+        # Publicar la generación y mapearla para compartir las páginas con los demás workers
+        await loop.run_in_executor(None, feature_store.save)
+        await loop.run_in_executor(None, feature_store.open_shared)
+        await CardioHealthOperations.sync_feature_store(chunk_size)
+
+    @staticmethod
+    @timed("db.sync_page_versions")
+    async def sync_page_versions():
+        """Lleva a page_cache las altas y ediciones hechas por otros workers o fuera de la API"""
+        async with get_read_session() as session:
+            high_water_mark = (await session.execute(select(func.max(CardioHealth.id)))).scalar_one() or 0
+            if not page_cache.ready:
+                page_cache.start(high_water_mark, await CardioHealthOperations._last_change_id(session))
+                return
+            changes = (await session.execute(
+                select(CardioHealthChange.id, CardioHealthChange.record_id)
+                .where(CardioHealthChange.id > page_cache.last_change_id)
+                .order_by(CardioHealthChange.id)
+            )).all()
+        page_cache.apply_changes(changes, high_water_mark)
+
+    @staticmethod
+    @asynccontextmanager
+    async def page_read_session():
+        """Sesión para las páginas HTML: la réplica si ya tiene todo lo que reflejan las
+        marcas de page_cache (id máximo y última edición), si no el principal.
+
+        Las marcas forman el ETag, así que una réplica retrasada guardaría HTML antiguo
+        con un ETag nuevo. Se leen antes que los datos: la réplica solo avanza, así que
+        las consultas siguientes ven al menos ese estado.
+        """
+        high_water_mark, last_change_id = page_cache.high_water_mark, page_cache.last_change_id
+        if has_read_replica():
+            async with get_read_session() as session:
+                caught_up = not page_cache.ready or (
+                    ((await session.execute(select(func.max(CardioHealth.id)))).scalar_one() or 0) >= high_water_mark
+                    and await CardioHealthOperations._last_change_id(session) >= last_change_id)
+                if caught_up:
+                    yield session
+                    return
+            metrics.inc("replica_stale_reads_total")
+        async with get_session() as session:
+            yield session
+
+    @staticmethod
+    async def run_page_version_sync(interval: float = PAGE_CACHE_SYNC_SECONDS):
+        """Bucle de fondo de sync_page_versions"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await CardioHealthOperations.sync_page_versions()
+            except Exception as e:
+                print(f"Error sincronizando versiones de páginas: {e}")
+
+    @staticmethod
+    def schedule_training() -> asyncio.Task:
+        """Dispara un (re)entrenamiento en segundo plano; reutiliza el que esté en curso"""
+        return training_scheduler.trigger(CardioHealthOperations.load_training_snapshot)
+
+    @staticmethod
+    def schedule_refresh() -> asyncio.Task:
+        """Refresco incremental (delta + snapshot en caché); entrenamiento completo si no hay snapshot"""
+        return training_scheduler.trigger_refresh(
+            CardioHealthOperations.load_training_delta,
+            CardioHealthOperations.load_training_snapshot
+        )
+
+    @staticmethod
+    async def run_refresh_policy():
+        """Bucle de fondo que aplica la política de refresco del modelo"""
+        await training_scheduler.refresh_loop(
+            CardioHealthOperations.count_pending_changes,
+            CardioHealthOperations.load_training_delta,
+            CardioHealthOperations.load_training_snapshot
+        )
+
+    @staticmethod
+    @timed("db.ensure_model")
+    async def ensure_model():
+        """Espera a que haya un modelo entrenado (peticiones concurrentes comparten el entrenamiento;
+        shield evita que una petición cancelada aborte el entrenamiento compartido)"""
+        # Si el arranque aún está cargando el modelo guardado, se espera en vez de reentrenar
+        warm_up_task = recommendation_system.warm_up_task
+        if warm_up_task is not None and not warm_up_task.done():
+            await asyncio.shield(warm_up_task)
+        if not await recommendation_system.model_available():
+            await asyncio.shield(CardioHealthOperations.schedule_training())
+
+    @staticmethod
+    def build_batch_query(ids: Optional[List[int]] = None, filters: Optional[Dict] = None,
+                          limit: Optional[int] = None, cohort: Optional[CohortFilter] = None):
+        """Construye la consulta por columnas (id + características) para la puntuación masiva"""
+        allowed = set(recommendation_system.feature_names) | {"cardio"}
+        invalid = [key for key in (filters or {}) if key not in allowed]
+        if invalid:
+            raise HTTPException(status_code=422, detail=f"Filtros no válidos: {invalid}")
+
+        columns = [CardioHealth.id] + [getattr(CardioHealth, f) for f in recommendation_system.feature_names]
+        query = select(*columns).order_by(CardioHealth.id)
+        if ids:
+            query = query.where(CardioHealth.id.in_(ids))
+        if cohort is not None:
+            query = query.where(*CardioHealthOperations.cohort_conditions(cohort))
+        for key, value in (filters or {}).items():
+            query = query.where(getattr(CardioHealth, key) == value)
+        if limit:
+            query = query.limit(limit)
+        return query
+
+    @staticmethod
+    async def _score_rows(ids: np.ndarray, features: np.ndarray, include_rules: bool = False) -> List[Dict]:
+        scores = await recommendation_system.score_batch_async(features)
+        rows = [
+            {
+                "id": record_id,
+                "probability": round(probability, 4),
+                "risk_level": risk_level,
+                "risk_color": risk_color,
+                "imc": imc,
+                "imc_category": imc_category,
+                "blood_pressure": blood_pressure,
+                "metabolic_age": metabolic_age
+            }
+            for record_id, probability, risk_level, risk_color, imc, imc_category, blood_pressure, metabolic_age
+            in zip(
+                ids.astype(np.int64).tolist(),
+                scores["probability"].tolist(),
+                scores["risk_level"].tolist(),
+                scores["risk_color"].tolist(),
+                scores["imc"].tolist(),
+                scores["imc_category"].tolist(),
+                scores["blood_pressure"].tolist(),
+                scores["metabolic_age"].astype(np.int64).tolist()
+            )
+        ]
+        if include_rules:
+            for row, rules in zip(rows, batch_rule_ids(scores["rules"])):
+                row["rules"] = rules
+        return rows
+
+    @staticmethod
+    async def stream_batch_scores(query, chunk_size: int = BATCH_CHUNK_SIZE,
+                                  include_rules: bool = False) -> AsyncIterator[List[Dict]]:
+        """Lee con cursor en bloques y puntúa cada bloque de forma vectorizada"""
+        async with get_read_session() as session:
+            async for block in CardioHealthOperations.stream_column_chunks(session, query, chunk_size):
+                yield await CardioHealthOperations._score_rows(block[:, 0], block[:, 1:], include_rules)
+
+    @staticmethod
+    def feature_store_rows(ids: Optional[List[int]] = None, filters: Optional[Dict] = None,
+                           limit: Optional[int] = None, cohort: Optional[CohortFilter] = None) -> np.ndarray:
+        """Mismo criterio que build_batch_query, evaluado sobre el almacén de características.
+
+        Devuelve las filas del almacén que cumplen los filtros, ordenadas por id.
+        """
+        columns = feature_store.columns
+        n = len(feature_store)
+        mask = np.ones(n, dtype=bool)
+        if ids:
+            mask &= np.isin(feature_store.ids[:n], ids)
+        if cohort is not None:
+            age = columns["age"][:n]
+            if cohort.age_min is not None:
+                mask &= age >= cohort.age_min * 365
+            if cohort.age_max is not None:
+                mask &= age < (cohort.age_max + 1) * 365
+            for column in ("ap_hi", "ap_lo"):
+                low, high = getattr(cohort, f"{column}_min"), getattr(cohort, f"{column}_max")
+                if low is not None:
+                    mask &= columns[column][:n] >= low
+                if high is not None:
+                    mask &= columns[column][:n] <= high
+            for column in FILTERABLE_COLUMNS:
+                value = getattr(cohort, column)
+                if value is not None:
+                    mask &= columns[column][:n] == value
+        for key, value in (filters or {}).items():
+            column = columns[key][:n]
+            if np.issubdtype(column.dtype, np.integer):
+                # Sin convertir al tipo de la columna: 1.5 o 300 no están en una columna int8,
+                # igual que en la base (convertirlos daría 1 o un valor desbordado)
+                info = np.iinfo(column.dtype)
+                if not float(value).is_integer() or not info.min <= value <= info.max:
+                    mask[:] = False
+                    continue
+                value = int(value)
+            else:
+                # Columnas float32: el valor se compara con la misma precisión con que se guarda
+                value = column.dtype.type(value)
+            mask &= column == value
+
+        rows = np.flatnonzero(mask)
+        rows = rows[np.argsort(feature_store.ids[rows], kind="stable")]
+        return rows[:limit] if limit else rows
+
+    @staticmethod
+    async def stream_feature_store_scores(rows: np.ndarray,
+                                          chunk_size: int = BATCH_CHUNK_SIZE,
+                                          include_rules: bool = False) -> AsyncIterator[List[Dict]]:
+        """Puntúa por bloques filas del almacén de características, sin consultar la base"""
+        for start in range(0, len(rows), chunk_size):
+            block = rows[start:start + chunk_size]
+            yield await CardioHealthOperations._score_rows(
+                feature_store.ids[block], feature_store.matrix(rows=block), include_rules)
+            # Ceder el event loop entre bloques
+            await asyncio.sleep(0)
+
+    @staticmethod
+    @timed("db.get_recommendations")
     async def get_recommendations(session: AsyncSession, record_id: int) -> Dict:
         """Obtiene recomendaciones personalizadas basadas en IA para un paciente"""
         try:
@@ -76,24 +753,14 @@ class CardioHealthOperations:
                 )
 
             # 2. Entrenar modelo si es necesario
-            if not recommendation_system.is_trained():
-                result = await session.execute(select(CardioHealth))
-                records = result.scalars().all()
-
-                if len(records) < 100:
-                    raise HTTPException(
-                        status_code=422,
-                        detail=f"Se necesitan mínimo 100 registros (actual: {len(records)})"
-                    )
-
-                await recommendation_system.train_model([CardioHealth(**r.__dict__) for r in records])
+            await CardioHealthOperations.ensure_model()
 
-            # 3. Generar recomendaciones
-            patient_data = CardioHealth(**patient.__dict__)
-            recommendations = recommendation_system.generate_recommendations(patient_data)
+            # 3. Generar recomendaciones (o reutilizarlas de la caché)
+            recommendations = await recommendation_system.recommend(patient)
 
             return {
                 "success": True,
+                "record": patient,
                 "data": recommendations,
                 "message": "Recomendaciones generadas exitosamente"
             }
@@ -0,0 +1,264 @@
+"""Almacén columnar en memoria de toda la tabla cardiohealth.
+
+Cada columna es un array NumPy con el tipo más pequeño que la representa sin
+pérdida para el modelo (int8 para binarias/ordinales, int16 para presiones, int32
+para la edad en días y float32 para altura y peso: el RandomForest compara en
+float32), unas 31 bytes por fila frente a las 104 de una matriz float64.
+
+El almacén se guarda en disco como un .npy por columna y los workers lo abren con
+mmap en modo copy-on-write: las páginas que nadie modifica se comparten entre
+procesos a través de la caché de páginas, y las altas/ediciones locales solo
+copian las páginas que tocan. Cada worker se mantiene al día con los hooks de
+alta/edición y con lecturas del delta (marcas ``high_water_mark`` y
+``last_change_id``, igual que el snapshot de entrenamiento).
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from model_store import MODEL_DIR
+from recommendations import FEATURE_NAMES
+
+FEATURE_STORE_DIR = Path(os.getenv("FEATURE_STORE_DIR", MODEL_DIR / "features"))
+# Filas libres reservadas al guardar, para que las altas no obliguen a realocar
+FEATURE_STORE_HEADROOM = float(os.getenv("FEATURE_STORE_HEADROOM", "0.1"))
+# Si al abrir el fichero compartido hay más filas pendientes que esto, se vuelve a guardar
+FEATURE_STORE_RESAVE_ROWS = int(os.getenv("FEATURE_STORE_RESAVE_ROWS", "10000"))
+
+# Columnas en el orden de CardioHealthOperations._training_columns (sin el id)
+STORE_COLUMNS = FEATURE_NAMES + ["cardio"]
+COLUMN_DTYPES = {
+    "age": np.int32,
+    "gender": np.int8,
+    "height": np.float32,
+    "weight": np.float32,
+    "ap_hi": np.int16,
+    "ap_lo": np.int16,
+    "cholesterol": np.int8,
+    "gluc": np.int8,
+    "smoke": np.int8,
+    "alco": np.int8,
+    "active": np.int8,
+    "cardio": np.int8,
+}
+STORE_FORMAT_VERSION = 1
+
+# Marca de "ids ya ordenados" para el índice id -> fila
+_MONOTONIC = np.empty(0, dtype=np.int64)
+
+
+class FeatureStore:
+    """Tabla completa en columnas tipadas con índice id -> fila"""
+
+    def __init__(self, directory: Path = FEATURE_STORE_DIR):
+        self.directory = Path(directory)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()
+        }
+        self.size = 0
+        self.high_water_mark = 0
+        self.last_change_id = 0
+        self.loaded = False
+        self.shared_generation: Optional[str] = None
+        self._order: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    # --- Índice id -> fila ---
+
+    def _sorted_order(self) -> Optional[np.ndarray]:
+        """Permutación que ordena los ids, o None si ya están en orden creciente.
+
+        Los ids suelen llegar en orden creciente, así que casi siempre basta con
+        buscar directamente sobre la columna de ids.
+        """
+        if self._order is None:
+            ids = self.ids[:self.size]
+            if self.size < 2 or np.all(ids[1:] > ids[:-1]):
+                self._order = _MONOTONIC
+            else:
+                self._order = np.argsort(ids, kind="stable")
+        return None if self._order is _MONOTONIC else self._order
+
+    def positions(self, ids: np.ndarray) -> np.ndarray:
+        """Fila de cada id, o -1 si no está en el almacén"""
+        ids = np.asarray(ids, dtype=np.int64)
+        order = self._sorted_order()
+        sorted_ids = self.ids[:self.size] if order is None else self.ids[:self.size][order]
+        found = np.searchsorted(sorted_ids, ids)
+        inside = found < self.size
+        result = np.full(len(ids), -1, dtype=np.int64)
+        hits = inside.copy()
+        hits[inside] = sorted_ids[found[inside]] == ids[inside]
+        result[hits] = found[hits] if order is None else order[found[hits]]
+        return result
+
+    # --- Escritura ---
+
+    def _reserve(self, rows: int):
+        if rows <= len(self.ids):
+            return
+        capacity = max(rows, int(rows * (1 + FEATURE_STORE_HEADROOM)), 1024)
+        # Copia a memoria privada: el fichero compartido no se amplía
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        self.ids = ids
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def upsert_rows(self, ids: np.ndarray, values: np.ndarray):
+        """Inserta o reemplaza filas; ``values`` es (n, 12) en el orden de STORE_COLUMNS"""
+        ids = np.asarray(ids, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if not len(ids):
+            return
+        positions = self.positions(ids)
+        new = positions < 0
+        n_new = int(new.sum())
+        if n_new:
+            self._reserve(self.size + n_new)
+            positions[new] = np.arange(self.size, self.size + n_new)
+            self.ids[self.size:self.size + n_new] = ids[new]
+            self.size += n_new
+            self._order = None
+        for j, name in enumerate(STORE_COLUMNS):
+            self.columns[name][positions] = values[:, j]
+
+    def upsert(self, record: Dict):
+        """Hook de alta/edición: ``record`` es un dict con id y todas las columnas"""
+        if not self.loaded or record.get("id") is None:
+            return
+        self.upsert_rows([record["id"]], [[record[name] for name in STORE_COLUMNS]])
+
+    def begin_load(self):
+        """Vacía el almacén antes de una carga completa; los hooks no escriben hasta terminar"""
+        self.ids = np.empty(0, dtype=np.int64)
+        self.columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+        self.size = 0
+        self._order = None
+        self.shared_generation = None
+        self.loaded = False
+
+    def finish_load(self, last_change_id: int):
+        self.high_water_mark = int(self.ids[:self.size].max()) if self.size else 0
+        self.last_change_id = last_change_id
+        self.loaded = True
+
+    def apply_delta(self, ids: np.ndarray, values: np.ndarray, high_water_mark: int, last_change_id: int):
+        """Aplica filas nuevas o editadas leídas desde las marcas actuales"""
+        self.upsert_rows(ids, values)
+        self.high_water_mark = max(self.high_water_mark, high_water_mark)
+        self.last_change_id = max(self.last_change_id, last_change_id)
+
+    # --- Lectura ---
+
+    def matrix(self, columns: List[str] = FEATURE_NAMES, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Matriz float64 de las columnas pedidas (todas las filas o las indicadas)"""
+        selected = slice(0, self.size) if rows is None else rows
+        out = np.empty((self.size if rows is None else len(rows), len(columns)), dtype=np.float64)
+        for j, name in enumerate(columns):
+            out[:, j] = self.columns[name][selected]
+        return out
+
+    def training_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ids, características y ``cardio`` ordenados por id (como el snapshot de entrenamiento)"""
+        order = self._sorted_order()
+        if order is None:
+            order = np.arange(self.size)
+        return (self.ids[:self.size][order], self.matrix(rows=order),
+                self.columns["cardio"][:self.size][order].astype(np.int64))
+
+    def memory_bytes(self) -> int:
+        return self.size * (self.ids.itemsize + sum(c.itemsize for c in self.columns.values()))
+
+    def status(self) -> Dict:
+        return {
+            "loaded": self.loaded,
+            "rows": self.size,
+            "bytes": self.memory_bytes(),
+            "high_water_mark": self.high_water_mark,
+            "last_change_id": self.last_change_id,
+            "shared_generation": self.shared_generation
+        }
+
+    # --- Compartición entre workers ---
+
+    def _pointer_path(self) -> Path:
+        return self.directory / "current.json"
+
+    def save(self) -> str:
+        """Escribe una generación nueva (un .npy por columna) y la publica de forma atómica"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        generation = f"gen-{time.time_ns()}"
+        tmp_dir = Path(tempfile.mkdtemp(dir=self.directory, prefix=".tmp-"))
+        capacity = max(self.size + int(self.size * FEATURE_STORE_HEADROOM), 1024)
+        try:
+            for name, column in [("id", self.ids), *self.columns.items()]:
+                padded = np.zeros(capacity, dtype=column.dtype)
+                padded[:self.size] = column[:self.size]
+                np.save(tmp_dir / f"{name}.npy", padded)
+            with open(tmp_dir / "meta.json", "w") as f:
+                json.dump({
+                    "format": STORE_FORMAT_VERSION,
+                    "size": self.size,
+                    "high_water_mark": self.high_water_mark,
+                    "last_change_id": self.last_change_id
+                }, f)
+            os.replace(tmp_dir, self.directory / generation)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        fd, tmp_pointer = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"generation": generation}, f)
+        os.replace(tmp_pointer, self._pointer_path())
+        self._remove_old_generations(keep={generation, self.shared_generation})
+        return generation
+
+    def _remove_old_generations(self, keep: set):
+        # Un worker que aún tenga mapeada una generación borrada la sigue leyendo sin problema
+        for path in self.directory.glob("gen-*"):
+            if path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def open_shared(self) -> bool:
+        """Mapea la última generación publicada en modo copy-on-write"""
+        if not self._pointer_path().exists():
+            return False
+        try:
+            with open(self._pointer_path()) as f:
+                generation = json.load(f)["generation"]
+            path = self.directory / generation
+            with open(path / "meta.json") as f:
+                meta = json.load(f)
+            if meta.get("format") != STORE_FORMAT_VERSION:
+                return False
+            ids = np.load(path / "id.npy", mmap_mode="c")
+            columns = {name: np.load(path / f"{name}.npy", mmap_mode="c") for name in COLUMN_DTYPES}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"No se pudo abrir el almacén de características: {e}")
+            return False
+
+        self.ids = ids
+        self.columns = columns
+        self.size = meta["size"]
+        self.high_water_mark = meta["high_water_mark"]
+        self.last_change_id = meta["last_change_id"]
+        self.shared_generation = generation
+        self._order = None
+        self.loaded = True
+        return True
+
+
+feature_store = FeatureStore()
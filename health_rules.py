@@ -0,0 +1,226 @@
+"""Reglas de salud declarativas: umbrales de clasificación y tablas regla → efecto.
+
+Todas las reglas se evalúan sobre columnas NumPy con ``np.digitize`` y máscaras
+booleanas, igual para una fila (la página de un paciente) que para una cohorte
+entera (puntuación masiva y resumen de población), así que todos usan exactamente
+los mismos criterios.
+
+Una regla es un dict con:
+
+- ``when``: lista de condiciones ``(columna, operador, umbral)``; basta con que se
+  cumpla una. Lista vacía: se cumple siempre. Las columnas son las de
+  FEATURE_NAMES más ``imc`` y, en las recomendaciones, ``probability``.
+- ``group`` (opcional): dentro de un grupo solo cuenta la primera regla que se
+  cumple, como en una cadena if/elif.
+- ``factor`` (opcional): la regla solo aplica si ese factor está entre los factores
+  clave del paciente (depende de las contribuciones del modelo).
+"""
+import hashlib
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FEATURE_NAMES = [
+    'age', 'gender', 'height', 'weight',
+    'ap_hi', 'ap_lo', 'cholesterol',
+    'gluc', 'smoke', 'alco', 'active'
+]
+
+Condition = Tuple[str, str, float]
+
+# --- Clasificaciones por intervalos ---
+
+# Nivel de riesgo: la probabilidad cae en (0.4, 0.6] -> "Moderado", etc.
+RISK_BINS = np.array([0.4, 0.6, 0.8])
+RISK_LEVELS = np.array(["Bajo", "Moderado", "Alto", "Extremo"])
+RISK_COLORS = np.array(["#00B050", "#FFC100", "#FF6B00", "#FF0000"])
+
+# IMC según rangos estándar de la OMS (límite inferior incluido en la categoría siguiente)
+IMC_BINS = np.array([16, 17, 18.5, 25, 30, 35, 40])
+IMC_LABELS = np.array([
+    "Delgadez Severa", "Delgadez Moderada", "Delgadez Leve", "Normal",
+    "Sobrepeso", "Obesidad Grado 1", "Obesidad Grado 2", "Obesidad Grado 3"
+])
+
+# Presión arterial: la categoría es la peor de la sistólica y la diastólica
+SYSTOLIC_BINS = np.array([120, 130, 140, 160, 180])
+DIASTOLIC_BINS = np.array([80, 85, 90, 100, 110])
+BLOOD_PRESSURE_LABELS = np.array([
+    "Normal", "Normal Alta", "Pre-hipertensión",
+    "Hipertensión Grado 1", "Hipertensión Grado 2", "Hipertensión Crisis"
+])
+
+# --- Edad metabólica: días que suma cada regla a la edad real ---
+
+METABOLIC_AGE_RULES: List[Dict] = [
+    {"group": "imc", "when": [("imc", ">=", 30)], "days": 1825},           # Obesidad: +5 años
+    {"group": "imc", "when": [("imc", ">=", 25)], "days": 730},            # Sobrepeso: +2 años
+    {"group": "imc", "when": [("imc", "<", 18.5)], "days": 365},           # Bajo peso: +1 año
+    {"group": "presion", "when": [("ap_hi", ">=", 140), ("ap_lo", ">=", 90)], "days": 1460},  # Hipertensión
+    {"group": "presion", "when": [("ap_hi", ">=", 130), ("ap_lo", ">=", 85)], "days": 730},   # Pre-hipertensión
+    {"group": "colesterol", "when": [("cholesterol", "==", 3)], "days": 1825},  # Muy alto
+    {"group": "colesterol", "when": [("cholesterol", "==", 2)], "days": 730},   # Alto
+    {"group": "glucosa", "when": [("gluc", "==", 3)], "days": 1460},            # Muy alta
+    {"group": "glucosa", "when": [("gluc", "==", 2)], "days": 730},             # Alta
+    {"when": [("smoke", "!=", 0)], "days": 1825},                               # Fumador
+    {"when": [("alco", "!=", 0)], "days": 730},                                 # Consumo de alcohol
+    {"when": [("active", "==", 0)], "days": 1095},                              # Sedentarismo
+]
+
+# --- Recomendaciones: mensajes de cada regla, en el orden en que se muestran ---
+
+RECOMMENDATION_RULES: List[Dict] = [
+    # 1. Nivel de riesgo
+    {"id": "riesgo_extremo", "group": "riesgo", "when": [("probability", ">", 0.8)], "messages": [
+        "🚨 EMERGENCIA: Riesgo cardiovascular extremadamente alto (>80%)",
+        "🩺 Consulte a un cardiólogo dentro de las próximas 48 horas",
+        "📞 Contacte a su médico de cabecera inmediatamente"
+    ]},
+    {"id": "riesgo_alto", "group": "riesgo", "when": [("probability", ">", 0.6)], "messages": [
+        "⚠️ ALERTA: Riesgo cardiovascular alto (60-80%)",
+        "🩺 Programe cita con cardiólogo en los próximos 7 días",
+        "📝 Realice monitoreo diario de presión arterial"
+    ]},
+    # 2. Factores clave (en el orden de importancia de los factores del paciente)
+    {"id": "presion_elevada", "factor": "ap_hi", "when": [("ap_hi", ">", 140)], "messages": [
+        "💊 Presión arterial elevada: Tome sus medicamentos puntualmente",
+        "🧂 Reduzca consumo de sal a menos de 5g/día",
+        "📉 Objetivo: Menos de 135/85 mmHg en casa"
+    ]},
+    {"id": "colesterol_muy_alto", "factor": "cholesterol", "group": "colesterol",
+     "when": [("cholesterol", "==", 3)], "messages": [
+        "🩸 Colesterol muy elevado: Requiere tratamiento farmacológico",
+        "🍳 Elimine grasas trans y saturadas de su dieta",
+        "💊 Posible necesidad de estatinas (consulte a su médico)"
+    ]},
+    {"id": "colesterol", "factor": "cholesterol", "group": "colesterol", "when": [], "messages": [
+        "🥑 Aumente consumo de grasas saludables (aguacate, nueces)",
+        "🏃‍♂️ Ejercicio aeróbico 4x/semana para mejorar perfil lipídico"
+    ]},
+    # 3. IMC
+    {"id": "obesidad", "group": "imc", "when": [("imc", ">=", 30)], "messages": [
+        "⚖️ Obesidad: Pérdida de peso prioritaria (5-10% en 6 meses)",
+        "🍽️ Consulte a nutricionista para plan personalizado",
+        "🚶‍♂️ Caminatas diarias de 45 minutos como mínimo"
+    ]},
+    {"id": "sobrepeso", "group": "imc", "when": [("imc", ">=", 25)], "messages": [
+        "⚖️ Sobrepeso: Evite ganar más peso",
+        "🥗 Reduzca porciones y aumente vegetales",
+        "🏋️‍♂️ Combine cardio y entrenamiento de fuerza"
+    ]},
+    # 4. Hábitos específicos
+    {"id": "tabaquismo", "when": [("smoke", "==", 1)], "messages": [
+        "🚭 Tabaquismo: Programa de cesación tabáquica URGENTE",
+        "📱 Descargue app 'Dejar de Fumar' del Ministerio de Salud",
+        "☎️ Llame a la línea de ayuda 123-456-7890"
+    ]},
+    {"id": "sedentarismo", "when": [("active", "==", 0)], "messages": [
+        "🏃‍♂️ Sedentarismo: Comience con 10 minutos diarios de ejercicio",
+        "⏰ Use podómetro: Meta 8,000 pasos/día",
+        "🪑 Levantarse cada 30 minutos si trabaja sentado"
+    ]},
+    # 5. Recomendaciones generales
+    {"id": "generales", "when": [], "messages": [
+        "💧 Hidratación: 2L de agua/día (excepto contraindicación médica)",
+        "😌 Manejo de estrés: Técnicas de respiración 5 min/día",
+        "🛌 Sueño: 7-9 horas/noche en horario regular"
+    ]},
+]
+
+# Huella de las tablas: forma parte del ETag de las páginas de recomendaciones
+RULES_VERSION = hashlib.sha256(json.dumps(
+    [IMC_BINS.tolist(), SYSTOLIC_BINS.tolist(), DIASTOLIC_BINS.tolist(), RISK_BINS.tolist(),
+     METABOLIC_AGE_RULES, RECOMMENDATION_RULES], ensure_ascii=False
+).encode()).hexdigest()[:8]
+
+_OPERATORS = {
+    ">": np.greater, ">=": np.greater_equal,
+    "<": np.less, "<=": np.less_equal,
+    "==": np.equal, "!=": np.not_equal,
+}
+_METABOLIC_DAYS = np.array([rule["days"] for rule in METABOLIC_AGE_RULES])
+# Las reglas por factor se muestran juntas, en la posición de la primera de ellas
+_FACTOR_SLOT = min(i for i, rule in enumerate(RECOMMENDATION_RULES) if "factor" in rule)
+# Reglas que se informan en la puntuación masiva: no dependen de los factores clave
+# del paciente (que requieren las contribuciones) y no se cumplen siempre
+BATCH_RULES = [i for i, rule in enumerate(RECOMMENDATION_RULES) if "factor" not in rule and rule["when"]]
+
+
+def rule_columns(features: np.ndarray, probability: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Columnas con las que se evalúan las reglas; ``features`` es (n, 11) en el orden de FEATURE_NAMES"""
+    columns = {name: features[:, j] for j, name in enumerate(FEATURE_NAMES)}
+    # Altura guardada en cm: IMC = peso(kg) / altura²(m)
+    columns["imc"] = columns["weight"] / (columns["height"] / 100) ** 2
+    if probability is not None:
+        columns["probability"] = probability
+    return columns
+
+
+def _condition_mask(conditions: Sequence[Condition], columns: Dict[str, np.ndarray], n: int) -> np.ndarray:
+    if not conditions:
+        return np.ones(n, dtype=bool)
+    mask = np.zeros(n, dtype=bool)
+    for column, operator, threshold in conditions:
+        mask |= _OPERATORS[operator](columns[column], threshold)
+    return mask
+
+
+def evaluate_rules(rules: List[Dict], columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Matriz booleana (n, reglas) con las reglas que se cumplen en cada fila"""
+    n = len(columns["age"])
+    matched = np.zeros((n, len(rules)), dtype=bool)
+    taken: Dict[str, np.ndarray] = {}
+    for j, rule in enumerate(rules):
+        mask = _condition_mask(rule["when"], columns, n)
+        group = rule.get("group")
+        if group is not None:
+            previous = taken.get(group)
+            if previous is not None:
+                mask &= ~previous
+            taken[group] = mask if previous is None else previous | mask
+        matched[:, j] = mask
+    return matched
+
+
+def risk_index(probability: np.ndarray) -> np.ndarray:
+    return np.digitize(probability, RISK_BINS, right=True)
+
+
+def health_metrics(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """IMC, su categoría, categoría de presión arterial y edad metabólica (en días)"""
+    imc = columns["imc"]
+    bp_index = np.maximum(
+        np.digitize(columns["ap_hi"], SYSTOLIC_BINS),
+        np.digitize(columns["ap_lo"], DIASTOLIC_BINS)
+    )
+    adjustments = evaluate_rules(METABOLIC_AGE_RULES, columns) @ _METABOLIC_DAYS
+    return {
+        "imc": np.round(imc, 1),
+        "imc_category": IMC_LABELS[np.digitize(imc, IMC_BINS)],
+        "blood_pressure": BLOOD_PRESSURE_LABELS[bp_index],
+        "metabolic_age": columns["age"].astype(np.int64) + adjustments
+    }
+
+
+def recommendation_messages(matched: np.ndarray, factors: List[str]) -> List[str]:
+    """Mensajes de una fila de evaluate_rules(RECOMMENDATION_RULES, ...) para estos factores clave"""
+    selected = []
+    for j in np.flatnonzero(matched):
+        rule = RECOMMENDATION_RULES[j]
+        factor = rule.get("factor")
+        if factor is None:
+            selected.append((j, 0, j))
+        elif factor in factors:
+            selected.append((_FACTOR_SLOT, factors.index(factor), j))
+    return [message for _, _, j in sorted(selected) for message in RECOMMENDATION_RULES[j]["messages"]]
+
+
+def batch_rule_ids(matched: np.ndarray) -> List[List[str]]:
+    """Ids de las reglas de BATCH_RULES que cumple cada fila"""
+    ids = [RECOMMENDATION_RULES[j]["id"] for j in BATCH_RULES]
+    rows, cols = np.nonzero(matched[:, BATCH_RULES])
+    result: List[List[str]] = [[] for _ in range(len(matched))]
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        result[row].append(ids[col])
+    return result
@@ -0,0 +1,362 @@
+"""Métricas de la aplicación en formato de texto de Prometheus.
+
+- ``span(etapa)`` / ``@timed(etapa)`` miden una etapa (consulta, entrenamiento,
+  predicción, renderizado...) en un histograma y la suman al desglose de la
+  petición en curso.
+- ``MetricsMiddleware`` cuenta peticiones y mide su duración por ruta; si la
+  petición supera ``SLOW_REQUEST_SECONDS`` imprime su desglose por etapas.
+- ``metrics.render()`` produce el cuerpo de ``/metrics``.
+- ``startup`` guarda el desglose del arranque del proceso y qué partes están listas.
+- ``process_rss()`` / ``PeakRSS`` miden la memoria residente del proceso; con
+  ``PROFILE_ALLOCATIONS=1`` el middleware registra además el pico de memoria
+  reservada por petición (tracemalloc, con su coste: solo para diagnóstico).
+
+Todo se guarda en memoria del proceso con operaciones O(1) por observación.
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.templating import Jinja2Templates
+
+# Umbral del registro de peticiones lentas (sin definir: desactivado)
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0")) or None
+
+# Límites de los histogramas en segundos: desde etapas sub-milisegundo hasta entrenamientos
+DURATION_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0
+)
+
+# Pico de memoria por petición con tracemalloc (ralentiza el proceso: desactivado por defecto)
+PROFILE_ALLOCATIONS = os.getenv("PROFILE_ALLOCATIONS", "0") == "1"
+# Intervalo de muestreo de PeakRSS
+RSS_SAMPLE_SECONDS = 0.05
+
+# Límites de los histogramas de memoria en bytes: de 16 KiB a 1 GiB
+MEMORY_BUCKETS = tuple(float(2 ** exponent) for exponent in range(14, 31, 2))
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):  # sin sysconf (p. ej. Windows)
+    _PAGE_SIZE = 4096
+
+# Tiempo acumulado por etapa de la petición en curso
+_request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Histograma acumulativo con límites fijos"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Contadores, gauges e histogramas etiquetados"""
+
+    def __init__(self):
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: Optional[Tuple[float, ...]] = None):
+        self._help[name] = (kind, help_text)
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str):
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        self._gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels: str):
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self._buckets.get(name, DURATION_BUCKETS))
+        histogram.observe(value)
+
+    @staticmethod
+    def _labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = key + extra
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def _header(self, lines: List[str], name: str, default_kind: str):
+        kind, help_text = self._help.get(name, (default_kind, name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, series in self._counters.items():
+            self._header(lines, name, "counter")
+            lines.extend(f"{name}{self._labels(key)} {value}" for key, value in series.items())
+        for name, series in self._gauges.items():
+            self._header(lines, name, "gauge")
+            lines.extend(f"{name}{self._labels(key)} {value}" for key, value in series.items())
+        for name, series in self._histograms.items():
+            self._header(lines, name, "histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(key, (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(key, (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{self._labels(key)} {histogram.sum}")
+                lines.append(f"{name}_count{self._labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("http_requests_total", "counter", "Peticiones HTTP atendidas")
+metrics.describe("http_request_duration_seconds", "histogram", "Duración de las peticiones HTTP")
+metrics.describe("stage_duration_seconds", "histogram", "Duración de cada etapa instrumentada")
+metrics.describe("stage_errors_total", "counter", "Etapas que terminaron con excepción")
+metrics.describe("slow_requests_total", "counter", "Peticiones por encima de SLOW_REQUEST_SECONDS")
+metrics.describe("startup_stage_seconds", "gauge", "Duración de cada etapa del arranque")
+metrics.describe("process_rss_bytes", "gauge", "Memoria residente del proceso")
+metrics.describe("http_request_alloc_peak_bytes", "histogram",
+                 "Pico de memoria reservada durante la petición (PROFILE_ALLOCATIONS=1)", MEMORY_BUCKETS)
+
+
+def process_rss() -> Optional[int]:
+    """Memoria residente actual del proceso en bytes (Linux); None si no se puede leer"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PeakRSS:
+    """Pico de memoria residente del proceso mientras dura el bloque, muestreado en un hilo.
+
+    ``peak`` es el máximo observado y ``growth`` lo que creció sobre el valor inicial.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.baseline: Optional[int] = None
+        self.peak: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def growth(self) -> Optional[int]:
+        if self.peak is None or self.baseline is None:
+            return None
+        return self.peak - self.baseline
+
+    def _sample(self):
+        rss = process_rss()
+        if rss is not None:
+            self.peak = max(self.peak or 0, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.baseline = self.peak = process_rss()
+        if self.baseline is not None:
+            self._thread = threading.Thread(target=self._run, name="peak-rss", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._sample()
+        return False
+
+
+class span:
+    """Mide una etapa: ``with span("db.get_record_by_id"): ...``"""
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        metrics.observe("stage_duration_seconds", elapsed, stage=self.stage)
+        if exc_type is not None:
+            metrics.inc("stage_errors_total", stage=self.stage)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[self.stage] = stages.get(self.stage, 0.0) + elapsed
+        return False
+
+
+def timed(stage: str):
+    """Decorador que envuelve una función (síncrona o async) en ``span(stage)``"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StartupReport:
+    """Desglose del arranque por etapas y componentes listos (``crud``, ``model``...)"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.ready: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def begin(self, started: float):
+        """Fija el origen de tiempos (p. ej. antes de los imports de main)"""
+        self.started = started
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = round(seconds, 4)
+        metrics.set_gauge("startup_stage_seconds", seconds, stage=stage)
+
+    def stage(self, stage: str) -> "_StartupStage":
+        """``with startup.stage("db.init"): ...``"""
+        return _StartupStage(self, stage)
+
+    def mark_ready(self, component: str):
+        """Anota el segundo (desde el arranque) en que ``component`` quedó listo"""
+        self.ready.setdefault(component, round(time.perf_counter() - self.started, 4))
+
+    def is_ready(self, component: str) -> bool:
+        return component in self.ready
+
+    def status(self) -> Dict:
+        return {"stages": dict(self.stages), "ready_after_seconds": dict(self.ready)}
+
+
+class _StartupStage:
+    __slots__ = ("report", "stage", "started")
+
+    def __init__(self, report: StartupReport, stage: str):
+        self.report = report
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.report.record(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+startup = StartupReport()
+
+
+class InstrumentedTemplates(Jinja2Templates):
+    """Jinja2Templates que mide el renderizado de cada plantilla"""
+
+    def TemplateResponse(self, *args, **kwargs):
+        name = args[0] if args and isinstance(args[0], str) else kwargs.get("name", "")
+        with span(f"template.render:{name}"):
+            return super().TemplateResponse(*args, **kwargs)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: cuenta y mide cada petición por plantilla de ruta.
+
+    Se implementa sobre ASGI directamente (no BaseHTTPMiddleware) para no añadir
+    una tarea por petición ni interferir con las respuestas en streaming.
+    """
+
+    def __init__(self, app, slow_request_seconds: Optional[float] = SLOW_REQUEST_SECONDS,
+                 profile_allocations: bool = PROFILE_ALLOCATIONS):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+        self.profile_allocations = profile_allocations
+        if profile_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stages: Dict[str, float] = {}
+        token = _request_stages.set(stages)
+        # Con peticiones concurrentes el pico incluye lo que reservan las demás: es una cota superior
+        allocated_before = None
+        if self.profile_allocations:
+            tracemalloc.reset_peak()
+            allocated_before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            alloc_peak = None
+            if allocated_before is not None:
+                alloc_peak = max(0, tracemalloc.get_traced_memory()[1] - allocated_before)
+            _request_stages.reset(token)
+            # Plantilla de la ruta (p. ej. /records/{record_id}) para no disparar la cardinalidad
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            metrics.inc("http_requests_total", method=method, route=route, status=str(status_code))
+            metrics.observe("http_request_duration_seconds", elapsed, method=method, route=route)
+            if alloc_peak is not None:
+                metrics.observe("http_request_alloc_peak_bytes", alloc_peak, method=method, route=route)
+            if self.slow_request_seconds is not None and elapsed >= self.slow_request_seconds:
+                metrics.inc("slow_requests_total", route=route)
+                print("Petición lenta: " + json.dumps({
+                    "method": method,
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status_code,
+                    "seconds": round(elapsed, 4),
+                    "alloc_peak_bytes": alloc_peak,
+                    "stages": {stage: round(seconds, 4) for stage, seconds in stages.items()}
+                }, ensure_ascii=False))
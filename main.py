@@ -1,13 +1,38 @@
-from fastapi import FastAPI, HTTPException, status, Request, Depends, Form
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+import time
+_imports_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, status, Request, Depends, Form, Query, UploadFile, File
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+from typing import Optional
+from urllib.parse import urlencode
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 
-from database_model import CardioHealthCreate, CardioHealthUpdate, CardioHealthResponse
-from db_operations import CardioHealthOperations
-from connection_db import init_db, get_session, get_async_session
-from sqlalchemy.ext.asyncio import AsyncSession
+from api import CompressionMiddleware, router as api_router
+from database_model import CardioHealthCreate, CardioHealthUpdate, CardioHealthResponse, BatchScoringRequest, CohortFilter
+from db_operations import CardioHealthOperations, FILTERABLE_COLUMNS, SORTABLE_COLUMNS, write_batcher
+from connection_db import init_db, get_session, pool_status
+from instrumentation import InstrumentedTemplates, MetricsMiddleware, metrics, process_rss, startup
+from population_stats import ensure_summary, load_summary, rebuild_summary
+from feature_store import feature_store
+from health_rules import RULES_VERSION
+from page_cache import page_cache
+from recommendations import import_ml_stack, recommendation_system
+from scoring_client import SCORING_SOCKET, ScoringClient
+from training import training_scheduler
+
+# sklearn y pandas no se importan aquí (ver recommendations.py): se cargan en warm_up
+startup.begin(_imports_started)
+startup.record("imports", time.perf_counter() - _imports_started)
+
+# Etiquetas de presentación de los niveles de colesterol y glucosa
+LEVEL_LABELS = {1: "Normal", 2: "Alto", 3: "Muy alto"}
+
+def level_label(value):
+    return LEVEL_LABELS.get(value, "Muy alto")
 
 def setup_jinja_filters(templates):
     def days_to_years(days):
@@ -18,22 +43,98 @@ def setup_jinja_filters(templates):
     
     templates.env.filters["days_to_years"] = days_to_years
     templates.env.filters["cm_to_meters"] = cm_to_meters
+    templates.env.filters["level_label"] = level_label
+
+def table_rows(records) -> list:
+    """Filas de table_view.html con las etiquetas ya calculadas (sin filtros ni if/elif por fila)"""
+    return [
+        {
+            "id": record.id,
+            "age_years": int(record.age / 365),
+            "gender": "Hombre" if record.gender == 1 else "Mujer",
+            "ap_hi": record.ap_hi,
+            "ap_lo": record.ap_lo,
+            "cholesterol": level_label(record.cholesterol),
+            "gluc": level_label(record.gluc)
+        }
+        for record in records
+    ]
+
+async def warm_up():
+    """Calentamiento en segundo plano: el CRUD ya se sirve mientras se prepara el modelo"""
+    loop = asyncio.get_running_loop()
+    try:
+        if recommendation_system.scorer is not None:
+            # El modelo lo tiene el servicio de puntuación: el worker no lo carga
+            with startup.stage("model.scoring_service"):
+                if await recommendation_system.model_available():
+                    startup.mark_ready("model")
+            with startup.stage("training.load_snapshot"):
+                await loop.run_in_executor(None, training_scheduler.load_snapshot)
+            return
+        with startup.stage("model.import_ml_stack"):
+            await loop.run_in_executor(None, import_ml_stack)
+        # Arranque en caliente: cargar el modelo ya entrenado por otro worker o ejecución
+        with startup.stage("model.load_from_store"):
+            await recommendation_system.warm_up()
+        with startup.stage("training.load_snapshot"):
+            await loop.run_in_executor(None, training_scheduler.load_snapshot)
+        if recommendation_system.is_trained():
+            startup.mark_ready("model")
+    except Exception as e:
+        print(f"Error en el calentamiento del modelo: {e}")
+    print("Calentamiento: " + json.dumps(startup.status()))
+
+async def load_feature_store():
+    with startup.stage("feature_store.load"):
+        await CardioHealthOperations.load_feature_store()
+    startup.mark_ready("feature_store")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
+    with startup.stage("db.init"):
+        await init_db()
+    with startup.stage("stats.ensure_summary"):
+        await ensure_summary()
+    with startup.stage("page_cache.sync"):
+        await CardioHealthOperations.sync_page_versions()
+    startup.mark_ready("crud")
+    print("Arranque: " + json.dumps(startup.status()))
+    if SCORING_SOCKET:
+        recommendation_system.scorer = ScoringClient()
+    warm_up_task = recommendation_system.warm_up_task = asyncio.create_task(warm_up())
+    refresh_task = asyncio.create_task(CardioHealthOperations.run_refresh_policy())
+    # El almacén de características se carga en segundo plano; hasta entonces se lee de la base
+    feature_store_task = asyncio.create_task(load_feature_store())
+    page_sync_task = asyncio.create_task(CardioHealthOperations.run_page_version_sync())
     yield
+    await write_batcher.drain()
+    page_sync_task.cancel()
+    warm_up_task.cancel()
+    feature_store_task.cancel()
+    refresh_task.cancel()
+    training_scheduler.shutdown()
+    if recommendation_system.scorer is not None:
+        recommendation_system.scorer.close()
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.include_router(api_router)
 
 # Archivos estáticos (CSS/JS)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Templates HTML
-templates = Jinja2Templates(directory="templates")
+templates = InstrumentedTemplates(directory="templates")
+# Las plantillas compiladas se reutilizan sin comprobar el fichero en cada renderizado
+templates.env.auto_reload = os.getenv("TEMPLATES_AUTO_RELOAD", "false").lower() == "true"
 
 setup_jinja_filters(templates)
 
+# ?explain=true en /records/search devuelve el plan de la consulta: solo para depuración
+SEARCH_EXPLAIN = os.getenv("SEARCH_EXPLAIN", "false").lower() == "true"
+
 # Ruta de inicio
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -42,17 +143,103 @@ async def home(request: Request):
 @app.get("/records")
 async def display_table(
     request: Request,
-    page: int = 1,
-    session: AsyncSession = Depends(get_async_session)
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    order: str = "asc",
+    per_page: int = Query(100, ge=1, le=500)
 ):
-    result = await CardioHealthOperations.get_all_records(session, page=page)
-    return templates.TemplateResponse("table_view.html", {
+    etag = page_cache.list_etag("records", request.url.query)
+    cached = page_cache.cached_response(request, etag)
+    if cached is not None:
+        return cached
+    try:
+        filters = {
+            column: int(request.query_params[column])
+            for column in FILTERABLE_COLUMNS
+            if request.query_params.get(column, "") != ""
+        }
+    except ValueError:
+        filters = None
+    try:
+        if filters is None:
+            raise HTTPException(status_code=400, detail="Los filtros deben ser números enteros")
+        # Réplica solo si ya refleja las marcas del ETag (si no, el principal)
+        async with CardioHealthOperations.page_read_session() as session:
+            result = await CardioHealthOperations.get_all_records(
+                session, cursor=cursor, per_page=per_page, sort=sort, order=order, filters=filters)
+    except HTTPException as e:
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error_message": e.detail
+        }, status_code=e.status_code)
+
+    # Parámetros que se conservan al navegar entre páginas
+    query_base = urlencode({"sort": sort, "order": order, "per_page": per_page, **filters})
+    return page_cache.store(request, etag, templates.TemplateResponse("table_view.html", {
         "request": request,
-        "records": result["data"],
-        "page": result["page"],
+        "rows": table_rows(result["data"]),
         "per_page": result["per_page"],
-        "total": result["total"]
-    })
+        "total": result["total"],
+        "next_cursor": result["next_cursor"],
+        "prev_cursor": result["prev_cursor"],
+        "sort": result["sort"],
+        "order": result["order"],
+        "filters": result["filters"],
+        "sortable_columns": SORTABLE_COLUMNS,
+        "query_base": query_base,
+        "base_path": "/records",
+        "hidden_params": {}
+    }))
+
+@app.get("/records/search")
+async def search_records(
+    request: Request,
+    cohort: CohortFilter = Depends(),
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    order: str = "asc",
+    per_page: int = Query(100, ge=1, le=500),
+    explain: bool = False
+):
+    # Cohortes, p. ej. /records/search?smoke=1&age_min=56&cholesterol=3
+    if explain and not SEARCH_EXPLAIN:
+        raise HTTPException(status_code=404, detail="EXPLAIN deshabilitado (SEARCH_EXPLAIN)")
+    etag = None if explain else page_cache.list_etag("search", request.url.query)
+    cached = page_cache.cached_response(request, etag)
+    if cached is not None:
+        return cached
+    conditions = CardioHealthOperations.cohort_conditions(cohort)
+    try:
+        async with CardioHealthOperations.page_read_session() as session:
+            result = await CardioHealthOperations.get_all_records(
+                session, cursor=cursor, per_page=per_page, sort=sort, order=order,
+                conditions=conditions, explain=explain)
+    except HTTPException as e:
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error_message": e.detail
+        }, status_code=e.status_code)
+    if explain:
+        return result
+
+    cohort_params = cohort.model_dump(exclude_none=True)
+    query_base = urlencode({"sort": sort, "order": order, "per_page": per_page, **cohort_params})
+    return page_cache.store(request, etag, templates.TemplateResponse("table_view.html", {
+        "request": request,
+        "rows": table_rows(result["data"]),
+        "per_page": result["per_page"],
+        "total": result["total"],
+        "next_cursor": result["next_cursor"],
+        "prev_cursor": result["prev_cursor"],
+        "sort": result["sort"],
+        "order": result["order"],
+        "filters": cohort_params,
+        "sortable_columns": SORTABLE_COLUMNS,
+        "query_base": query_base,
+        "base_path": "/records/search",
+        # Criterios de la cohorte que el formulario no muestra pero debe conservar
+        "hidden_params": {k: v for k, v in cohort_params.items() if k not in ("cholesterol", "gluc")}
+    }))
 
 from fastapi import Form
 
@@ -70,8 +257,7 @@ async def create_record(
     smoke: int = Form(default=0),
     alco: int = Form(default=0),
     active: int = Form(default=0),
-    cardio: int = Form(default=0),
-    session: AsyncSession = Depends(get_async_session)
+    cardio: int = Form(default=0)
 ):
     try:
         record_data = {
@@ -88,14 +274,14 @@ async def create_record(
             "active": active,
             "cardio": cardio
         }
-        new_record = await CardioHealthOperations.add_record(session, record_data)
+        # Sesión propia o lote compartido con otras altas concurrentes (WRITE_BATCHING)
+        new_record = await CardioHealthOperations.create_record(record_data)
         # Redirigir a la página de éxito con el ID del nuevo registro
         return RedirectResponse(
             url=f"/success?id={new_record.id}",
             status_code=status.HTTP_303_SEE_OTHER
         )
     except Exception as e:
-        await session.rollback()
         return templates.TemplateResponse(
             "error.html",
             {
@@ -105,16 +291,60 @@ async def create_record(
             status_code=400
         )
 
+@app.post("/records/import")
+async def bulk_import_records(
+    file: UploadFile = File(...),
+    format: str = Form("csv"),
+    sep: str = Form(","),
+    age_unit: str = Form("days"),
+    height_unit: str = Form("cm"),
+    gender_coding: str = Form("01")
+):
+    # Importación masiva por bloques; devuelve filas/seg y filas rechazadas
+    from bulk_import import import_records
+    try:
+        return await import_records(file.file, format, sep=sep, age_unit=age_unit,
+                                    height_unit=height_unit, gender_coding=gender_coding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/records/export")
+async def export_records(
+    format: str = "csv",
+    with_risk: bool = False,
+    cohort: CohortFilter = Depends()
+):
+    # Exportación en streaming: memoria constante sin importar el tamaño de la tabla
+    from bulk_export import EXPORT_FORMATS, check_format, export_stream
+    try:
+        # Antes de la respuesta: una vez enviadas las cabeceras ya no se puede devolver un 400
+        check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if with_risk:
+        await CardioHealthOperations.ensure_model()
+    return StreamingResponse(
+        export_stream(format, cohort, with_risk),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="cardiohealth.{format}"'}
+    )
+
 @app.get("/records/{record_id}", response_class=HTMLResponse)
-async def read_record(request: Request, record_id: int, session: AsyncSession = Depends(get_async_session)):
+async def read_record(request: Request, record_id: int):
+    # Sin dependencia de sesión: un 304 o una página en caché no abren conexión
+    etag = page_cache.record_etag("detail", record_id)
+    cached = page_cache.cached_response(request, etag)
+    if cached is not None:
+        return cached
     try:
-        record = await CardioHealthOperations.get_record_by_id(session, record_id)
+        async with CardioHealthOperations.page_read_session() as session:
+            record = await CardioHealthOperations.get_record_by_id(session, record_id)
         if not record:
             raise HTTPException(status_code=404, detail="Registro no encontrado")
-        return templates.TemplateResponse("record_detail.html", {
+        return page_cache.store(request, etag, templates.TemplateResponse("record_detail.html", {
             "request": request,
             "record": record
-        })
+        }))
     except HTTPException as e:
         return templates.TemplateResponse("error.html", {
             "request": request,
@@ -135,29 +365,145 @@ async def update_record(record_id: int, record: CardioHealthUpdate):
             raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/records/{record_id}/recommendations", response_class=HTMLResponse)
-async def get_recommendations(request: Request, record_id: int, session: AsyncSession = Depends(get_async_session)):
+async def get_recommendations(request: Request, record_id: int):
+    # La página depende también del modelo y de las reglas: sin modelo no hay ETag hasta entrenarlo
+    model_version = recommendation_system.current_version()
+    etag = page_cache.record_etag("recommendations", record_id, model_version, RULES_VERSION) if model_version else None
+    cached = page_cache.cached_response(request, etag)
+    if cached is not None:
+        return cached
     try:
-        record = await CardioHealthOperations.get_record_by_id(session, record_id)
-        if not record:
-            raise HTTPException(status_code=404, detail="Registro no encontrado")
-            
-        recommendations_response = await CardioHealthOperations.get_recommendations(session, record_id)
+        # get_recommendations ya obtiene el registro (404 si no existe): una sola lectura
+        async with get_session() as session:
+            recommendations_response = await CardioHealthOperations.get_recommendations(session, record_id)
         if not recommendations_response.get("success"):
             raise HTTPException(status_code=404, detail=recommendations_response.get("message", "Error al obtener recomendaciones"))
-            
-        return templates.TemplateResponse("recommendations.html", {
+        if recommendation_system.current_version() != model_version:
+            etag = page_cache.record_etag("recommendations", record_id, recommendation_system.current_version(),
+                                          RULES_VERSION)
+
+        return page_cache.store(request, etag, templates.TemplateResponse("recommendations.html", {
             "request": request,
             "record_id": record_id,
-            "record": record,
+            "record": recommendations_response["record"],
             "recommendations": recommendations_response["data"],
             "message": recommendations_response["message"]
-        })
+        }))
     except HTTPException as e:
         return templates.TemplateResponse("error.html", {
             "request": request,
             "error_message": e.detail
         }, status_code=e.status_code)
 
+@app.get("/recommendations/cache")
+async def recommendation_cache_stats():
+    return {"model_version": recommendation_system.current_version(), **recommendation_system.cache.stats()}
+
+@app.get("/pages/cache")
+async def page_cache_stats():
+    return page_cache.status()
+
+@app.post("/recommendations/batch")
+async def batch_recommendations(request: BatchScoringRequest):
+    # Validar y entrenar antes de empezar a transmitir, para poder responder con error
+    query = CardioHealthOperations.build_batch_query(request.ids, request.filters, request.limit, request.cohort)
+    await CardioHealthOperations.ensure_model()
+    if feature_store.loaded:
+        await CardioHealthOperations.sync_feature_store()
+        rows = CardioHealthOperations.feature_store_rows(request.ids, request.filters, request.limit, request.cohort)
+        batches = CardioHealthOperations.stream_feature_store_scores(rows, include_rules=request.include_rules)
+    else:
+        batches = CardioHealthOperations.stream_batch_scores(query, include_rules=request.include_rules)
+
+    async def ndjson():
+        async for rows in batches:
+            yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/db/pool")
+async def db_pool_status():
+    return pool_status()
+
+@app.get("/stats")
+async def population_stats():
+    # Lectura de la tabla de resumen: no depende del tamaño de cardiohealth
+    return await load_summary()
+
+@app.get("/stats/dashboard", response_class=HTMLResponse)
+async def stats_dashboard(request: Request):
+    return templates.TemplateResponse("stats.html", {
+        "request": request,
+        "stats": await load_summary()
+    })
+
+@app.post("/stats/rebuild")
+async def rebuild_stats():
+    # Recalcula los contadores desde la tabla (p. ej. tras cargas hechas fuera de la API)
+    total = await rebuild_summary()
+    return {"total_records": total}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    # Valores instantáneos que se leen en el momento del scrape
+    for engine_name, pool in pool_status().items():
+        for field in ("checked_out", "saturation", "wait_mean_ms", "wait_max_ms"):
+            if pool.get(field) is not None:
+                metrics.set_gauge(f"db_pool_{field}", pool[field], engine=engine_name)
+    cache = recommendation_system.cache.stats()
+    for field in ("size", "hits", "misses", "evictions"):
+        metrics.set_gauge(f"recommendation_cache_{field}", cache[field])
+    metrics.set_gauge("training_running", int(training_scheduler.is_running()))
+    rss = process_rss()
+    if rss is not None:
+        metrics.set_gauge("process_rss_bytes", rss)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+async def _readiness() -> dict:
+    model_ready = await recommendation_system.model_available()
+    if model_ready:
+        startup.mark_ready("model")
+    return {
+        "crud": startup.is_ready("crud"),
+        "model": model_ready,
+        "feature_store": feature_store.loaded,
+        "startup": startup.status()
+    }
+
+@app.get("/ready")
+async def ready():
+    # Listo para servir el CRUD; el modelo puede seguir cargándose (ver /ready/model)
+    readiness = await _readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["crud"] else 503)
+
+@app.get("/ready/model")
+async def ready_model():
+    # Listo para servir recomendaciones sin esperar a un entrenamiento
+    readiness = await _readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["model"] else 503)
+
+@app.get("/model/status")
+async def model_status():
+    return {**training_scheduler.status(), "feature_store": feature_store.status(),
+            "memory": recommendation_system.memory_status()}
+
+@app.post("/model/reload")
+async def reload_model():
+    # Carga los hiperparámetros promovidos por model_search y su último modelo guardado
+    # (lectura y preparación en el pool de hilos, como al arrancar)
+    if not await recommendation_system.warm_up():
+        CardioHealthOperations.schedule_training()
+    return training_scheduler.status()
+
+@app.post("/model/train", status_code=status.HTTP_202_ACCEPTED)
+async def train_model(incremental: bool = False):
+    # Reentrena en segundo plano; mientras tanto se sigue sirviendo el modelo actual
+    if incremental:
+        CardioHealthOperations.schedule_refresh()
+    else:
+        CardioHealthOperations.schedule_training()
+    return training_scheduler.status()
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
@@ -170,14 +516,19 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 @app.get("/success", response_class=HTMLResponse)
 async def success_page(
     request: Request,
-    id: int,
-    session: AsyncSession = Depends(get_async_session)
+    id: int
 ):
-    record = await CardioHealthOperations.get_record_by_id(session, id)
-    return templates.TemplateResponse(
+    etag = page_cache.record_etag("success", id)
+    cached = page_cache.cached_response(request, etag)
+    if cached is not None:
+        return cached
+    async with get_session() as session:
+        record = await CardioHealthOperations.get_record_by_id(session, id)
+    response = templates.TemplateResponse(
         "success.html",
         {
             "request": request,
             "record": record
         }
-    )
\ No newline at end of file
+    )
+    return page_cache.store(request, etag, response) if record else response
\ No newline at end of file
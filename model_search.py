@@ -0,0 +1,197 @@
+"""Búsqueda de hiperparámetros y evaluación del RandomForest, fuera de línea.
+
+Evalúa con validación cruzada estratificada un conjunto de configuraciones sobre un
+snapshot de la tabla, repartiendo los candidatos entre núcleos con joblib (los
+arrays se comparten con memmap). Para cada candidato mide AUC y exactitud frente
+al tiempo de ajuste, la latencia de inferencia por paciente (backend servido) y el
+tamaño del modelo. La configuración elegida se puede promover: se entrena con
+todos los datos, se guarda en el almacén de modelos y pasa a ser la que sirven los
+workers (al arrancar o con ``POST /model/reload``).
+
+Uso por línea de comandos:
+
+    python model_search.py --candidates 12 --folds 3 --workers 4 --promote
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import pickle
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.metrics import accuracy_score, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+
+from flat_forest import FlatForest
+from model_store import model_store
+from recommendations import MODEL_PARAMS, fit_forest
+
+# Espacio de búsqueda; cada candidato parte de MODEL_PARAMS y sobrescribe estas claves
+SEARCH_GRID = {
+    "n_estimators": [50, 100, 150, 300],
+    "max_depth": [6, 8, 10, 14],
+    "min_samples_split": [5, 20],
+    "max_features": ["sqrt", 0.5],
+}
+SEARCH_FOLDS = 3
+SEARCH_CANDIDATES = 12
+# Pérdida de AUC aceptable para preferir un modelo más rápido o más pequeño
+SEARCH_AUC_TOLERANCE = 0.002
+# Pacientes con los que se mide la latencia de inferencia uno a uno
+LATENCY_SAMPLES = 200
+
+
+def candidate_params(grid: Dict[str, List] = SEARCH_GRID, n_candidates: Optional[int] = SEARCH_CANDIDATES,
+                     seed: int = 42) -> List[Dict]:
+    """Combinaciones de la rejilla (muestreadas si hay más de ``n_candidates``), más la actual"""
+    combos = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    if n_candidates and len(combos) > n_candidates:
+        combos = random.Random(seed).sample(combos, n_candidates)
+    candidates = [{**MODEL_PARAMS, **combo} for combo in combos]
+    # La configuración servida siempre entra como referencia
+    if MODEL_PARAMS not in candidates:
+        candidates.insert(0, dict(MODEL_PARAMS))
+    return candidates
+
+
+def _inference_latency(model, features: np.ndarray) -> Tuple[float, float]:
+    """p50 y p99 en ms de la predicción de un paciente con el bosque aplanado"""
+    forest = FlatForest(model)
+    timings = []
+    for row in features[:LATENCY_SAMPLES]:
+        started = time.perf_counter()
+        forest.predict_proba(row[None, :])
+        timings.append(time.perf_counter() - started)
+    timings = np.array(timings) * 1000
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def evaluate_candidate(features: np.ndarray, target: np.ndarray, params: Dict,
+                       folds: int = SEARCH_FOLDS, seed: int = 42) -> Dict:
+    """Validación cruzada de una configuración; función de módulo para ejecutarse en otro proceso"""
+    # Un núcleo por candidato: el paralelismo está en la búsqueda
+    params = {**params, "n_jobs": 1}
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    aucs, accuracies, fit_seconds = [], [], []
+    model = None
+    for train_index, test_index in splitter.split(features, target):
+        started = time.perf_counter()
+        model = fit_forest(features[train_index], target[train_index], params)
+        fit_seconds.append(time.perf_counter() - started)
+        proba = FlatForest(model).predict_proba(features[test_index])
+        aucs.append(roc_auc_score(target[test_index], proba))
+        accuracies.append(accuracy_score(target[test_index], proba >= 0.5))
+
+    latency_p50, latency_p99 = _inference_latency(model, features[test_index])
+    params.pop("n_jobs")
+    return {
+        "params": params,
+        "auc": round(float(np.mean(aucs)), 5),
+        "auc_std": round(float(np.std(aucs)), 5),
+        "accuracy": round(float(np.mean(accuracies)), 5),
+        "fit_seconds": round(float(np.mean(fit_seconds)), 3),
+        "latency_p50_ms": round(latency_p50, 4),
+        "latency_p99_ms": round(latency_p99, 4),
+        "model_bytes": len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)),
+        "n_nodes": int(sum(tree.tree_.node_count for tree in model.estimators_))
+    }
+
+
+def run_search(features: np.ndarray, target: np.ndarray, candidates: List[Dict],
+               folds: int = SEARCH_FOLDS, workers: int = -1, seed: int = 42) -> List[Dict]:
+    """Evalúa los candidatos en paralelo; joblib comparte ``features`` con memmap"""
+    results = Parallel(n_jobs=workers, verbose=5)(
+        delayed(evaluate_candidate)(features, target, params, folds, seed) for params in candidates
+    )
+    return sorted(results, key=lambda result: result["auc"], reverse=True)
+
+
+def select_candidate(results: List[Dict], tolerance: float = SEARCH_AUC_TOLERANCE) -> Dict:
+    """El más rápido en inferencia entre los que están a ``tolerance`` del mejor AUC"""
+    best_auc = max(result["auc"] for result in results)
+    eligible = [result for result in results if result["auc"] >= best_auc - tolerance]
+    return min(eligible, key=lambda result: (result["latency_p99_ms"], result["model_bytes"]))
+
+
+def promote(features: np.ndarray, target: np.ndarray, chosen: Dict, report: Dict) -> str:
+    """Entrena la configuración elegida con todos los datos y la publica para servirse"""
+    params = chosen["params"]
+    key = model_store.make_key(model_store.dataset_fingerprint(features, target), params)
+    if model_store.load(key) is None:
+        model = fit_forest(features, target, params)
+        model_store.save(key, model, params, len(target))
+    model_store.save_promoted_params(params, report)
+    return key
+
+
+async def load_snapshot_arrays() -> Tuple[np.ndarray, np.ndarray]:
+    """Snapshot persistido por el entrenamiento o, si no existe, lectura de la tabla"""
+    arrays = model_store.load_snapshot()
+    if arrays is not None:
+        return arrays["features"], arrays["target"]
+    from db_operations import CardioHealthOperations
+    snapshot = await CardioHealthOperations.load_training_snapshot()
+    return snapshot.features, snapshot.target
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Búsqueda de hiperparámetros del modelo de riesgo")
+    parser.add_argument("--candidates", type=int, default=SEARCH_CANDIDATES,
+                        help="Configuraciones muestreadas de la rejilla (0: todas)")
+    parser.add_argument("--folds", type=int, default=SEARCH_FOLDS)
+    parser.add_argument("--workers", type=int, default=-1, help="Procesos (-1: todos los núcleos)")
+    parser.add_argument("--sample", type=int, default=None, help="Usar solo N filas del snapshot")
+    parser.add_argument("--tolerance", type=float, default=SEARCH_AUC_TOLERANCE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Informe JSON (por defecto en el almacén de modelos)")
+    parser.add_argument("--promote", action="store_true", help="Promover la configuración elegida")
+    args = parser.parse_args(argv)
+
+    full_features, full_target = asyncio.run(load_snapshot_arrays())
+    features, target = full_features, full_target
+    if args.sample and args.sample < len(target):
+        rows = np.sort(np.random.default_rng(args.seed).choice(len(target), args.sample, replace=False))
+        features, target = full_features[rows], full_target[rows]
+
+    candidates = candidate_params(SEARCH_GRID, args.candidates, args.seed)
+    print(f"Evaluando {len(candidates)} configuraciones sobre {len(target)} filas ({args.folds} folds)")
+    started = time.perf_counter()
+    results = run_search(features, target, candidates, args.folds, args.workers, args.seed)
+    chosen = select_candidate(results, args.tolerance)
+
+    report = {
+        "created_at": time.time(),
+        "rows": len(target),
+        "folds": args.folds,
+        "tolerance": args.tolerance,
+        "search_seconds": round(time.perf_counter() - started, 1),
+        "chosen": chosen,
+        "results": results
+    }
+    if args.promote:
+        # El modelo promovido se entrena con todas las filas, no con la muestra
+        report["promoted_key"] = promote(full_features, full_target, chosen, report)
+
+    output = args.output or str(model_store.directory / f"search-{int(report['created_at'])}.json")
+    model_store.directory.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    print(f"{'AUC':>8} {'acc':>7} {'fit s':>7} {'p99 ms':>8} {'MB':>6}  params")
+    for result in results:
+        marker = "*" if result is chosen else " "
+        print(f"{marker}{result['auc']:>7} {result['accuracy']:>7} {result['fit_seconds']:>7} "
+              f"{result['latency_p99_ms']:>8} {result['model_bytes'] / 2 ** 20:>6.1f}  "
+              f"n={result['params']['n_estimators']} depth={result['params']['max_depth']} "
+              f"split={result['params']['min_samples_split']} features={result['params']['max_features']}")
+    if args.promote:
+        print(f"Promovido {report['promoted_key']}: los workers lo cargan al arrancar o con POST /model/reload")
+    print(f"Informe en {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# Versión del formato de artefacto; subirla invalida los modelos guardados
+MODEL_FORMAT_VERSION = 1
+
+# Directorio compartido por todos los workers (configurable por entorno)
+MODEL_DIR = Path(os.getenv("MODEL_DIR", Path(__file__).parent / "models"))
+
+
+def _sklearn_version() -> str:
+    # Import diferido: joblib/sklearn solo se cargan al guardar o leer un modelo
+    import sklearn
+    return sklearn.__version__
+
+
+class ModelStore:
+    """Almacén en disco de modelos entrenados, serializados con joblib"""
+
+    def __init__(self, directory: Path = MODEL_DIR):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def dataset_fingerprint(features: np.ndarray, target: np.ndarray) -> str:
+        """Huella SHA-256 del conjunto de entrenamiento (matriz + etiquetas).
+
+        Se calcula sobre lo que ve sklearn (características en float32, etiquetas en
+        int64), así el snapshot de la BD y el feature store dan la misma huella.
+        """
+        digest = hashlib.sha256()
+        for array, dtype in ((features, np.float32), (target, np.int64)):
+            array = np.ascontiguousarray(array, dtype=dtype)
+            digest.update(str(array.shape).encode())
+            digest.update(str(array.dtype).encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def params_hash(params: Dict[str, Any]) -> str:
+        """Hash estable de los hiperparámetros y versiones que afectan al artefacto"""
+        payload = {
+            "params": params,
+            "format": MODEL_FORMAT_VERSION,
+            "sklearn": _sklearn_version(),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def make_key(self, fingerprint: str, params: Dict[str, Any]) -> str:
+        return f"{self.params_hash(params)[:12]}-{fingerprint[:16]}"
+
+    def _artifact_path(self, key: str) -> Path:
+        return self.directory / f"model-{key}.joblib"
+
+    def _latest_path(self, params: Dict[str, Any]) -> Path:
+        return self.directory / f"latest-{self.params_hash(params)[:12]}.json"
+
+    def _atomic_write(self, path: Path, writer) -> None:
+        """Escribe en un temporal y lo renombra para que otros workers nunca lean a medias"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        os.close(fd)
+        try:
+            writer(tmp_name)
+            os.replace(tmp_name, path)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+    def save(self, key: str, model: Any, params: Dict[str, Any], n_rows: int,
+             line_params: Optional[Dict[str, Any]] = None) -> Dict:
+        """Guarda el modelo y actualiza el puntero 'latest' de su línea de hiperparámetros.
+
+        ``line_params`` permite que un modelo derivado (p. ej. crecido con warm_start)
+        siga siendo el 'latest' de los hiperparámetros base con los que arrancan los workers.
+        """
+        import joblib
+        # Sin compresión: permite cargar los arrays de los árboles con mmap
+        self._atomic_write(self._artifact_path(key), lambda p: joblib.dump(model, p))
+
+        metadata = {
+            "key": key,
+            "params": params,
+            "n_rows": n_rows,
+            "format": MODEL_FORMAT_VERSION,
+            "sklearn": _sklearn_version(),
+            "created_at": time.time(),
+        }
+
+        def write_metadata(p):
+            with open(p, "w") as f:
+                json.dump(metadata, f, default=str)
+
+        self._atomic_write(self._latest_path(line_params or params), write_metadata)
+        return metadata
+
+    def save_snapshot(self, arrays: Dict[str, np.ndarray]) -> None:
+        """Persiste el snapshot de entrenamiento (sin comprimir, para cargarlo rápido)"""
+        def write_snapshot(p):
+            with open(p, "wb") as f:
+                np.savez(f, **arrays)
+
+        self._atomic_write(self.directory / "training-snapshot.npz", write_snapshot)
+
+    def load_snapshot(self) -> Optional[Dict[str, np.ndarray]]:
+        path = self.directory / "training-snapshot.npz"
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                return {name: data[name] for name in data.files}
+        except Exception as e:
+            print(f"No se pudo cargar el snapshot de entrenamiento: {e}")
+            return None
+
+    def save_promoted_params(self, params: Dict[str, Any], report: Optional[Dict] = None) -> None:
+        """Publica los hiperparámetros que deben servirse (p. ej. elegidos por model_search)"""
+        def write_params(p):
+            with open(p, "w") as f:
+                json.dump({"params": params, "report": report, "promoted_at": time.time()}, f, default=str)
+
+        self._atomic_write(self.directory / "promoted-params.json", write_params)
+
+    def load_promoted_params(self) -> Optional[Dict[str, Any]]:
+        path = self.directory / "promoted-params.json"
+        if not path.exists():
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)["params"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"No se pudieron leer los hiperparámetros promovidos: {e}")
+            return None
+
+    def load(self, key: str, mmap: bool = True) -> Optional[Any]:
+        """Carga un artefacto por clave; None si no existe o está corrupto"""
+        path = self._artifact_path(key)
+        if not path.exists():
+            return None
+        try:
+            import joblib
+            return joblib.load(path, mmap_mode="r" if mmap else None)
+        except Exception as e:
+            print(f"No se pudo cargar el modelo {path.name}: {e}")
+            return None
+
+    def latest_key(self, params: Dict[str, Any]) -> Optional[str]:
+        """Clave del último modelo de estos hiperparámetros, sin cargarlo"""
+        try:
+            with open(self._latest_path(params)) as f:
+                return json.load(f).get("key")
+        except (OSError, ValueError):
+            return None
+
+    def load_latest(self, params: Dict[str, Any], mmap: bool = True) -> Optional[Tuple[Any, Dict]]:
+        """Carga el último modelo entrenado con estos hiperparámetros (arranque en caliente)"""
+        latest = self._latest_path(params)
+        if not latest.exists():
+            return None
+        try:
+            with open(latest) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if metadata.get("format") != MODEL_FORMAT_VERSION or metadata.get("sklearn") != _sklearn_version():
+            return None
+
+        model = self.load(metadata["key"], mmap=mmap)
+        if model is None:
+            return None
+        return model, metadata
+
+
+model_store = ModelStore()
@@ -0,0 +1,162 @@
+"""Caché HTTP (ETag / 304) y de páginas renderizadas para las vistas HTML.
+
+La versión de un registro es el id de su última fila en ``cardiohealthchange``
+(lo anota ``edit_record``) o, si este proceso no la tiene anotada, la base: la
+última edición conocida al arrancar, que sube al descartar las versiones más
+antiguas (solo se guardan ``PAGE_VERSIONS_SIZE``). La versión de los listados es el
+par (id máximo, última edición). Un GET condicional se responde con 304 sin abrir
+sesión con la base.
+
+Los listados y los registros editados desde el arranque tienen el mismo ETag en
+todos los workers, porque salen de la base. La base, en cambio, es de cada proceso:
+dos workers pueden dar ETag distintos al mismo registro, y una petición que cambia
+de worker se responde con 200 en lugar de 304 (nunca con un 304 obsoleto). Las
+altas y ediciones hechas por otros workers se leen cada ``PAGE_CACHE_SYNC_SECONDS``
+(``CardioHealthOperations.sync_page_versions``).
+
+El HTML renderizado se guarda con el ETag (y la URL base, que aparece en los
+enlaces a estáticos) como clave, de modo que una página sin cambios tampoco vuelve
+a renderizarse.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+
+from cache import LRUCache
+
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "1000"))
+# Versiones de registro anotadas; al descartar la más antigua se sube la base
+PAGE_VERSIONS_SIZE = int(os.getenv("PAGE_VERSIONS_SIZE", "100000"))
+PAGE_CACHE_SYNC_SECONDS = float(os.getenv("PAGE_CACHE_SYNC_SECONDS", "5"))
+
+# El navegador guarda la página pero la revalida siempre con If-None-Match
+CACHE_CONTROL = "private, no-cache"
+
+
+def _templates_hash(directory: Path = Path(__file__).parent / "templates") -> str:
+    """Huella de las plantillas: un despliegue con plantillas nuevas cambia todos los ETag"""
+    digest = hashlib.sha256()
+    for path in sorted(directory.glob("*.html")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:8]
+
+
+class PageCache:
+    """Versiones de registros y listados, ETag derivados y HTML ya renderizado"""
+
+    def __init__(self, maxsize: int = PAGE_CACHE_SIZE, versions_size: int = PAGE_VERSIONS_SIZE):
+        self.pages = LRUCache(maxsize)
+        self.templates_version = _templates_hash()
+        # Por orden de edición: la primera es la de versión más baja
+        self.record_versions: "OrderedDict[int, int]" = OrderedDict()
+        self.versions_size = versions_size
+        # Marcas de lo visto; None hasta la primera sincronización con la base
+        self.baseline: Optional[int] = None
+        self.high_water_mark: Optional[int] = None
+        self.last_change_id: Optional[int] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.baseline is not None
+
+    # --- Versiones ---
+
+    def start(self, high_water_mark: int, last_change_id: int):
+        """Marcas iniciales leídas de la base al arrancar"""
+        self.baseline = last_change_id
+        self.high_water_mark = high_water_mark
+        self.last_change_id = last_change_id
+
+    def record_added(self, record_id: int):
+        if self.high_water_mark is not None:
+            self.high_water_mark = max(self.high_water_mark, record_id)
+
+    def record_changed(self, record_id: int, change_id: int):
+        self.record_versions[record_id] = max(self.record_versions.get(record_id, 0), change_id)
+        self.record_versions.move_to_end(record_id)
+        while len(self.record_versions) > self.versions_size:
+            # La base pasa a ser la versión descartada: el registro no vuelve a un ETag
+            # anterior a su edición (los no editados solo cambian de ETag una vez)
+            _, version = self.record_versions.popitem(last=False)
+            if self.baseline is not None:
+                self.baseline = max(self.baseline, version)
+        if self.last_change_id is not None:
+            self.last_change_id = max(self.last_change_id, change_id)
+
+    def apply_changes(self, changes: Iterable, high_water_mark: int):
+        """Ediciones (change_id, record_id) y id máximo leídos de la base"""
+        for change_id, record_id in changes:
+            self.record_changed(record_id, change_id)
+        self.record_added(high_water_mark)
+
+    # --- ETag ---
+
+    def record_etag(self, kind: str, record_id: int, *extra) -> Optional[str]:
+        """ETag débil de una página de un registro; None si aún no hay marcas"""
+        if not self.ready:
+            return None
+        version = self.record_versions.get(record_id, self.baseline)
+        parts = [kind, str(record_id), str(version), self.templates_version, *map(str, extra)]
+        return 'W/"' + "-".join(parts) + '"'
+
+    def list_etag(self, kind: str, query: str) -> Optional[str]:
+        """ETag débil de un listado: depende de los parámetros y de la versión de la tabla"""
+        if not self.ready:
+            return None
+        query_hash = hashlib.sha1(query.encode()).hexdigest()[:12]
+        parts = [kind, query_hash, str(self.high_water_mark), str(self.last_change_id), self.templates_version]
+        return 'W/"' + "-".join(parts) + '"'
+
+    @staticmethod
+    def not_modified(request: Request, etag: Optional[str]) -> bool:
+        """Si el If-None-Match del cliente coincide con ``etag``"""
+        header = request.headers.get("if-none-match")
+        if etag is None or not header:
+            return False
+        if header.strip() == "*":
+            return True
+        # Comparación débil: se ignora el prefijo W/
+        wanted = etag.removeprefix("W/")
+        return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+    # --- Respuestas ---
+
+    def cached_response(self, request: Request, etag: Optional[str]) -> Optional[Response]:
+        """304 si el cliente ya tiene la versión, la página guardada si existe, o None"""
+        if etag is None:
+            return None
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if self.not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+        body = self.pages.get((etag, str(request.base_url)))
+        if body is not None:
+            return HTMLResponse(body, headers=headers)
+        return None
+
+    def store(self, request: Request, etag: Optional[str], response: Response) -> Response:
+        """Guarda el HTML de una respuesta 200 y le añade las cabeceras de caché"""
+        if etag is None or response.status_code != 200:
+            return response
+        self.pages.set((etag, str(request.base_url)), response.body)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "high_water_mark": self.high_water_mark,
+            "last_change_id": self.last_change_id,
+            "tracked_records": len(self.record_versions),
+            "templates_version": self.templates_version,
+            **self.pages.stats()
+        }
+
+
+page_cache = PageCache()
@@ -0,0 +1,180 @@
+"""Estadísticas de población mantenidas en la tabla ``cardiohealthsummary``.
+
+La tabla guarda, para cada dimensión (categoría de presión arterial, categoría de
+IMC, colesterol, glucosa y tabaquismo) y cada categoría, el número de registros y
+cuántos tienen ``cardio = 1``. Se reconstruye con una sola consulta agregada en SQL
+y después se mantiene sumando deltas en la misma transacción de cada alta, edición
+o importación, así que el panel solo lee unas decenas de filas.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, case, delete, func, insert, or_, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from connection_db import get_read_session, get_session
+from database_model import CardioHealth, CardioHealthSummary
+from health_rules import (
+    BLOOD_PRESSURE_LABELS, DIASTOLIC_BINS, FEATURE_NAMES, IMC_BINS, IMC_LABELS, SYSTOLIC_BINS, health_metrics,
+    rule_columns
+)
+
+# Categorías de cada dimensión, en el orden en que se muestran
+SUMMARY_BUCKETS = {
+    "blood_pressure": [str(label) for label in BLOOD_PRESSURE_LABELS],
+    "imc": [str(label) for label in IMC_LABELS],
+    "cholesterol": ["1", "2", "3"],
+    "gluc": ["1", "2", "3"],
+    "smoke": ["0", "1"],
+}
+
+BucketKey = Tuple[str, str]
+
+
+def blood_pressure_category_sql():
+    """Mismos umbrales que health_rules (la peor de sistólica y diastólica), evaluados en SQL"""
+    ap_hi, ap_lo = CardioHealth.ap_hi, CardioHealth.ap_lo
+    thresholds = list(zip(SYSTOLIC_BINS.tolist(), DIASTOLIC_BINS.tolist(), BLOOD_PRESSURE_LABELS[1:].tolist()))
+    return case(
+        *[(or_(ap_hi >= systolic, ap_lo >= diastolic), label) for systolic, diastolic, label in reversed(thresholds)],
+        else_=str(BLOOD_PRESSURE_LABELS[0])
+    )
+
+
+def imc_category_sql():
+    """Mismos intervalos que health_rules.IMC_BINS (altura guardada en cm), evaluados en SQL"""
+    # Altura 0: IMC NULL en lugar de error de división; cae en el else_ (última categoría),
+    # igual que el IMC infinito de health_rules
+    height_m = func.nullif(CardioHealth.height, 0) / 100.0
+    imc = CardioHealth.weight / (height_m * height_m)
+    return case(
+        *[(imc < bound, label) for bound, label in zip(IMC_BINS.tolist(), IMC_LABELS.tolist())],
+        else_=str(IMC_LABELS[-1])
+    )
+
+
+def summary_deltas(rows: Iterable[Dict], sign: int = 1) -> Dict[BucketKey, List[int]]:
+    """Cambios de contadores que provocan ``rows`` (dicts con todas las columnas).
+
+    ``sign = -1`` descuenta las filas, p. ej. los valores previos de una edición.
+    """
+    rows = list(rows)
+    deltas: Dict[BucketKey, List[int]] = defaultdict(lambda: [0, 0])
+    if not rows:
+        return deltas
+    features = np.array([[float(row[name]) for name in FEATURE_NAMES] for row in rows])
+    # Mismas reglas de health_rules que la página de cada paciente y la puntuación masiva
+    metrics = health_metrics(rule_columns(features))
+    for i, row in enumerate(rows):
+        cardio = int(row["cardio"])
+        for key in (("blood_pressure", str(metrics["blood_pressure"][i])),
+                    ("imc", str(metrics["imc_category"][i])),
+                    ("cholesterol", str(int(row["cholesterol"]))),
+                    ("gluc", str(int(row["gluc"]))),
+                    ("smoke", str(int(row["smoke"])))):
+            deltas[key][0] += sign
+            deltas[key][1] += sign * cardio
+    return deltas
+
+
+def merge_deltas(*parts: Dict[BucketKey, List[int]]) -> Dict[BucketKey, List[int]]:
+    merged: Dict[BucketKey, List[int]] = defaultdict(lambda: [0, 0])
+    for part in parts:
+        for key, (records, cardio) in part.items():
+            merged[key][0] += records
+            merged[key][1] += cardio
+    return merged
+
+
+async def apply_deltas(session: AsyncSession, deltas: Dict[BucketKey, List[int]]):
+    """Suma los deltas a la tabla de resumen dentro de la transacción de ``session``.
+
+    Las filas se actualizan en orden (dimensión, categoría): dos transacciones
+    concurrentes bloquean las mismas filas en el mismo orden y no se interbloquean.
+    """
+    params = [
+        {"d": dimension, "b": bucket, "dr": records, "dc": cardio}
+        for (dimension, bucket), (records, cardio) in sorted(deltas.items())
+        if records or cardio
+    ]
+    if not params:
+        return
+    table = CardioHealthSummary.__table__
+    statement = (
+        update(table)
+        .where(table.c.dimension == bindparam("d"), table.c.bucket == bindparam("b"))
+        .values(records=table.c.records + bindparam("dr"), cardio=table.c.cardio + bindparam("dc"))
+    )
+    await session.execute(statement, params)
+
+
+async def rebuild_summary() -> int:
+    """Recalcula todos los contadores con una sola pasada agregada sobre la tabla"""
+    bp_category = blood_pressure_category_sql().label("bp")
+    imc_category = imc_category_sql().label("imc")
+    query = (
+        select(bp_category, imc_category, CardioHealth.cholesterol, CardioHealth.gluc,
+               CardioHealth.smoke, func.count(), func.coalesce(func.sum(CardioHealth.cardio), 0))
+        .group_by(bp_category, imc_category, CardioHealth.cholesterol, CardioHealth.gluc, CardioHealth.smoke)
+    )
+    totals: Dict[BucketKey, List[int]] = {
+        (dimension, bucket): [0, 0] for dimension, buckets in SUMMARY_BUCKETS.items() for bucket in buckets
+    }
+
+    async with get_session() as session:
+        # Misma transacción para el recuento y la escritura del resumen
+        for bp, imc, cholesterol, gluc, smoke, records, cardio in (await session.execute(query)).all():
+            for key in (("blood_pressure", bp), ("imc", imc), ("cholesterol", str(cholesterol)),
+                        ("gluc", str(gluc)), ("smoke", str(smoke))):
+                counts = totals.setdefault(key, [0, 0])
+                counts[0] += records
+                counts[1] += cardio
+        await session.execute(delete(CardioHealthSummary.__table__))
+        await session.execute(insert(CardioHealthSummary.__table__), [
+            {"dimension": dimension, "bucket": bucket, "records": records, "cardio": cardio}
+            for (dimension, bucket), (records, cardio) in totals.items()
+        ])
+        await session.commit()
+    return sum(records for (dimension, _), (records, _) in totals.items() if dimension == "smoke")
+
+
+async def ensure_summary():
+    """Construye el resumen la primera vez (p. ej. tras desplegar sobre una tabla existente)"""
+    async with get_session() as session:
+        existing = (await session.execute(select(func.count()).select_from(CardioHealthSummary))).scalar_one()
+    if not existing:
+        await rebuild_summary()
+
+
+async def load_summary() -> Dict:
+    """Distribuciones y prevalencia de ``cardio`` por dimensión, leídas del resumen"""
+    async with get_read_session() as session:
+        rows = (await session.execute(select(CardioHealthSummary))).scalars().all()
+
+    counts = {(row.dimension, row.bucket): row for row in rows}
+    summary = {}
+    for dimension, buckets in SUMMARY_BUCKETS.items():
+        extra = sorted(bucket for (d, bucket) in counts if d == dimension and bucket not in buckets)
+        entries = []
+        total = sum(row.records for (d, _), row in counts.items() if d == dimension)
+        for bucket in buckets + extra:
+            row = counts.get((dimension, bucket))
+            records = row.records if row else 0
+            cardio = row.cardio if row else 0
+            entries.append({
+                "bucket": bucket,
+                "records": records,
+                "share": round(records / total, 4) if total else None,
+                "cardio": cardio,
+                "cardio_prevalence": round(cardio / records, 4) if records else None
+            })
+        summary[dimension] = entries
+
+    total = sum(entry["records"] for entry in summary["smoke"])
+    cardio = sum(entry["cardio"] for entry in summary["smoke"])
+    return {
+        "total_records": total,
+        "cardio_prevalence": round(cardio / total, 4) if total else None,
+        "dimensions": summary
+    }
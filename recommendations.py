@@ -1,288 +1,462 @@
-from sklearn.ensemble import RandomForestClassifier
+import asyncio
+import copy
+import os
+import time
+from concurrent.futures import Executor
 import numpy as np
-import pandas as pd
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from cache import LRUCache
 from database_model import CardioHealth
+from flat_forest import CompactForest, FlatForest, compare_forests, model_nbytes, sample_rows, select_trees
+from health_rules import (
+    FEATURE_NAMES, RECOMMENDATION_RULES, RISK_COLORS, RISK_LEVELS, evaluate_rules, health_metrics,
+    recommendation_messages, risk_index, rule_columns
+)
+from instrumentation import PeakRSS, metrics, process_rss, span, timed
+from model_store import ModelStore, model_store
+from scoring_client import ScoringClient, ScoringUnavailable
+
+# sklearn y pandas se importan al primer uso (entrenamiento, carga del modelo o backend
+# sklearn): importarlos con el módulo retrasa el arranque de cada worker casi un segundo
+if TYPE_CHECKING:
+    from sklearn.ensemble import RandomForestClassifier
+
+# Hiperparámetros por defecto del modelo servido (forman parte de la clave del artefacto);
+# model_search puede promover otros, que se leen del almacén de modelos al arrancar
+MODEL_PARAMS = {
+    "n_estimators": 150,
+    "max_depth": 10,
+    "min_samples_split": 5,
+    "max_features": "sqrt",
+    "class_weight": "balanced",
+    "random_state": 42,
+}
+
+# Caché de resultados de generate_recommendations
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "10000"))
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "3600"))
+
+# Backend de inferencia: "flat" recorre el bosque aplanado con NumPy, "sklearn" usa predict_proba
+# y "compact" sirve un CompactForest verificado contra el bosque completo, sin mantener el
+# modelo de sklearn en memoria (varias veces menos memoria por worker)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "flat")
+# Filas de entrenamiento con las que se verifica que el backend plano coincide con sklearn
+INFERENCE_PROBE_ROWS = 1000
+
+# Forma compacta: bits de las probabilidades de los nodos (8 o 16), error absoluto máximo
+# admitido al descartar árboles (0: se conservan todos) y error máximo para aceptarla, tanto
+# en la predicción como en cada contribución.
+# La selección se limita a lo que deja la cuantización dentro de COMPACT_MAX_ERROR
+COMPACT_LEAF_BITS = int(os.getenv("COMPACT_LEAF_BITS", "16"))
+COMPACT_TREE_BUDGET = float(os.getenv("COMPACT_TREE_BUDGET", "0"))
+COMPACT_MAX_ERROR = float(os.getenv("COMPACT_MAX_ERROR", "0.01"))
+# Filas sintéticas de verificación si el modelo se carga del almacén (sin filas de entrenamiento)
+COMPACT_PROBE_ROWS = 2000
+
+metrics.describe("model_bytes", "gauge", "Memoria del modelo servido por representación")
+metrics.describe("model_train_peak_rss_bytes", "gauge", "Pico de memoria residente del último entrenamiento")
+
+def _feature_frame(features: np.ndarray):
+    """DataFrame con los nombres de columna con los que se entrena el modelo"""
+    import pandas as pd
+    return pd.DataFrame(features, columns=FEATURE_NAMES)
+
+
+def import_ml_stack():
+    """Importa sklearn y pandas por adelantado (tarea de calentamiento del arranque)"""
+    import pandas  # noqa: F401
+    import sklearn.ensemble  # noqa: F401
+
+
+def fit_forest(features: np.ndarray, target: np.ndarray, params: Dict) -> "RandomForestClassifier":
+    """Entrena el RandomForest; función de módulo para poder ejecutarse en otro proceso"""
+    from sklearn.ensemble import RandomForestClassifier
+    model = RandomForestClassifier(**params)
+    model.fit(_feature_frame(features), target)
+    return model
+
+
+def profiled(func, *args):
+    """Ejecuta ``func(*args)`` y devuelve (resultado, pico de RSS, crecimiento de RSS) del proceso que la ejecuta"""
+    with PeakRSS() as rss:
+        result = func(*args)
+    return result, rss.peak, rss.growth
+
+
+def grow_forest(model: "RandomForestClassifier", features: np.ndarray, target: np.ndarray,
+                extra_trees: int) -> "RandomForestClassifier":
+    """Añade árboles a un bosque ya entrenado (warm_start) usando los datos actualizados"""
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + extra_trees)
+    model.fit(_feature_frame(features), target)
+    model.set_params(warm_start=False)
+    return model
 
 
 class RecommendationSystem:
-    def __init__(self):
+    def __init__(self, store: Optional[ModelStore] = None):
         self.model = None
-        self.feature_names = [
-            'age', 'gender', 'height', 'weight',
-            'ap_hi', 'ap_lo', 'cholesterol',
-            'gluc', 'smoke', 'alco', 'active'
-        ]
+        self.model_version: Optional[str] = None
+        self.trained_at: Optional[float] = None
+        # Tablas precalculadas por modelo: nodos aplanados y ranking global de factores
+        self.forest: Optional[FlatForest] = None
+        self.inference_backend = INFERENCE_BACKEND
+        self.factor_ranking: List[Dict] = []
+        self.store = store or model_store
+        self.params: Dict = dict(MODEL_PARAMS)
+        self.n_estimators = 0
+        # Tarea de calentamiento del arranque (carga del almacén); ensure_model la espera
+        # antes de decidir entrenar
+        self.warm_up_task: Optional[asyncio.Task] = None
+        # Tamaño de cada representación del modelo servido y memoria del último entrenamiento
+        self.memory: Dict = {}
+        self.training_memory: Optional[Dict] = None
+        self.feature_names = list(FEATURE_NAMES)
+        # Resultados por (versión del modelo, vector de características); el índice por
+        # id permite invalidar la entrada de un registro cuando se edita
+        self.cache = LRUCache(RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL)
+        self._cache_keys_by_record = LRUCache(RECOMMENDATION_CACHE_SIZE)
+        # Cliente del servicio de puntuación (scoring_service); None: se puntúa en el proceso
+        self.scorer: Optional[ScoringClient] = None
 
     def is_trained(self) -> bool:
         """Verifica si el modelo ya fue entrenado"""
-        return self.model is not None
+        return self.forest is not None
+
+    async def model_available(self) -> bool:
+        """Hay un modelo que responde: el local o el del servicio de puntuación"""
+        if self.is_trained():
+            return True
+        return self.scorer is not None and await self.scorer.ping() is not None
+
+    def load_from_store(self) -> bool:
+        """Carga el último modelo guardado en disco, si existe, sin reentrenar.
+
+        Los hiperparámetros servidos son los promovidos por model_search, si los hay.
+        """
+        params, loaded = self._read_store()
+        self.params = params
+        if loaded is None:
+            return False
+        model, metadata = loaded
+        self._swap_model(model, metadata["key"], metadata.get("created_at"))
+        return True
+
+    async def warm_up(self) -> bool:
+        """Como load_from_store, pero la lectura (e importación de sklearn) y la preparación
+        del bosque van al pool de hilos; en el event loop solo se instala"""
+        loop = asyncio.get_running_loop()
+        params, loaded = await loop.run_in_executor(None, self._read_store)
+        self.params = params
+        if loaded is None:
+            return False
+        model, metadata = loaded
+        await self._swap_model_async(model, metadata["key"], metadata.get("created_at"))
+        return True
+
+    def _read_store(self) -> Tuple[Dict, Optional[Tuple]]:
+        params = self.store.load_promoted_params() or dict(MODEL_PARAMS)
+        return params, self.store.load_latest(params)
+
+    def _swap_model(self, model: "RandomForestClassifier", version: str, trained_at: Optional[float] = None,
+                    probe: Optional[np.ndarray] = None):
+        """Prepara e instala un modelo en el hilo actual (CLI y servicio de puntuación)"""
+        self._install_model(self._prepare_model(model, version, probe), trained_at)
+
+    async def _swap_model_async(self, model: "RandomForestClassifier", version: str,
+                                trained_at: Optional[float] = None, probe: Optional[np.ndarray] = None):
+        """Como _swap_model, con la preparación (aplanado, verificación, forma compacta) en
+        el pool de hilos: las peticiones en curso siguen atendiéndose con el modelo actual"""
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(None, self._prepare_model, model, version, probe)
+        self._install_model(prepared, trained_at)
+
+    def _prepare_model(self, model: "RandomForestClassifier", version: str,
+                       probe: Optional[np.ndarray] = None) -> Dict:
+        """Bosque a servir y sus verificaciones; no modifica el estado servido (apto para otro hilo).
+
+        Si se pasa ``probe`` se comprueba que el bosque aplanado da las mismas
+        probabilidades que sklearn y, si no, se vuelve al backend de sklearn. Con el
+        backend compacto, la forma compacta se verifica contra el bosque completo
+        (sobre ``probe`` o filas sintéticas) y, si se aleja más de COMPACT_MAX_ERROR,
+        se sirve el bosque aplanado.
+        """
+        forest = FlatForest(model)
+        backend = INFERENCE_BACKEND
+        if backend != "sklearn" and probe is not None and not forest.matches(model, probe):
+            print(f"El bosque aplanado no coincide con sklearn para {version}; se usa sklearn")
+            backend = "sklearn"
+        memory = {"sklearn_bytes": model_nbytes(model), "flat_bytes": forest.nbytes, "nodes": forest.n_nodes}
+        served = forest
+        if backend == "compact":
+            compact, report = self._build_compact(forest, probe)
+            memory["compact"] = report
+            if report["accepted"]:
+                served = compact
+            else:
+                print(f"La forma compacta de {version} se aleja {report['max_abs_error']:.5f} en la predicción y "
+                      f"{report['max_contribution_error']:.5f} en las contribuciones; se usa el bosque aplanado")
+                backend = "flat"
+        importances = model.feature_importances_
+        factor_ranking = [
+            {"factor": self.feature_names[i], "importance": round(float(importances[i]), 4)}
+            for i in np.argsort(importances)[::-1]
+        ]
+        return {"model": model, "version": version, "forest": served, "backend": backend,
+                "memory": memory, "factor_ranking": factor_ranking}
+
+    def _install_model(self, prepared: Dict, trained_at: Optional[float] = None):
+        """Instala un modelo preparado; sin awaits de por medio, ninguna petición ve un estado mixto"""
+        model, served, backend, memory = prepared["model"], prepared["forest"], prepared["backend"], prepared["memory"]
+        self.factor_ranking = prepared["factor_ranking"]
+        self.forest = served
+        self.inference_backend = backend
+        # El modelo de sklearn solo se conserva si hace falta para servir (o para verificar el plano)
+        self.model = None if backend == "compact" else model
+        self.n_estimators = model.n_estimators
+        self.model_version = prepared["version"]
+        self.trained_at = trained_at or time.time()
+        self.memory = {**memory, "served_bytes": served.nbytes + (memory["sklearn_bytes"] if self.model else 0)}
+        sizes = {"sklearn": memory["sklearn_bytes"], "flat": memory["flat_bytes"], "served": self.memory["served_bytes"]}
+        if "compact" in memory:
+            sizes["compact"] = memory["compact"]["bytes"]
+        for representation, size in sizes.items():
+            metrics.set_gauge("model_bytes", size, representation=representation)
+        # Los resultados del modelo anterior ya no son válidos
+        self.cache.clear()
+        self._cache_keys_by_record.clear()
+
+    @staticmethod
+    def _build_compact(forest: FlatForest, probe: Optional[np.ndarray]) -> Tuple[CompactForest, Dict]:
+        """CompactForest de ``forest`` y su verificación frente al bosque completo"""
+        rows = probe if probe is not None else sample_rows(forest, COMPACT_PROBE_ROWS)
+        trees = None
+        if COMPACT_TREE_BUDGET > 0:
+            # Error de cuantización por árbol (y de su promedio): 0.5 / (2**bits - 1)
+            budget = min(COMPACT_TREE_BUDGET, COMPACT_MAX_ERROR - 0.5 / (2 ** COMPACT_LEAF_BITS - 1))
+            trees = select_trees(forest, rows, budget) if budget > 0 else None
+        compact = CompactForest(forest, COMPACT_LEAF_BITS, trees)
+        report = {
+            **compare_forests(compact, forest, rows),
+            "probe": "training" if probe is not None else "synthetic",
+            "bytes": compact.nbytes,
+            "trees": compact.n_trees,
+            "nodes": compact.n_nodes,
+            "pruned_nodes": compact.pruned_nodes,
+            "leaf_bits": compact.leaf_bits
+        }
+        # Las contribuciones también se sirven (factores clave): la poda y la selección
+        # de árboles no deben moverlas más que la predicción
+        report["accepted"] = max(report["max_abs_error"], report["max_contribution_error"]) <= COMPACT_MAX_ERROR
+        return compact, report
 
-    async def train_model(self, records: List[CardioHealth]):
-        """Entrena el modelo RandomForest con registros de Clever"""
-        if len(records) < 100:
-            raise ValueError("Se necesitan mínimo 100 registros para entrenar el modelo")
+    def _record_training_memory(self, kind: str, peak: Optional[int], growth: Optional[int]):
+        self.training_memory = {"kind": kind, "peak_rss_bytes": peak, "rss_growth_bytes": growth}
+        if peak is not None:
+            metrics.set_gauge("model_train_peak_rss_bytes", peak, kind=kind)
 
-        data = pd.DataFrame([{
-            'age': r.age,
-            'gender': r.gender,
-            'height': r.height,
-            'weight': r.weight,
-            'ap_hi': r.ap_hi,
-            'ap_lo': r.ap_lo,
-            'cholesterol': r.cholesterol,
-            'gluc': r.gluc,
-            'smoke': r.smoke,
-            'alco': r.alco,
-            'active': r.active,
-            'cardio': r.cardio
-        } for r in records])
-
-        self.model = RandomForestClassifier(
-            n_estimators=150,
-            max_depth=10,
-            min_samples_split=5,
-            max_features='sqrt',
-            class_weight='balanced',
-            random_state=42
-        )
-        self.model.fit(data[self.feature_names], data['cardio'])
+    def memory_status(self) -> Dict:
+        return {
+            "backend": self.inference_backend,
+            **self.memory,
+            "training": self.training_memory,
+            "process_rss_bytes": process_rss()
+        }
 
-    def generate_recommendations(self, patient: CardioHealth) -> Dict:
-        """Genera todas las recomendaciones y métricas"""
-        features = pd.DataFrame([{
-            'age': patient.age,
-            'gender': patient.gender,
-            'height': patient.height,
-            'weight': patient.weight,
-            'ap_hi': patient.ap_hi,
-            'ap_lo': patient.ap_lo,
-            'cholesterol': patient.cholesterol,
-            'gluc': patient.gluc,
-            'smoke': patient.smoke,
-            'alco': patient.alco,
-            'active': patient.active
-        }])
-
-        proba = self.model.predict_proba(features)[0][1]
+    def invalidate_record(self, record_id: int):
+        """Descarta las recomendaciones en caché de un registro (p. ej. tras editarlo)"""
+        key = self._cache_keys_by_record.get(record_id)
+        if key is not None:
+            self.cache.pop(key)
+            self._cache_keys_by_record.pop(record_id)
+
+    @timed("model.train")
+    async def train_model(self, features: np.ndarray, target: np.ndarray,
+                          executor: Optional[Executor] = None):
+        """Entrena el modelo RandomForest con registros de Clever.
+
+        ``features`` es una matriz (n, 11) en el orden de FEATURE_NAMES y ``target``
+        la columna ``cardio``. El acceso a disco corre en el pool de hilos por defecto
+        y el ajuste del bosque en ``executor`` (p. ej. un pool de procesos), fuera del
+        event loop. El modelo actual sigue sirviendo peticiones hasta que el nuevo se instala.
+        """
+        if len(target) < 100:
+            raise ValueError("Se necesitan mínimo 100 registros para entrenar el modelo")
 
+        X = np.ascontiguousarray(features, dtype=np.float64)
+        y = np.ascontiguousarray(target, dtype=np.int64)
+        loop = asyncio.get_running_loop()
+
+        # Reutilizar el artefacto si ya se entrenó con los mismos datos e hiperparámetros
+        fingerprint = self.store.dataset_fingerprint(X, y)
+        params = self.params
+        key = self.store.make_key(fingerprint, params)
+        model = await loop.run_in_executor(None, self.store.load, key)
+
+        if model is None:
+            # Pico de memoria medido en el proceso que entrena (el del pool, si lo hay)
+            model, peak, growth = await loop.run_in_executor(executor, profiled, fit_forest, X, y, params)
+            self._record_training_memory("train", peak, growth)
+            await loop.run_in_executor(None, self.store.save, key, model, params, len(y))
+
+        await self._swap_model_async(model, key, probe=X[:INFERENCE_PROBE_ROWS])
+
+    @timed("model.grow")
+    async def grow_model(self, features: np.ndarray, target: np.ndarray, extra_trees: int,
+                         executor: Optional[Executor] = None):
+        """Refresco barato: añade ``extra_trees`` árboles al modelo actual con los datos nuevos"""
+        base = self.model
+        X = np.ascontiguousarray(features, dtype=np.float64)
+        y = np.ascontiguousarray(target, dtype=np.int64)
+        loop = asyncio.get_running_loop()
+
+        if base is None:
+            # Backend compacto: el modelo de sklearn se lee del almacén solo para el refresco
+            base = await loop.run_in_executor(None, self.store.load, self.model_version, False)
+            if base is None:
+                await self.train_model(features, target, executor)
+                return
+        elif executor is None:
+            # El modelo servido no se toca: se entrena sobre una copia (en otro proceso o clonado)
+            base = copy.deepcopy(base)
+        model, peak, growth = await loop.run_in_executor(executor, profiled, grow_forest, base, X, y, extra_trees)
+        self._record_training_memory("grow", peak, growth)
+
+        params = {**self.params, "n_estimators": model.n_estimators, "warm_start_from": self.model_version}
+        key = self.store.make_key(self.store.dataset_fingerprint(X, y), params)
+        await loop.run_in_executor(None, self.store.save, key, model, params, len(y), self.params)
+        await self._swap_model_async(model, key, probe=X[:INFERENCE_PROBE_ROWS])
+
+    @timed("recommendations.generate")
+    def generate_recommendations(self, patient: CardioHealth) -> Dict:
+        """Genera todas las recomendaciones y métricas.
+
+        El resultado se guarda en caché y se comparte entre peticiones: no debe modificarse.
+        """
+        # Referencia local: un reemplazo del modelo a mitad de la llamada no la afecta
+        model, version, forest = self.model, self.model_version, self.forest
+        values = self._patient_values(patient)
+        cached = self.cache.get((version, values))
+        if cached is not None:
+            return cached
+
+        features = np.array([values])
+        with span("model.predict_proba"):
+            proba = float(self._predict_proba(model, forest, features)[0])
+        with span("model.contributions"):
+            contributions = forest.contributions(features)[0]
+        return self._assemble(patient, version, values, proba, contributions)
+
+    @timed("recommendations.recommend")
+    async def recommend(self, patient: CardioHealth) -> Dict:
+        """generate_recommendations con la predicción en el servicio de puntuación, si está configurado.
+
+        Si el servicio no responde se puntúa en el proceso (si hay modelo local).
+        """
+        if self.scorer is None:
+            return self.generate_recommendations(patient)
+        values = self._patient_values(patient)
+        cached = self.cache.get((self.scorer.model_version, values))
+        if cached is not None:
+            return cached
+        try:
+            proba, contributions, version = await self.scorer.score(np.array([values]), contributions=True)
+        except ScoringUnavailable:
+            if not self.is_trained():
+                raise
+            return self.generate_recommendations(patient)
+        return self._assemble(patient, version, values, float(proba[0]), contributions[0])
+
+    def _patient_values(self, patient: CardioHealth) -> Tuple[float, ...]:
+        return tuple(float(getattr(patient, f)) for f in self.feature_names)
+
+    def _assemble(self, patient: CardioHealth, version: Optional[str], values: Tuple[float, ...],
+                  proba: float, contributions: np.ndarray) -> Dict:
+        """Resultado completo a partir de la probabilidad y las contribuciones, y su entrada en caché"""
+        features = np.array([values])
+        key_factors = self._get_key_factors(features[0], contributions)
+        with span("recommendations.assemble"):
+            # Mismas reglas que la puntuación masiva, evaluadas sobre una fila
+            columns = rule_columns(features, np.array([proba]))
+            index = int(risk_index(columns["probability"])[0])
+            health = health_metrics(columns)
+            matched = evaluate_rules(RECOMMENDATION_RULES, columns)[0]
+            result = {
+                "risk_data": {"level": str(RISK_LEVELS[index]), "color": str(RISK_COLORS[index]),
+                              "probability": round(proba, 4)},
+                "key_factors": key_factors,
+                "health_metrics": {name: value[0].item() for name, value in health.items()},
+                "recommendations": recommendation_messages(matched, [f["factor"] for f in key_factors])
+            }
+        # Solo se guarda si el modelo no cambió mientras tanto
+        if version == self.current_version():
+            cache_key = (version, values)
+            self.cache.set(cache_key, result)
+            if patient.id is not None:
+                self._cache_keys_by_record.set(patient.id, cache_key)
+        return result
+
+    def current_version(self) -> Optional[str]:
+        """Versión del modelo que responde: la del servicio de puntuación o la local"""
+        if self.scorer is not None and self.scorer.model_version is not None:
+            return self.scorer.model_version
+        return self.model_version
+
+    def score_batch(self, features: np.ndarray) -> Dict[str, np.ndarray]:
+        """Puntúa muchos pacientes a la vez.
+
+        ``features`` es una matriz (n, 11) con las columnas en el orden de FEATURE_NAMES.
+        Devuelve arrays de longitud n con probabilidad, nivel de riesgo, IMC, categorías
+        y edad metabólica, con los mismos criterios que generate_recommendations.
+        """
+        features = np.asarray(features, dtype=np.float64)
+        return self._batch_result(features, self._predict_proba(self.model, self.forest, features))
+
+    async def score_batch_async(self, features: np.ndarray) -> Dict[str, np.ndarray]:
+        """score_batch con la predicción en el servicio de puntuación, si está configurado"""
+        features = np.asarray(features, dtype=np.float64)
+        if self.scorer is not None:
+            try:
+                proba, _, _ = await self.scorer.score(features)
+                return self._batch_result(features, proba)
+            except ScoringUnavailable:
+                if not self.is_trained():
+                    raise
+        return self.score_batch(features)
+
+    def _batch_result(self, features: np.ndarray, proba: np.ndarray) -> Dict[str, np.ndarray]:
+        columns = rule_columns(features, proba)
+        index = risk_index(proba)
         return {
-            "risk_data": self._get_risk_data(proba),
-            "key_factors": self._get_key_factors(features),
-            "health_metrics": self._calculate_health_metrics(patient),
-            "recommendations": self._generate_all_recommendations(patient, proba)
+            "probability": proba,
+            "risk_level": RISK_LEVELS[index],
+            "risk_color": RISK_COLORS[index],
+            **health_metrics(columns),
+            # Reglas de recomendación que cumple cada fila (ver health_rules.batch_rule_ids)
+            "rules": evaluate_rules(RECOMMENDATION_RULES, columns)
         }
 
-    def _get_risk_data(self, probability: float) -> Dict:
-        if probability > 0.8:
-            return {"level": "Extremo", "color": "#FF0000"}
-        elif probability > 0.6:
-            return {"level": "Alto", "color": "#FF6B00"}
-        elif probability > 0.4:
-            return {"level": "Moderado", "color": "#FFC100"}
-        else:
-            return {"level": "Bajo", "color": "#00B050"}
-
-    def _get_key_factors(self, features: pd.DataFrame) -> List[Dict]:
-        importances = self.model.feature_importances_
-        top_indices = np.argsort(importances)[-3:][::-1]
+    def _predict_proba(self, model: "RandomForestClassifier", forest: FlatForest,
+                       features: np.ndarray) -> np.ndarray:
+        """Probabilidad de la clase positiva con el backend configurado"""
+        if self.inference_backend != "sklearn":
+            return forest.predict_proba(features)
+        return model.predict_proba(_feature_frame(features))[:, 1]
+
+    def _get_key_factors(self, values: np.ndarray, contributions: np.ndarray) -> List[Dict]:
+        """Los tres factores que más mueven el riesgo de este paciente.
+
+        ``importance`` es la parte de la contribución absoluta total que aporta el
+        factor; ``contribution`` es su efecto con signo sobre la probabilidad.
+        """
+        magnitude = np.abs(contributions)
+        total = magnitude.sum() or 1.0
+        top_indices = np.argsort(magnitude)[-3:][::-1]
         return [{
             "factor": self.feature_names[i],
-            "importance": round(float(importances[i]), 4),
-            "value": float(features.iloc[0][i])
+            "importance": round(float(magnitude[i] / total), 4),
+            "contribution": round(float(contributions[i]), 4),
+            "value": float(values[i])
         } for i in top_indices]
 
-    def _calculate_health_metrics(self, patient: CardioHealth) -> Dict:
-        """Calcula métricas de salud incluyendo IMC, categoría de presión arterial y edad metabólica"""
-        # Convertir altura de cm a metros para el cálculo del IMC
-        altura_metros = patient.height / 100
-        # Calcular IMC: peso(kg) / altura²(m)
-        imc = patient.weight / (altura_metros ** 2)
-        
-        # Clasificación de presión arterial según guías internacionales
-        presion_arterial = self._classify_blood_pressure(patient.ap_hi, patient.ap_lo)
-        
-        # Cálculo de edad metabólica considerando diversos factores
-        edad_base = patient.age  # ya está en días
-        edad_metabolica = edad_base
-
-        # Ajustes por IMC
-        if imc >= 30:  # Obesidad
-            edad_metabolica += 1825  # +5 años en días
-        elif imc >= 25:  # Sobrepeso
-            edad_metabolica += 730  # +2 años en días
-        elif imc < 18.5:  # Bajo peso
-            edad_metabolica += 365  # +1 año en días
-
-        # Ajustes por presión arterial
-        if patient.ap_hi >= 140 or patient.ap_lo >= 90:  # Hipertensión
-            edad_metabolica += 1460  # +4 años en días
-        elif patient.ap_hi >= 130 or patient.ap_lo >= 85:  # Pre-hipertensión
-            edad_metabolica += 730  # +2 años en días
-
-        # Ajustes por colesterol
-        if patient.cholesterol == 3:  # Muy alto
-            edad_metabolica += 1825  # +5 años en días
-        elif patient.cholesterol == 2:  # Alto
-            edad_metabolica += 730  # +2 años en días
-
-        # Ajustes por glucosa
-        if patient.gluc == 3:  # Muy alta
-            edad_metabolica += 1460  # +4 años en días
-        elif patient.gluc == 2:  # Alta
-            edad_metabolica += 730  # +2 años en días
-
-        # Ajustes por estilo de vida
-        if patient.smoke:  # Fumador
-            edad_metabolica += 1825  # +5 años en días
-        if patient.alco:  # Consumo de alcohol
-            edad_metabolica += 730  # +2 años en días
-        if not patient.active:  # Sedentarismo
-            edad_metabolica += 1095  # +3 años en días
-
-        return {
-            "imc": round(imc, 1),
-            "imc_category": self._classify_imc(imc),
-            "blood_pressure": presion_arterial,
-            "metabolic_age": edad_metabolica  # en días
-        }
-
-    def _generate_all_recommendations(self, patient: CardioHealth, probability: float) -> List[str]:
-        """Genera todas las recomendaciones detalladas"""
-        recommendations = []
-        imc = patient.weight / (patient.height ** 2)
-        factors = [f["factor"] for f in self._get_key_factors(pd.DataFrame([{
-            'age': patient.age,
-            'gender': patient.gender,
-            'height': patient.height,
-            'weight': patient.weight,
-            'ap_hi': patient.ap_hi,
-            'ap_lo': patient.ap_lo,
-            'cholesterol': patient.cholesterol,
-            'gluc': patient.gluc,
-            'smoke': patient.smoke,
-            'alco': patient.alco,
-            'active': patient.active
-        }]))]
-
-        # 1. Recomendaciones por nivel de riesgo
-        if probability > 0.8:
-            recommendations.extend([
-                "🚨 EMERGENCIA: Riesgo cardiovascular extremadamente alto (>80%)",
-                "🩺 Consulte a un cardiólogo dentro de las próximas 48 horas",
-                "📞 Contacte a su médico de cabecera inmediatamente"
-            ])
-        elif probability > 0.6:
-            recommendations.extend([
-                "⚠️ ALERTA: Riesgo cardiovascular alto (60-80%)",
-                "🩺 Programe cita con cardiólogo en los próximos 7 días",
-                "📝 Realice monitoreo diario de presión arterial"
-            ])
-
-        # 2. Recomendaciones por factores clave
-        for factor in factors:
-            if factor == 'ap_hi' and patient.ap_hi > 140:
-                recommendations.extend([
-                    "💊 Presión arterial elevada: Tome sus medicamentos puntualmente",
-                    "🧂 Reduzca consumo de sal a menos de 5g/día",
-                    "📉 Objetivo: Menos de 135/85 mmHg en casa"
-                ])
-
-            elif factor == 'cholesterol':
-                if patient.cholesterol == 3:
-                    recommendations.extend([
-                        "🩸 Colesterol muy elevado: Requiere tratamiento farmacológico",
-                        "🍳 Elimine grasas trans y saturadas de su dieta",
-                        "💊 Posible necesidad de estatinas (consulte a su médico)"
-                    ])
-                else:
-                    recommendations.extend([
-                        "🥑 Aumente consumo de grasas saludables (aguacate, nueces)",
-                        "🏃‍♂️ Ejercicio aeróbico 4x/semana para mejorar perfil lipídico"
-                    ])
-
-        # 3. Recomendaciones por IMC
-        if imc >= 30:
-            recommendations.extend([
-                "⚖️ Obesidad: Pérdida de peso prioritaria (5-10% en 6 meses)",
-                "🍽️ Consulte a nutricionista para plan personalizado",
-                "🚶‍♂️ Caminatas diarias de 45 minutos como mínimo"
-            ])
-        elif imc >= 25:
-            recommendations.extend([
-                "⚖️ Sobrepeso: Evite ganar más peso",
-                "🥗 Reduzca porciones y aumente vegetales",
-                "🏋️‍♂️ Combine cardio y entrenamiento de fuerza"
-            ])
-
-        # 4. Hábitos específicos
-        if patient.smoke == 1:
-            recommendations.extend([
-                "🚭 Tabaquismo: Programa de cesación tabáquica URGENTE",
-                "📱 Descargue app 'Dejar de Fumar' del Ministerio de Salud",
-                "☎️ Llame a la línea de ayuda 123-456-7890"
-            ])
-
-        if patient.active == 0:
-            recommendations.extend([
-                "🏃‍♂️ Sedentarismo: Comience con 10 minutos diarios de ejercicio",
-                "⏰ Use podómetro: Meta 8,000 pasos/día",
-                "🪑 Levantarse cada 30 minutos si trabaja sentado"
-            ])
-
-        # 5. Recomendaciones generales
-        recommendations.extend([
-            "💧 Hidratación: 2L de agua/día (excepto contraindicación médica)",
-            "😌 Manejo de estrés: Técnicas de respiración 5 min/día",
-            "🛌 Sueño: 7-9 horas/noche en horario regular"
-        ])
-
-        return recommendations
-
-    def _classify_imc(self, imc: float) -> str:
-        """Clasifica el IMC según rangos estándar de la OMS"""
-        if imc < 16:
-            return "Delgadez Severa"
-        elif imc < 17:
-            return "Delgadez Moderada"
-        elif imc < 18.5:
-            return "Delgadez Leve"
-        elif imc < 25:
-            return "Normal"
-        elif imc < 30:
-            return "Sobrepeso"
-        elif imc < 35:
-            return "Obesidad Grado 1"
-        elif imc < 40:
-            return "Obesidad Grado 2"
-        else:
-            return "Obesidad Grado 3"
-
-    def _classify_blood_pressure(self, systolic: int, diastolic: int) -> str:
-        """Clasifica la presión arterial según valores estándar"""
-        if systolic >= 180 or diastolic >= 110:
-            return "Hipertensión Crisis"
-        elif systolic >= 160 or diastolic >= 100:
-            return "Hipertensión Grado 2"
-        elif systolic >= 140 or diastolic >= 90:
-            return "Hipertensión Grado 1"
-        elif systolic >= 130 or diastolic >= 85:
-            return "Pre-hipertensión"
-        elif systolic >= 120 or diastolic >= 80:
-            return "Normal Alta"
-        else:
-            return "Normal"
-
-    def _calculate_metabolic_age(self, patient: CardioHealth) -> int:
-        edad_base = patient.age
-        imc = patient.weight / (patient.height ** 2)
-
-        if imc > 30:
-            edad_base += 10
-        elif imc > 25:
-            edad_base += 5
-        if patient.active == 0: edad_base += 5
-
-        return min(max(edad_base, patient.age), 100)
 
 recommendation_system = RecommendationSystem()
\ No newline at end of file
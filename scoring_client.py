@@ -0,0 +1,163 @@
+"""Cliente del servicio local de puntuación (ver scoring_service.py).
+
+Protocolo por socket Unix, tramas binarias sin serialización intermedia:
+
+- Petición: cabecera ``<QIB`` (id, filas, flags) y ``filas * 11`` float64 en el
+  orden de FEATURE_NAMES. ``filas = 0`` es un ping; el bit 1 de flags pide también
+  las contribuciones por característica.
+- Respuesta: cabecera ``<QIBBH`` (id, filas, estado, flags, longitud de la versión),
+  la versión del modelo en UTF-8, ``filas`` probabilidades float64 y, si los flags
+  lo indican, ``filas * 11`` contribuciones float64.
+
+Cada conexión admite varias peticiones en vuelo; las respuestas se asocian por id.
+El tamaño de cada respuesta se deduce solo de su cabecera, así que una respuesta
+que llega tarde (p. ej. tras un timeout) se descarta sin desalinear el socket.
+"""
+import asyncio
+import itertools
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Ruta base del socket; sin definir, la puntuación se hace en el propio worker
+SCORING_SOCKET = os.getenv("SCORING_SOCKET")
+# Procesos del servicio: cada uno escucha en "<SCORING_SOCKET>.<i>"
+SCORING_PROCESSES = int(os.getenv("SCORING_PROCESSES", "1"))
+SCORING_TIMEOUT_SECONDS = float(os.getenv("SCORING_TIMEOUT_SECONDS", "5"))
+
+N_FEATURES = 11
+FLAG_CONTRIBUTIONS = 1
+
+STATUS_OK = 0
+STATUS_NO_MODEL = 1
+STATUS_ERROR = 2
+
+REQUEST_HEADER = struct.Struct("<QIB")
+RESPONSE_HEADER = struct.Struct("<QIBBH")
+
+ScoreResult = Tuple[np.ndarray, Optional[np.ndarray], str]
+
+
+class ScoringUnavailable(Exception):
+    """El servicio no responde o no tiene modelo: el llamador puede puntuar en proceso"""
+
+
+def socket_paths(base: str, processes: int) -> List[str]:
+    return [f"{base}.{i}" for i in range(processes)]
+
+
+class _Connection:
+    """Una conexión con un proceso del servicio y sus peticiones en vuelo"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.closed = False
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    async def _read_responses(self):
+        error: Exception = ScoringUnavailable("Conexión con el servicio de puntuación cerrada")
+        try:
+            while True:
+                header = await self.reader.readexactly(RESPONSE_HEADER.size)
+                request_id, rows, status, flags, version_length = RESPONSE_HEADER.unpack(header)
+                version = (await self.reader.readexactly(version_length)).decode()
+                contributions = bool(flags & FLAG_CONTRIBUTIONS)
+                size = rows * 8 * (1 + (N_FEATURES if contributions else 0))
+                body = await self.reader.readexactly(size)
+                future = self.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status != STATUS_OK:
+                    future.set_exception(ScoringUnavailable(
+                        "El servicio de puntuación no tiene modelo" if status == STATUS_NO_MODEL
+                        else "Error en el servicio de puntuación"))
+                    continue
+                values = np.frombuffer(body, dtype=np.float64)
+                proba = values[:rows]
+                contrib = values[rows:].reshape(rows, N_FEATURES) if contributions else None
+                future.set_result((proba, contrib, version))
+        except (asyncio.IncompleteReadError, OSError, ValueError, struct.error) as e:
+            # También una trama mal formada: la conexión deja de ser utilizable
+            error = ScoringUnavailable(f"Conexión con el servicio de puntuación perdida: {str(e) or type(e).__name__}")
+        finally:
+            self.closed = True
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+            self.writer.close()
+
+    async def request(self, request_id: int, features: np.ndarray, flags: int) -> ScoreResult:
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            self.writer.write(REQUEST_HEADER.pack(request_id, len(features), flags) + features.tobytes())
+            await self.writer.drain()
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    def close(self):
+        self.closed = True
+        self._reader_task.cancel()
+        self.writer.close()
+
+
+class ScoringClient:
+    """Reparte las peticiones entre los procesos del servicio (round robin)"""
+
+    def __init__(self, base_path: str = SCORING_SOCKET, processes: int = SCORING_PROCESSES,
+                 timeout: float = SCORING_TIMEOUT_SECONDS):
+        self.paths = socket_paths(base_path, processes)
+        self.timeout = timeout
+        self.model_version: Optional[str] = None
+        self._connections: List[Optional[_Connection]] = [None] * len(self.paths)
+        self._next = 0
+        self._ids = itertools.count(1)
+
+    async def _connection(self, index: int) -> _Connection:
+        connection = self._connections[index]
+        if connection is None or connection.closed:
+            reader, writer = await asyncio.open_unix_connection(self.paths[index])
+            connection = self._connections[index] = _Connection(reader, writer)
+        return connection
+
+    async def _request(self, features: np.ndarray, flags: int) -> ScoreResult:
+        index = self._next % len(self.paths)
+        self._next += 1
+        connection = None
+        try:
+            connection = await self._connection(index)
+            result = await asyncio.wait_for(
+                connection.request(next(self._ids), features, flags), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            # Conexión descartada: la siguiente petición abre una nueva
+            if connection is not None:
+                connection.close()
+                self._connections[index] = None
+            raise ScoringUnavailable(f"Servicio de puntuación no disponible: {str(e) or type(e).__name__}")
+        self.model_version = result[2]
+        return result
+
+    async def score(self, features: np.ndarray, contributions: bool = False) -> ScoreResult:
+        """Probabilidades (y contribuciones) de ``features`` (n, 11) y versión del modelo"""
+        features = np.ascontiguousarray(features, dtype=np.float64)
+        return await self._request(features, FLAG_CONTRIBUTIONS if contributions else 0)
+
+    async def ping(self) -> Optional[str]:
+        """Versión del modelo servido, o None si el servicio no responde o no tiene modelo"""
+        try:
+            await self._request(np.empty((0, N_FEATURES)), 0)
+        except ScoringUnavailable:
+            return None
+        return self.model_version
+
+    def close(self):
+        for connection in self._connections:
+            if connection is not None:
+                connection.close()
+        self._connections = [None] * len(self.paths)
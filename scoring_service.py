@@ -0,0 +1,210 @@
+"""Servicio local de puntuación: procesos dedicados que tienen el modelo y puntúan por lotes.
+
+Con ``SCORING_SOCKET`` definido, los workers web no cargan el modelo: envían las
+características por socket Unix (protocolo en scoring_client.py) y solo hacen E/S.
+Cada proceso del servicio acumula las peticiones que llegan durante
+``SCORING_BATCH_WINDOW_MS`` (o hasta ``SCORING_BATCH_MAX_ROWS`` filas) y las puntúa
+con una sola llamada al bosque aplanado. El rendimiento escala con el número de
+procesos (``--processes``, uno por núcleo dedicado); los clientes los usan en round robin.
+
+Cada proceso carga el último modelo del almacén al arrancar y vuelve a mirar el
+puntero 'latest' cada ``SCORING_RELOAD_SECONDS``: los modelos que entrenan o
+promueven los workers (o model_search) se sirven sin reiniciar el servicio.
+
+Uso por línea de comandos:
+
+    python scoring_service.py --socket /tmp/cardio-scoring.sock --processes 2
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from model_store import model_store
+from recommendations import MODEL_PARAMS, RecommendationSystem
+from scoring_client import (
+    FLAG_CONTRIBUTIONS, N_FEATURES, REQUEST_HEADER, RESPONSE_HEADER, SCORING_PROCESSES, SCORING_SOCKET,
+    STATUS_ERROR, STATUS_NO_MODEL, STATUS_OK, socket_paths
+)
+
+SCORING_BATCH_WINDOW_MS = float(os.getenv("SCORING_BATCH_WINDOW_MS", "2"))
+SCORING_BATCH_MAX_ROWS = int(os.getenv("SCORING_BATCH_MAX_ROWS", "4096"))
+SCORING_RELOAD_SECONDS = float(os.getenv("SCORING_RELOAD_SECONDS", "10"))
+
+# Petición en cola: (writer, id, características, flags)
+Pending = Tuple[asyncio.StreamWriter, int, np.ndarray, int]
+
+
+class ScoringServer:
+    """Un proceso del servicio: un modelo, un socket y una cola de micro-lotes"""
+
+    def __init__(self, path: str, system: Optional[RecommendationSystem] = None,
+                 window_ms: float = SCORING_BATCH_WINDOW_MS, max_rows: int = SCORING_BATCH_MAX_ROWS):
+        self.path = path
+        self.system = system or RecommendationSystem()
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self.pending: List[Pending] = []
+        self.pending_rows = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    # --- Modelo ---
+
+    def reload_if_changed(self) -> bool:
+        """Carga el último modelo del almacén si es distinto del servido"""
+        params = model_store.load_promoted_params() or dict(MODEL_PARAMS)
+        key = model_store.latest_key(params)
+        if key is None or key == self.system.model_version:
+            return False
+        if self.system.load_from_store():
+            print(f"Servicio de puntuación {self.path}: modelo {self.system.model_version}")
+            return True
+        return False
+
+    async def run_reload(self, interval: float = SCORING_RELOAD_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                print(f"Error recargando el modelo en {self.path}: {e}")
+
+    # --- Conexiones ---
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readexactly(REQUEST_HEADER.size)
+                request_id, rows, flags = REQUEST_HEADER.unpack(header)
+                if rows == 0:
+                    # Ping: versión del modelo servido
+                    self._reply(writer, request_id, STATUS_OK if self.system.is_trained() else STATUS_NO_MODEL)
+                    continue
+                body = await reader.readexactly(rows * N_FEATURES * 8)
+                features = np.frombuffer(body, dtype=np.float64).reshape(rows, N_FEATURES)
+                self._enqueue((writer, request_id, features, flags))
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    def _reply(self, writer: asyncio.StreamWriter, request_id: int, status: int, *arrays: np.ndarray):
+        """Respuesta autodescrita: filas y flags en la cabecera determinan el tamaño del cuerpo"""
+        if writer.is_closing():
+            return
+        version = (self.system.model_version or "").encode()
+        rows = len(arrays[0]) if arrays else 0
+        flags = FLAG_CONTRIBUTIONS if len(arrays) > 1 else 0
+        writer.write(b"".join([RESPONSE_HEADER.pack(request_id, rows, status, flags, len(version)), version,
+                               *(np.ascontiguousarray(array, dtype=np.float64).tobytes() for array in arrays)]))
+
+    # --- Micro-lotes ---
+
+    def _enqueue(self, request: Pending):
+        self.pending.append(request)
+        self.pending_rows += len(request[2])
+        if self.pending_rows >= self.max_rows:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _flush(self):
+        """Puntúa todas las peticiones en cola con una llamada al modelo y responde a cada una"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self.pending, self.pending_rows = self.pending, [], 0
+        if not batch:
+            return
+        system = self.system
+        if not system.is_trained():
+            for writer, request_id, _, _ in batch:
+                self._reply(writer, request_id, STATUS_NO_MODEL)
+            return
+
+        try:
+            features = np.concatenate([request[2] for request in batch])
+            proba = system._predict_proba(system.model, system.forest, features)
+            # Contribuciones solo de las filas que las piden (las páginas de un paciente)
+            wanted = np.concatenate([np.full(len(request[2]), bool(request[3] & FLAG_CONTRIBUTIONS))
+                                     for request in batch])
+            contributions = system.forest.contributions(features[wanted]) if wanted.any() else None
+        except Exception as e:
+            print(f"Error puntuando un lote en {self.path}: {e}")
+            for writer, request_id, _, _ in batch:
+                self._reply(writer, request_id, STATUS_ERROR)
+            return
+
+        start = contribution_start = 0
+        for writer, request_id, request_features, flags in batch:
+            end = start + len(request_features)
+            if flags & FLAG_CONTRIBUTIONS:
+                contribution_end = contribution_start + len(request_features)
+                self._reply(writer, request_id, STATUS_OK, proba[start:end],
+                            contributions[contribution_start:contribution_end])
+                contribution_start = contribution_end
+            else:
+                self._reply(writer, request_id, STATUS_OK, proba[start:end])
+            start = end
+
+    async def serve(self):
+        if not self.system.load_from_store():
+            print(f"Servicio de puntuación {self.path}: sin modelo en el almacén, esperando uno")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle, path=self.path)
+        reload_task = asyncio.create_task(self.run_reload())
+        print(f"Servicio de puntuación escuchando en {self.path} (modelo {self.system.model_version})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reload_task.cancel()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def run_server(path: str):
+    """Punto de entrada de cada proceso del servicio"""
+    try:
+        asyncio.run(ScoringServer(path).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Servicio local de puntuación del modelo de riesgo")
+    parser.add_argument("--socket", default=SCORING_SOCKET, help="Ruta base de los sockets (SCORING_SOCKET)")
+    parser.add_argument("--processes", type=int, default=SCORING_PROCESSES,
+                        help="Procesos de puntuación, uno por núcleo dedicado")
+    args = parser.parse_args(argv)
+    if not args.socket:
+        parser.error("Indique --socket o defina SCORING_SOCKET")
+
+    paths = socket_paths(args.socket, args.processes)
+    if len(paths) == 1:
+        run_server(paths[0])
+        return
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_server, args=(path,), name=f"scoring-{i}", daemon=True)
+                 for i, path in enumerate(paths)]
+    # SIGTERM (p. ej. del supervisor) también detiene los procesos hijos
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    main()
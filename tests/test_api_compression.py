@@ -0,0 +1,68 @@
+"""Compresión de las respuestas de /api/v1 según Accept-Encoding."""
+import asyncio
+import gzip
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+import api
+from api import API_PREFIX, CompressionMiddleware, FastJSONResponse
+
+PAYLOAD = {"data": [{"id": i, "age": 18000 + i, "ap_hi": 120} for i in range(200)]}
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get(API_PREFIX + "/records")
+    async def records():
+        return FastJSONResponse(PAYLOAD)
+
+    @app.get(API_PREFIX + "/records/stream")
+    async def stream():
+        async def lines():
+            for row in PAYLOAD["data"]:
+                yield api.dumps(row) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.get("/records")
+    async def html_records():
+        return FastJSONResponse(PAYLOAD)
+
+    return app
+
+
+def _get(path: str, accept_encoding: str):
+    """Cabeceras y cuerpo sin descomprimir: se comprueban los bytes tal como llegan"""
+    async def run():
+        transport = httpx.ASGITransport(app=_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as client:
+            request = client.build_request("GET", path, headers={"Accept-Encoding": accept_encoding})
+            response = await client.send(request, stream=True)
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+            return response.headers, body
+    return asyncio.run(run())
+
+
+@pytest.mark.skipif(api.brotli is None, reason="brotli no instalado")
+@pytest.mark.parametrize("path", ["/records", "/records/stream"])
+def test_brotli_when_accepted(path):
+    headers, body = _get(API_PREFIX + path, "gzip, br")
+    assert headers["content-encoding"] == "br"
+    decoded = api.brotli.decompress(body)
+    assert decoded.startswith(b'{"')
+    assert b'"age":18199' in decoded
+
+
+def test_gzip_without_brotli_in_accept_encoding():
+    headers, body = _get(API_PREFIX + "/records", "gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert gzip.decompress(body) == api.dumps(PAYLOAD)
+
+
+def test_routes_outside_the_api_are_not_compressed():
+    headers, _ = _get("/records", "gzip, br")
+    assert "content-encoding" not in headers
@@ -0,0 +1,60 @@
+"""Exportación con riesgo cuando la puntuación la hace el servicio de puntuación."""
+import asyncio
+import io
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import connection_db
+from bulk_export import export_stream
+from database_model import CardioHealth
+from recommendations import recommendation_system
+
+
+class FakeScorer:
+    """Sustituto de ScoringClient: probabilidad fija por fila, sin socket"""
+
+    model_version = "sidecar-1"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def score(self, features: np.ndarray, contributions: bool = False):
+        self.calls += 1
+        return np.full(len(features), 0.7), None, self.model_version
+
+
+def test_export_with_risk_uses_the_scoring_service(monkeypatch, tmp_path):
+    scorer = FakeScorer()
+    # Como en un worker con SCORING_SOCKET: sin modelo local
+    monkeypatch.setattr(recommendation_system, "scorer", scorer)
+    monkeypatch.setattr(recommendation_system, "forest", None)
+    monkeypatch.setattr(recommendation_system, "model", None)
+
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'export.db'}")
+        monkeypatch.setattr(connection_db, "engine", engine)
+        monkeypatch.setattr(connection_db, "async_session",
+                            sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+        monkeypatch.setattr(connection_db, "read_async_session", None)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+            async with AsyncSession(engine) as session:
+                session.add_all([CardioHealth(age=18000 + i, gender=1, height=170.0, weight=70.0, ap_hi=120,
+                                              ap_lo=80, cholesterol=1, gluc=1, smoke=0, alco=0, active=1,
+                                              cardio=0) for i in range(12)])
+                await session.commit()
+            return b"".join([data async for data in export_stream("csv", with_risk=True, chunk_size=5)])
+        finally:
+            await engine.dispose()
+
+    exported = pd.read_csv(io.BytesIO(asyncio.run(run())))
+    assert len(exported) == 12
+    assert (exported["risk_probability"] == 0.7).all()
+    assert (exported["risk_level"] == "Alto").all()
+    assert scorer.calls == 3
@@ -0,0 +1,43 @@
+"""Filtros de la puntuación masiva evaluados sobre el almacén de características."""
+import numpy as np
+import pytest
+
+import db_operations
+from db_operations import CardioHealthOperations
+from feature_store import STORE_COLUMNS, FeatureStore
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = FeatureStore(tmp_path)
+    values = []
+    for i in range(6):
+        row = {"age": 18000 + i, "gender": i % 2, "height": 170.5, "weight": 70.0, "ap_hi": 120 + i,
+               "ap_lo": 80, "cholesterol": 1 + i % 3, "gluc": 1, "smoke": i % 2, "alco": 0,
+               "active": 1, "cardio": 0}
+        values.append([row[name] for name in STORE_COLUMNS])
+    store.upsert_rows(np.arange(1, 7), values)
+    store.finish_load(0)
+    monkeypatch.setattr(db_operations, "feature_store", store)
+    return store
+
+
+def _ids(store, filters):
+    return store.ids[CardioHealthOperations.feature_store_rows(filters=filters)].tolist()
+
+
+def test_integer_filters_match_exact_values(store):
+    assert _ids(store, {"smoke": 1.0}) == [2, 4, 6]
+    assert _ids(store, {"smoke": 1.0, "cholesterol": 2.0}) == [2]
+    assert _ids(store, {"height": 170.5}) == [1, 2, 3, 4, 5, 6]
+
+
+@pytest.mark.parametrize("filters", [
+    {"smoke": 1.5},       # no es entero: convertirlo daría los fumadores
+    {"smoke": 257.0},     # fuera de int8: convertirlo daría 1
+    {"ap_hi": 65656.0},   # fuera de int16
+    {"smoke": float("inf")},
+    {"smoke": float("nan")},
+])
+def test_values_outside_the_column_type_match_nothing(store, filters):
+    assert _ids(store, filters) == []
@@ -0,0 +1,105 @@
+"""Bosque aplanado frente a RandomForestClassifier."""
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from flat_forest import CompactForest, FlatForest, compare_forests
+from recommendations import FEATURE_NAMES
+
+
+def _dataset(n: int, seed: int):
+    rng = np.random.default_rng(seed)
+    features = np.column_stack([
+        rng.integers(30 * 365, 65 * 365, n), rng.integers(0, 2, n), rng.uniform(150, 195, n),
+        rng.uniform(50, 120, n), rng.normal(128, 15, n).round(), rng.normal(82, 9, n).round(),
+        rng.integers(1, 4, n), rng.integers(1, 4, n), rng.integers(0, 2, n), rng.integers(0, 2, n),
+        rng.integers(0, 2, n)
+    ]).astype(np.float64)
+    risk = (features[:, 4] - 120) / 20 + (features[:, 6] - 1) + features[:, 8] + rng.normal(0, 1, n)
+    return features, (risk > 1).astype(np.int64)
+
+
+@pytest.fixture(scope="module", params=["array", "frame"])
+def fitted(request):
+    features, target = _dataset(600, seed=3)
+    model = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0)
+    # Como en producción: ajustado sobre un DataFrame con los nombres de columna
+    model.fit(pd.DataFrame(features, columns=FEATURE_NAMES) if request.param == "frame" else features, target)
+    probe, _ = _dataset(400, seed=4)
+    return model, FlatForest(model), probe
+
+
+def test_predict_proba_is_exactly_sklearn(fitted):
+    model, forest, probe = fitted
+    X = pd.DataFrame(probe, columns=FEATURE_NAMES) if hasattr(model, "feature_names_in_") else probe
+    assert np.array_equal(forest.predict_proba(probe), model.predict_proba(X)[:, 1])
+    assert forest.matches(model, probe)
+
+
+def test_matches_detects_a_different_model(fitted):
+    model, forest, probe = fitted
+    other = FlatForest(model)
+    other.value = other.value.copy()
+    other.value[other.is_leaf] = 1 - other.value[other.is_leaf]
+    assert not other.matches(model, probe)
+
+
+def test_bias_plus_contributions_is_the_prediction(fitted):
+    _, forest, probe = fitted
+    contributions = forest.contributions(probe)
+    assert contributions.shape == (len(probe), len(FEATURE_NAMES))
+    np.testing.assert_allclose(forest.bias + contributions.sum(axis=1), forest.predict_proba(probe), atol=1e-12)
+
+
+@pytest.mark.parametrize("leaf_bits", [8, 16])
+def test_compact_forest_reports_prediction_and_contribution_drift(fitted, leaf_bits):
+    _, forest, probe = fitted
+    compact = CompactForest(forest, leaf_bits)
+    report = compare_forests(compact, forest, probe)
+    # Cuantización: como mucho medio paso por árbol, también en el promedio
+    assert report["max_abs_error"] <= 0.5 / (2 ** leaf_bits - 1) + 1e-12
+    # Las contribuciones de la forma compacta siguen sumando su propia predicción
+    np.testing.assert_allclose(compact.bias + compact.contributions(probe).sum(axis=1),
+                               compact.predict_proba(probe), atol=1e-9)
+    expected = np.abs(compact.contributions(probe) - forest.contributions(probe)).max()
+    assert report["max_contribution_error"] == pytest.approx(expected)
+    assert 0.0 <= report["factor_agreement"] <= 1.0
+
+
+def test_compare_forests_with_itself_is_exact(fitted):
+    _, forest, probe = fitted
+    report = compare_forests(forest, forest, probe)
+    assert report["max_abs_error"] == report["max_contribution_error"] == 0.0
+    assert report["factor_agreement"] == report["class_agreement"] == 1.0
+
+
+def test_swap_prepares_off_the_event_loop(fitted, monkeypatch):
+    import asyncio
+    import threading
+
+    from recommendations import RecommendationSystem
+    model, _, probe = fitted
+    system = RecommendationSystem()
+    threads = {}
+    prepare, install = system._prepare_model, system._install_model
+
+    def tracked_prepare(*args):
+        threads["prepare"] = threading.get_ident()
+        return prepare(*args)
+
+    def tracked_install(*args):
+        threads["install"] = threading.get_ident()
+        return install(*args)
+
+    monkeypatch.setattr(system, "_prepare_model", tracked_prepare)
+    monkeypatch.setattr(system, "_install_model", tracked_install)
+
+    async def swap():
+        threads["loop"] = threading.get_ident()
+        await system._swap_model_async(model, "v-test", probe=probe[:50])
+
+    asyncio.run(swap())
+    # Aplanado y verificaciones en el pool de hilos; solo la instalación en el loop
+    assert threads["prepare"] != threads["loop"] == threads["install"]
+    assert system.model_version == "v-test" and system.forest is not None
@@ -0,0 +1,194 @@
+"""El motor de reglas da lo mismo que las cadenas if/elif a las que sustituye.
+
+Las funciones ``_reference_*`` son las cadenas originales de RecommendationSystem,
+con el IMC de los mensajes ya calculado con la altura en metros.
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from health_rules import (
+    FEATURE_NAMES, RECOMMENDATION_RULES, RISK_COLORS, RISK_LEVELS, evaluate_rules, health_metrics,
+    recommendation_messages, risk_index, rule_columns
+)
+
+RULE_MESSAGES = {rule["id"]: rule["messages"] for rule in RECOMMENDATION_RULES}
+
+# Altura 200 cm: IMC = peso / 4, así que cada límite de IMC_BINS es un peso exacto
+IMC_EDGES = [16, 17, 18.5, 25, 30, 35, 40]
+WEIGHTS = sorted({w for imc in IMC_EDGES for w in (imc * 4 - 0.01, imc * 4, imc * 4 + 0.01)})
+SYSTOLIC = [119, 120, 129, 130, 139, 140, 141, 159, 160, 179, 180]
+DIASTOLIC = [79, 80, 84, 85, 89, 90, 99, 100, 109, 110]
+PROBABILITIES = [0.0, 0.4, np.nextafter(0.4, 1), 0.6, np.nextafter(0.6, 1), 0.8, np.nextafter(0.8, 1), 1.0]
+
+
+def _reference_imc_category(imc):
+    if imc < 16:
+        return "Delgadez Severa"
+    elif imc < 17:
+        return "Delgadez Moderada"
+    elif imc < 18.5:
+        return "Delgadez Leve"
+    elif imc < 25:
+        return "Normal"
+    elif imc < 30:
+        return "Sobrepeso"
+    elif imc < 35:
+        return "Obesidad Grado 1"
+    elif imc < 40:
+        return "Obesidad Grado 2"
+    else:
+        return "Obesidad Grado 3"
+
+
+def _reference_blood_pressure(systolic, diastolic):
+    if systolic >= 180 or diastolic >= 110:
+        return "Hipertensión Crisis"
+    elif systolic >= 160 or diastolic >= 100:
+        return "Hipertensión Grado 2"
+    elif systolic >= 140 or diastolic >= 90:
+        return "Hipertensión Grado 1"
+    elif systolic >= 130 or diastolic >= 85:
+        return "Pre-hipertensión"
+    elif systolic >= 120 or diastolic >= 80:
+        return "Normal Alta"
+    else:
+        return "Normal"
+
+
+def _reference_metabolic_age(p, imc):
+    edad_metabolica = p["age"]
+    if imc >= 30:
+        edad_metabolica += 1825
+    elif imc >= 25:
+        edad_metabolica += 730
+    elif imc < 18.5:
+        edad_metabolica += 365
+    if p["ap_hi"] >= 140 or p["ap_lo"] >= 90:
+        edad_metabolica += 1460
+    elif p["ap_hi"] >= 130 or p["ap_lo"] >= 85:
+        edad_metabolica += 730
+    if p["cholesterol"] == 3:
+        edad_metabolica += 1825
+    elif p["cholesterol"] == 2:
+        edad_metabolica += 730
+    if p["gluc"] == 3:
+        edad_metabolica += 1460
+    elif p["gluc"] == 2:
+        edad_metabolica += 730
+    if p["smoke"]:
+        edad_metabolica += 1825
+    if p["alco"]:
+        edad_metabolica += 730
+    if not p["active"]:
+        edad_metabolica += 1095
+    return edad_metabolica
+
+
+def _reference_risk(probability):
+    if probability > 0.8:
+        return "Extremo", "#FF0000"
+    elif probability > 0.6:
+        return "Alto", "#FF6B00"
+    elif probability > 0.4:
+        return "Moderado", "#FFC100"
+    else:
+        return "Bajo", "#00B050"
+
+
+def _reference_recommendations(p, probability, factors):
+    recommendations = []
+    imc = p["weight"] / (p["height"] / 100) ** 2
+    if probability > 0.8:
+        recommendations.extend(RULE_MESSAGES["riesgo_extremo"])
+    elif probability > 0.6:
+        recommendations.extend(RULE_MESSAGES["riesgo_alto"])
+    for factor in factors:
+        if factor == 'ap_hi' and p["ap_hi"] > 140:
+            recommendations.extend(RULE_MESSAGES["presion_elevada"])
+        elif factor == 'cholesterol':
+            if p["cholesterol"] == 3:
+                recommendations.extend(RULE_MESSAGES["colesterol_muy_alto"])
+            else:
+                recommendations.extend(RULE_MESSAGES["colesterol"])
+    if imc >= 30:
+        recommendations.extend(RULE_MESSAGES["obesidad"])
+    elif imc >= 25:
+        recommendations.extend(RULE_MESSAGES["sobrepeso"])
+    if p["smoke"] == 1:
+        recommendations.extend(RULE_MESSAGES["tabaquismo"])
+    if p["active"] == 0:
+        recommendations.extend(RULE_MESSAGES["sedentarismo"])
+    recommendations.extend(RULE_MESSAGES["generales"])
+    return recommendations
+
+
+def _patients():
+    """Combinaciones de valores en los límites de cada intervalo"""
+    rows = []
+    for weight, (ap_hi, ap_lo), cholesterol, gluc, habits in itertools.product(
+            WEIGHTS, zip(SYSTOLIC, itertools.cycle(DIASTOLIC)), (1, 2, 3), (1, 2, 3),
+            itertools.product((0, 1), repeat=3)):
+        smoke, alco, active = habits
+        rows.append({"age": 18250, "gender": 1, "height": 200.0, "weight": weight, "ap_hi": ap_hi,
+                     "ap_lo": ap_lo, "cholesterol": cholesterol, "gluc": gluc,
+                     "smoke": smoke, "alco": alco, "active": active})
+    # Presión: todas las parejas de límites sistólica/diastólica
+    for ap_hi, ap_lo in itertools.product(SYSTOLIC, DIASTOLIC):
+        rows.append({**rows[0], "ap_hi": ap_hi, "ap_lo": ap_lo})
+    return rows
+
+
+def _features(patients):
+    return np.array([[float(p[name]) for name in FEATURE_NAMES] for p in patients])
+
+
+def test_health_metrics_match_reference():
+    patients = _patients()
+    metrics = health_metrics(rule_columns(_features(patients)))
+    for i, p in enumerate(patients):
+        imc = p["weight"] / (p["height"] / 100) ** 2
+        assert metrics["imc"][i] == round(imc, 1)
+        assert metrics["imc_category"][i] == _reference_imc_category(imc), p
+        assert metrics["blood_pressure"][i] == _reference_blood_pressure(p["ap_hi"], p["ap_lo"]), p
+        assert metrics["metabolic_age"][i] == _reference_metabolic_age(p, imc), p
+
+
+def test_risk_levels_match_reference():
+    index = risk_index(np.array(PROBABILITIES))
+    for probability, i in zip(PROBABILITIES, index):
+        assert (RISK_LEVELS[i], RISK_COLORS[i]) == _reference_risk(probability), probability
+
+
+@pytest.mark.parametrize("factors", [
+    ["ap_hi", "cholesterol", "age"],
+    ["cholesterol", "ap_hi", "smoke"],
+    ["age", "weight", "gluc"],
+])
+def test_recommendation_messages_match_reference(factors):
+    patients = _patients()[::7]
+    features = _features(patients)
+    for probability in PROBABILITIES:
+        columns = rule_columns(features, np.full(len(patients), probability))
+        matched = evaluate_rules(RECOMMENDATION_RULES, columns)
+        for i, p in enumerate(patients):
+            assert recommendation_messages(matched[i], factors) == \
+                _reference_recommendations(p, probability, factors), (p, probability)
+
+
+def test_summary_deltas_use_the_same_categories():
+    from population_stats import summary_deltas
+
+    patients = _patients()[::11]
+    rows = [{**p, "cardio": i % 2} for i, p in enumerate(patients)]
+    deltas = summary_deltas(rows)
+    for dimension, reference in (
+            ("imc", lambda p: _reference_imc_category(p["weight"] / (p["height"] / 100) ** 2)),
+            ("blood_pressure", lambda p: _reference_blood_pressure(p["ap_hi"], p["ap_lo"]))):
+        expected = {}
+        for row in rows:
+            counts = expected.setdefault((dimension, reference(row)), [0, 0])
+            counts[0] += 1
+            counts[1] += row["cardio"]
+        assert {key: value for key, value in deltas.items() if key[0] == dimension} == expected
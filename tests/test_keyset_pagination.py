@@ -0,0 +1,107 @@
+"""Paginación keyset de /records: cursores hacia delante y hacia atrás."""
+import asyncio
+import random
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database_model import CardioHealth
+from db_operations import CardioHealthOperations
+
+N_ROWS = 53
+PER_PAGE = 10
+
+
+def _row(rng: random.Random) -> CardioHealth:
+    # Pocos valores de ap_hi: muchos empates que el id tiene que desempatar
+    return CardioHealth(
+        age=rng.randint(30 * 365, 65 * 365), gender=rng.randint(0, 1), height=170.0, weight=70.0,
+        ap_hi=rng.choice((110, 120, 130, 140)), ap_lo=80, cholesterol=rng.randint(1, 3),
+        gluc=1, smoke=0, alco=0, active=1, cardio=rng.randint(0, 1))
+
+
+def _walk(tmp_path, steps):
+    """Ejecuta ``steps(session)`` sobre una base SQLite temporal con N_ROWS filas"""
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'keyset.db'}")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all, tables=[CardioHealth.__table__])
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                rng = random.Random(11)
+                session.add_all([_row(rng) for _ in range(N_ROWS)])
+                await session.commit()
+                return await steps(session)
+        finally:
+            await engine.dispose()
+    return asyncio.run(run())
+
+
+def _page(session, sort, order, cursor=None):
+    return CardioHealthOperations.get_all_records(session, cursor=cursor, per_page=PER_PAGE, sort=sort, order=order)
+
+
+def _keys(page, sort):
+    return [(getattr(record, sort), record.id) for record in page["data"]]
+
+
+@pytest.mark.parametrize("sort, order", [("id", "asc"), ("id", "desc"), ("ap_hi", "asc"), ("ap_hi", "desc")])
+def test_forward_then_backward_visits_every_row_once(tmp_path, sort, order):
+    async def steps(session):
+        forward = [await _page(session, sort, order)]
+        while forward[-1]["next_cursor"]:
+            forward.append(await _page(session, sort, order, forward[-1]["next_cursor"]))
+        backward = [forward[-1]]
+        while backward[-1]["prev_cursor"]:
+            backward.append(await _page(session, sort, order, backward[-1]["prev_cursor"]))
+        return forward, backward
+
+    forward, backward = _walk(tmp_path, steps)
+
+    keys = [key for page in forward for key in _keys(page, sort)]
+    assert len(keys) == N_ROWS
+    assert keys == sorted(keys, reverse=order == "desc")
+    assert forward[0]["prev_cursor"] is None
+    assert all(len(page["data"]) == PER_PAGE for page in forward[:-1])
+    # Hacia atrás se obtienen las mismas páginas, cada una en el orden pedido
+    assert [_keys(page, sort) for page in reversed(backward)] == [_keys(page, sort) for page in forward]
+
+
+def test_prev_from_second_page_returns_first_page(tmp_path):
+    async def steps(session):
+        first = await _page(session, "ap_hi", "desc")
+        second = await _page(session, "ap_hi", "desc", first["next_cursor"])
+        again = await _page(session, "ap_hi", "desc", second["prev_cursor"])
+        return first, again
+
+    first, again = _walk(tmp_path, steps)
+    assert _keys(again, "ap_hi") == _keys(first, "ap_hi")
+    assert again["prev_cursor"] is None
+    assert again["next_cursor"] is not None
+
+
+def test_cursor_from_another_sort_starts_over(tmp_path):
+    async def steps(session):
+        by_id = await _page(session, "id", "asc")
+        second_by_id = await _page(session, "id", "asc", by_id["next_cursor"])
+        first_by_ap_hi = await _page(session, "ap_hi", "asc")
+        reused = await _page(session, "ap_hi", "asc", second_by_id["next_cursor"])
+        reversed_order = await _page(session, "id", "desc", by_id["next_cursor"])
+        first_desc = await _page(session, "id", "desc")
+        return first_by_ap_hi, reused, reversed_order, first_desc
+
+    first_by_ap_hi, reused, reversed_order, first_desc = _walk(tmp_path, steps)
+    assert _keys(reused, "ap_hi") == _keys(first_by_ap_hi, "ap_hi")
+    assert _keys(reversed_order, "id") == _keys(first_desc, "id")
+
+
+def test_malformed_cursor_is_rejected(tmp_path):
+    async def steps(session):
+        with pytest.raises(HTTPException) as error:
+            await _page(session, "id", "asc", cursor="no-es-un-cursor")
+        return error.value.status_code
+
+    assert _walk(tmp_path, steps) == 400
@@ -0,0 +1,89 @@
+"""Lecturas de las páginas HTML: réplica solo si refleja las marcas de page_cache."""
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import connection_db
+from database_model import CardioHealth
+from db_operations import CardioHealthOperations
+from page_cache import page_cache
+
+
+def _record(weight: float) -> CardioHealth:
+    return CardioHealth(age=18000, gender=1, height=170.0, weight=weight, ap_hi=120, ap_lo=80,
+                        cholesterol=1, gluc=1, smoke=0, alco=0, active=1, cardio=0)
+
+
+async def _read_weights(monkeypatch, tmp_path, primary_rows: int, replica_rows: int):
+    """Primario y réplica en dos ficheros SQLite; la réplica puede ir por detrás"""
+    engines = {}
+    for name, rows in (("primary", primary_rows), ("replica", replica_rows)):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            session.add_all([_record(70.0 + i) for i in range(rows)])
+            await session.commit()
+        engines[name] = engine
+    factory = {name: sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+               for name, engine in engines.items()}
+    monkeypatch.setattr(connection_db, "engine", engines["primary"])
+    monkeypatch.setattr(connection_db, "async_session", factory["primary"])
+    monkeypatch.setattr(connection_db, "read_engine", engines["replica"])
+    monkeypatch.setattr(connection_db, "read_async_session", factory["replica"])
+    try:
+        async with CardioHealthOperations.page_read_session() as session:
+            result = await CardioHealthOperations.get_all_records(session, per_page=100)
+        return len(result["data"])
+    finally:
+        for engine in engines.values():
+            await engine.dispose()
+
+
+@pytest.fixture
+def marks(monkeypatch):
+    def set_marks(high_water_mark, last_change_id=0):
+        monkeypatch.setattr(page_cache, "baseline", 0)
+        monkeypatch.setattr(page_cache, "high_water_mark", high_water_mark)
+        monkeypatch.setattr(page_cache, "last_change_id", last_change_id)
+    return set_marks
+
+
+def test_replica_serves_when_caught_up(monkeypatch, tmp_path, marks):
+    # Primario con una fila más de la que marca page_cache: se nota si se lee de él
+    marks(3)
+    assert asyncio.run(_read_weights(monkeypatch, tmp_path, primary_rows=4, replica_rows=3)) == 3
+
+
+def test_lagging_replica_falls_back_to_primary(monkeypatch, tmp_path, marks):
+    marks(4)
+    assert asyncio.run(_read_weights(monkeypatch, tmp_path, primary_rows=4, replica_rows=3)) == 4
+
+
+def test_replica_behind_on_edits_falls_back_to_primary(monkeypatch, tmp_path, marks):
+    # La réplica no tiene ninguna edición registrada
+    marks(3, last_change_id=1)
+    assert asyncio.run(_read_weights(monkeypatch, tmp_path, primary_rows=4, replica_rows=3)) == 4
+
+
+def test_record_versions_are_bounded_without_stale_etags():
+    from page_cache import PageCache
+    cache = PageCache(versions_size=2)
+    cache.start(high_water_mark=10, last_change_id=5)
+    cache.record_changed(1, 6)
+    before = cache.record_etag("detail", 1)
+    cache.record_changed(2, 7)
+    cache.record_changed(3, 8)
+    # Se descarta la versión del registro 1 y la base sube a ella
+    assert list(cache.record_versions) == [2, 3]
+    assert cache.baseline == 6
+    assert cache.record_etag("detail", 1) == before
+    cache.record_changed(4, 9)
+    # Tras otra subida de la base el registro 1 cambia de ETag, nunca vuelve al de antes
+    assert cache.baseline == 7
+    assert cache.record_etag("detail", 1) != before
+    assert len(cache.record_versions) == 2
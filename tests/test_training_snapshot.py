@@ -0,0 +1,42 @@
+"""Refresco incremental del snapshot de entrenamiento."""
+import numpy as np
+
+from training import TrainingSnapshot
+
+
+def _snapshot(ids, high_water_mark=0, last_change_id=0):
+    ids = np.asarray(ids, dtype=np.int64)
+    # Cada fila lleva su id en las características para poder seguirla tras el merge
+    features = np.repeat(ids[:, None].astype(np.float64), 3, axis=1)
+    return TrainingSnapshot(ids, features, ids % 2, high_water_mark, last_change_id)
+
+
+def test_apply_delta_replaces_edited_and_appends_new_rows():
+    base = _snapshot([1, 2, 4, 7], high_water_mark=7, last_change_id=3)
+    # Filas 2 y 7 editadas, 9 y 5 nuevas (5 llega fuera de orden, p. ej. un hueco de la secuencia)
+    delta_ids = np.array([2, 9, 7, 5], dtype=np.int64)
+    delta_features = np.array([[-2.0] * 3, [9.0] * 3, [-7.0] * 3, [5.0] * 3])
+    delta_target = np.array([1, 0, 0, 1])
+
+    merged = base.apply_delta(delta_ids, delta_features, delta_target, high_water_mark=9, last_change_id=5)
+
+    assert merged.ids.tolist() == [1, 2, 4, 5, 7, 9]
+    assert merged.features[:, 0].tolist() == [1.0, -2.0, 4.0, 5.0, -7.0, 9.0]
+    assert merged.target.tolist() == [1, 1, 0, 1, 0, 0]
+    assert (merged.high_water_mark, merged.last_change_id) == (9, 5)
+    assert len(merged) == 6
+
+
+def test_apply_delta_leaves_original_untouched():
+    base = _snapshot([1, 2, 3], high_water_mark=3, last_change_id=4)
+    base.apply_delta(np.array([2]), np.array([[0.0] * 3]), np.array([0]), high_water_mark=1, last_change_id=2)
+    assert base.features[:, 0].tolist() == [1.0, 2.0, 3.0]
+    assert base.target.tolist() == [1, 0, 1]
+
+
+def test_apply_delta_keeps_newest_marks():
+    base = _snapshot([1, 2, 3], high_water_mark=3, last_change_id=4)
+    merged = base.apply_delta(np.array([], dtype=np.int64), np.empty((0, 3)), np.array([], dtype=np.int64),
+                              high_water_mark=1, last_change_id=2)
+    assert merged.ids.tolist() == [1, 2, 3]
+    assert (merged.high_water_mark, merged.last_change_id) == (3, 4)
@@ -0,0 +1,65 @@
+"""Agrupación de altas (group commit) sobre una base SQLite temporal."""
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import connection_db
+from database_model import CardioHealth
+from db_operations import RecordWriteBatcher
+from feature_store import feature_store
+
+
+def _record(i: int) -> dict:
+    return {"age": 18000 + i, "gender": i % 2, "height": 170.0, "weight": 70.0 + i, "ap_hi": 120,
+            "ap_lo": 80, "cholesterol": 1, "gluc": 1, "smoke": 0, "alco": 0, "active": 1, "cardio": i % 2}
+
+
+async def _submit_all(monkeypatch, tmp_path, records, batcher=None):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'batcher.db'}")
+    monkeypatch.setattr(connection_db, "engine", engine)
+    monkeypatch.setattr(connection_db, "async_session",
+                        sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        batcher = batcher or RecordWriteBatcher(enabled=True, max_size=len(records), window_seconds=1)
+        results = await asyncio.gather(*[batcher.submit(record) for record in records], return_exceptions=True)
+        async with connection_db.get_session() as session:
+            stored = (await session.execute(select(CardioHealth.id, CardioHealth.weight).order_by(CardioHealth.id))).all()
+        return results, stored
+    finally:
+        await engine.dispose()
+
+
+def test_ids_follow_submission_order(monkeypatch, tmp_path):
+    records = [_record(i) for i in range(20)]
+    results, stored = asyncio.run(_submit_all(monkeypatch, tmp_path, records))
+    assert [result.weight for result in results] == [record["weight"] for record in records]
+    # Cada llamada recibe el id de su propia fila
+    assert [(result.id, result.weight) for result in results] == [tuple(row) for row in stored]
+
+
+def test_failing_row_does_not_fail_the_batch(monkeypatch, tmp_path):
+    records = [_record(i) for i in range(5)]
+    # Fila sin colesterol: hace fallar el INSERT de todo el lote
+    records[3] = {**_record(3), "cholesterol": None}
+    results, stored = asyncio.run(_submit_all(monkeypatch, tmp_path, records))
+    failed = [i for i, result in enumerate(results) if isinstance(result, Exception)]
+    assert failed == [3]
+    assert [result.weight for i, result in enumerate(results) if i != 3] == [row.weight for row in stored]
+
+
+def test_cache_failure_after_commit_does_not_reinsert(monkeypatch, tmp_path):
+    def broken_upsert(ids, values):
+        raise RuntimeError("almacén no disponible")
+
+    monkeypatch.setattr(feature_store, "loaded", True)
+    monkeypatch.setattr(feature_store, "upsert_rows", broken_upsert)
+    records = [_record(i) for i in range(10)]
+    results, stored = asyncio.run(_submit_all(monkeypatch, tmp_path, records))
+    assert not any(isinstance(result, Exception) for result in results)
+    assert len(stored) == len(records)
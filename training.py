@@ -0,0 +1,250 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+from recommendations import RecommendationSystem, recommendation_system
+
+# Procesos dedicados al ajuste del bosque (configurable por entorno)
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", "1"))
+
+# Política de refresco incremental del modelo
+MODEL_REFRESH_ROWS = int(os.getenv("MODEL_REFRESH_ROWS", "500"))
+MODEL_REFRESH_SECONDS = float(os.getenv("MODEL_REFRESH_SECONDS", "3600"))
+MODEL_REFRESH_CHECK_SECONDS = float(os.getenv("MODEL_REFRESH_CHECK_SECONDS", "30"))
+MODEL_REFRESH_MODE = os.getenv("MODEL_REFRESH_MODE", "retrain")  # "retrain" o "warm_start"
+MODEL_REFRESH_GROWTH_TREES = int(os.getenv("MODEL_REFRESH_GROWTH_TREES", "15"))
+MODEL_REFRESH_MAX_TREES = int(os.getenv("MODEL_REFRESH_MAX_TREES", "300"))
+
+
+class TrainingSnapshot:
+    """Copia en memoria de los datos de entrenamiento con sus marcas de cambio.
+
+    ``high_water_mark`` es el mayor ``CardioHealth.id`` incluido y ``last_change_id``
+    la última entrada del registro de ediciones ya aplicada; con ambas se lee solo
+    el delta de la tabla en cada refresco.
+    """
+
+    def __init__(self, ids: np.ndarray, features: np.ndarray, target: np.ndarray,
+                 high_water_mark: int, last_change_id: int):
+        self.ids = ids
+        self.features = features
+        self.target = target
+        self.high_water_mark = high_water_mark
+        self.last_change_id = last_change_id
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def apply_delta(self, ids: np.ndarray, features: np.ndarray, target: np.ndarray,
+                    high_water_mark: int, last_change_id: int) -> "TrainingSnapshot":
+        """Devuelve un snapshot nuevo con filas editadas reemplazadas y filas nuevas añadidas"""
+        positions = np.searchsorted(self.ids, ids)
+        found = np.zeros(len(ids), dtype=bool)
+        inside = positions < len(self.ids)
+        found[inside] = self.ids[positions[inside]] == ids[inside]
+
+        merged_features = self.features.copy()
+        merged_target = self.target.copy()
+        merged_features[positions[found]] = features[found]
+        merged_target[positions[found]] = target[found]
+
+        merged_ids = np.concatenate([self.ids, ids[~found]])
+        merged_features = np.concatenate([merged_features, features[~found]])
+        merged_target = np.concatenate([merged_target, target[~found]])
+
+        # Mantener el orden por id para que la huella del conjunto sea reproducible
+        order = np.argsort(merged_ids, kind="stable")
+        return TrainingSnapshot(
+            merged_ids[order], merged_features[order], merged_target[order],
+            max(self.high_water_mark, high_water_mark),
+            max(self.last_change_id, last_change_id)
+        )
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "ids": self.ids,
+            "features": self.features,
+            "target": self.target,
+            "marks": np.array([self.high_water_mark, self.last_change_id], dtype=np.int64)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "TrainingSnapshot":
+        high_water_mark, last_change_id = (int(v) for v in arrays["marks"])
+        return cls(arrays["ids"], arrays["features"], arrays["target"], high_water_mark, last_change_id)
+
+
+class RefreshPolicy:
+    """Decide cuándo refrescar el modelo: tras N filas nuevas/editadas o tras un tiempo máximo"""
+
+    def __init__(self, min_changes: int = MODEL_REFRESH_ROWS,
+                 max_age_seconds: float = MODEL_REFRESH_SECONDS,
+                 mode: str = MODEL_REFRESH_MODE,
+                 growth_trees: int = MODEL_REFRESH_GROWTH_TREES,
+                 max_trees: int = MODEL_REFRESH_MAX_TREES):
+        self.min_changes = min_changes
+        self.max_age_seconds = max_age_seconds
+        self.mode = mode
+        self.growth_trees = growth_trees
+        self.max_trees = max_trees
+
+    def should_refresh(self, pending: int, trained_at: Optional[float]) -> bool:
+        if pending <= 0:
+            return False
+        if pending >= self.min_changes:
+            return True
+        return trained_at is not None and time.time() - trained_at >= self.max_age_seconds
+
+    def use_warm_start(self, current_trees: int) -> bool:
+        """Crecer árboles solo mientras el bosque no supere el máximo; si no, reentrenar"""
+        return self.mode == "warm_start" and current_trees + self.growth_trees <= self.max_trees
+
+
+class TrainingScheduler:
+    """Programa entrenamientos en un pool de procesos con una sola ejecución en vuelo"""
+
+    def __init__(self, system: RecommendationSystem, max_workers: int = TRAINING_WORKERS,
+                 policy: Optional[RefreshPolicy] = None):
+        self.system = system
+        self.max_workers = max_workers
+        self.policy = policy or RefreshPolicy()
+        self.snapshot: Optional[TrainingSnapshot] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._state = "idle"
+        self._kind: Optional[str] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._pending = 0
+        self._runs = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: no heredar hilos ni conexiones abiertas del proceso web
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _start(self, kind: str, job: Callable[[], Awaitable[None]]) -> asyncio.Task:
+        """Lanza ``job`` o devuelve el entrenamiento que ya está en curso (single-flight).
+
+        La comprobación y la creación de la tarea ocurren sin ceder el event loop,
+        por lo que disparos concurrentes siempre comparten la misma tarea.
+        """
+        if self.is_running():
+            return self._task
+        self._state = "running"
+        self._kind = kind
+        self._started_at = time.time()
+        self._finished_at = None
+        self._last_error = None
+        self._runs += 1
+        self._task = asyncio.create_task(self._run(job))
+        return self._task
+
+    async def _run(self, job: Callable[[], Awaitable[None]]):
+        try:
+            await job()
+            self._state = "ready"
+        except BaseException as e:
+            self._state = "failed"
+            self._last_error = getattr(e, "detail", None) or str(e) or type(e).__name__
+            raise
+        finally:
+            self._finished_at = time.time()
+
+    async def _install_snapshot(self, snapshot: TrainingSnapshot):
+        self.snapshot = snapshot
+        self._pending = 0
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.system.store.save_snapshot, snapshot.to_arrays())
+
+    def trigger(self, load_snapshot: Callable[[], Awaitable[TrainingSnapshot]]) -> asyncio.Task:
+        """Entrenamiento completo a partir de una lectura de toda la tabla"""
+        async def job():
+            snapshot = await load_snapshot()
+            await self.system.train_model(snapshot.features, snapshot.target, executor=self._get_executor())
+            await self._install_snapshot(snapshot)
+
+        return self._start("full", job)
+
+    def trigger_refresh(self, load_delta: Callable[[TrainingSnapshot], Awaitable[TrainingSnapshot]],
+                        load_snapshot: Callable[[], Awaitable[TrainingSnapshot]]) -> asyncio.Task:
+        """Refresco incremental: solo se lee el delta y se combina con el snapshot en caché"""
+        if self.snapshot is None:
+            return self.trigger(load_snapshot)
+
+        async def job():
+            snapshot = await load_delta(self.snapshot)
+            if self.system.is_trained() and self.policy.use_warm_start(self.system.n_estimators):
+                await self.system.grow_model(snapshot.features, snapshot.target,
+                                             self.policy.growth_trees, executor=self._get_executor())
+            else:
+                await self.system.train_model(snapshot.features, snapshot.target, executor=self._get_executor())
+            await self._install_snapshot(snapshot)
+
+        return self._start("refresh", job)
+
+    def load_snapshot(self) -> bool:
+        """Recupera el snapshot persistido para no releer la tabla tras un reinicio"""
+        arrays = self.system.store.load_snapshot()
+        if arrays is None:
+            return False
+        self.snapshot = TrainingSnapshot.from_arrays(arrays)
+        return True
+
+    async def refresh_loop(self, count_pending: Callable[[TrainingSnapshot], Awaitable[int]],
+                           load_delta: Callable[[TrainingSnapshot], Awaitable[TrainingSnapshot]],
+                           load_snapshot: Callable[[], Awaitable[TrainingSnapshot]],
+                           interval: float = MODEL_REFRESH_CHECK_SECONDS):
+        """Comprueba periódicamente los cambios pendientes y aplica la política de refresco"""
+        while True:
+            await asyncio.sleep(interval)
+            if self.snapshot is None or self.is_running() or not self.system.is_trained():
+                continue
+            try:
+                self._pending = await count_pending(self.snapshot)
+                if self.policy.should_refresh(self._pending, self.system.trained_at):
+                    self.trigger_refresh(load_delta, load_snapshot)
+            except Exception as e:
+                print(f"Error comprobando refresco del modelo: {e}")
+
+    def status(self) -> Dict:
+        """Estado del último entrenamiento y del modelo servido"""
+        duration = None
+        if self._started_at is not None:
+            duration = round((self._finished_at or time.time()) - self._started_at, 3)
+        return {
+            "state": self._state,
+            "kind": self._kind,
+            "model_ready": self.system.is_trained(),
+            "model_version": self.system.model_version,
+            "model_params": self.system.params,
+            "top_factors": self.system.factor_ranking[:3],
+            "started_at": self._started_at,
+            "finished_at": self._finished_at,
+            "duration_seconds": duration,
+            "last_error": self._last_error,
+            "runs": self._runs,
+            "snapshot_rows": len(self.snapshot) if self.snapshot is not None else None,
+            "pending_changes": self._pending
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+training_scheduler = TrainingScheduler(recommendation_system)